@@ -0,0 +1,193 @@
+"""
+Latency of the first requests of a new function instance, with and without warm-up.
+
+Each trial runs in a new Python process, like a new instance: it imports
+`main` (the module load of an instance start), then serves two requests of one
+function. Modes:
+- cold: the request starts the instance (no min instances), it waits for the
+  module load and initializes the clients and caches itself
+- warm: the instance was started ahead (min instances) and ran the warm-up
+  hook of `utils/warm_up.py` before the request arrived
+
+The user latency is the module load plus the first request in cold mode and
+the first request in warm mode. The OpenAI and Pinecone APIs are the local
+stand-ins of the pipeline benchmark and Firestore is in memory (set
+FIRESTORE_EMULATOR_HOST to use the emulator), so client initialization costs
+of the real services are not included.
+
+Usage (from backend/functions):
+    python -m benchmarks.cold_start_benchmark [--functions start_process,get_transcription,information_extractor_handler,diagnosis_generation_handler] [--trials 3]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from dataclasses import fields
+from datetime import datetime, timezone
+from statistics import median
+from types import SimpleNamespace
+from typing import Dict, List
+
+FUNCTIONS = ["start_process", "get_transcription", "information_extractor_handler", "diagnosis_generation_handler"]
+MODES = ["cold", "warm"]
+RESULT_PREFIX = "RESULT "
+
+
+def run_child(function_name: str, mode: str, chunks_path: str) -> Dict[str, float]:
+    """Start an instance in this process and time its module load, warm-up and first two requests."""
+    from benchmarks.fakes.services import EXTRACTION_RESPONSE, FakeServices, ServiceLatencies
+    from benchmarks.pipeline_benchmark import configure_environment, install_firestore, load_text_fixtures
+
+    # constant latencies, so the difference between the first and the second request is the initialization
+    latencies = ServiceLatencies()
+    for latency in fields(latencies):
+        getattr(latencies, latency.name).sigma = 0.0
+    services = FakeServices(latencies=latencies, transcription_text=load_text_fixtures()[0]).start()
+    with open(chunks_path, "r", encoding="utf-8") as f:
+        services.knowledge_chunks = json.load(f)
+    configure_environment(services.base_url, 0)
+    # warm-up is run in the foreground below, to time it apart from the requests
+    os.environ["FUNCTIONS_WARM_UP"] = "false"
+
+    started_at = time.perf_counter()
+    import main
+    timings = {"import_sec": time.perf_counter() - started_at, "warm_up_sec": 0.0}
+
+    from firebase_functions import https_fn
+    from werkzeug.test import EnvironBuilder
+    from benchmarks.fakes.firestore import FakeDocumentReference
+    from models.clinical_record import ClassifiedSymptoms, ClinicalRecord
+    from models.transcription import Transcription, TranscriptionStatus
+    from utils.warm_up import warm_up
+
+    db = install_firestore(SimpleNamespace(on_create=lambda *args: None))
+    if mode == "warm":
+        started_at = time.perf_counter()
+        warm_up(function_name)
+        timings["warm_up_sec"] = time.perf_counter() - started_at
+
+    text = load_text_fixtures()[0]
+
+    def event(collection: str, session_id: str) -> SimpleNamespace:
+        snapshot = FakeDocumentReference(db, collection, session_id).get()
+        return SimpleNamespace(id=str(uuid.uuid4()), params={"session_id": session_id}, data=snapshot, time=datetime.now(timezone.utc))
+
+    def seed_transcription(session_id: str) -> None:
+        transcription = Transcription(session_id=session_id, text=text, status=TranscriptionStatus.TRANSCRIPTION_FINISHED)
+        db.collection("transcriptions").document(session_id).set(transcription.model_dump())
+
+    def seed_clinical_record(session_id: str) -> None:
+        seed_transcription(session_id)
+        symptoms = [
+            ClassifiedSymptoms(**symptom, severity="moderate", confidence_score=0.5)
+            for symptom in EXTRACTION_RESPONSE["symptoms"]
+        ]
+        record = ClinicalRecord(**EXTRACTION_RESPONSE, session_id=session_id, classified_symptoms=symptoms)
+        db.collection("clinical_record").document(session_id).set(record.model_dump())
+
+    def request() -> None:
+        session_id = str(uuid.uuid4())
+        if function_name == "start_process":
+            main.start_process(EnvironBuilder(method="POST", json={"transcription_text": text}).get_request(cls=https_fn.Request))
+        elif function_name == "get_transcription":
+            seed_transcription(session_id)
+            main.get_transcription(EnvironBuilder(method="GET", query_string={"session_id": session_id}).get_request(cls=https_fn.Request))
+        elif function_name == "information_extractor_handler":
+            seed_transcription(session_id)
+            main.information_extractor_handler.__wrapped__(event("transcriptions", session_id))
+        elif function_name == "diagnosis_generation_handler":
+            seed_clinical_record(session_id)
+            main.diagnosis_generation_handler.__wrapped__(event("clinical_record", session_id))
+        else:
+            raise ValueError(f"unknown function: {function_name}")
+
+    for name in ["first_request_sec", "second_request_sec"]:
+        started_at = time.perf_counter()
+        request()
+        timings[name] = time.perf_counter() - started_at
+
+    timings["user_latency_sec"] = timings["first_request_sec"] + (timings["import_sec"] if mode == "cold" else 0.0)
+    services.stop()
+    return timings
+
+
+def write_knowledge_chunks() -> str:
+    """Chunks served by the fake Pinecone, computed once instead of in every instance."""
+    from benchmarks.fakes.services import FakeServices
+    from benchmarks.pipeline_benchmark import configure_environment
+
+    configure_environment(FakeServices().base_url, 0)
+    from repositories.medical_knowledge_base_repository import MedicalKnowledgeRepository
+
+    chunks = MedicalKnowledgeRepository.split_documents(MedicalKnowledgeRepository.read_local_documents())
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False, encoding="utf-8") as f:
+        json.dump([
+            {"id": f"chunk-{index}", "metadata": {**chunk.metadata, "text": chunk.page_content}}
+            for index, chunk in enumerate(chunks)
+        ], f)
+    return f.name
+
+
+def run_trial(function_name: str, mode: str, chunks_path: str) -> Dict[str, float]:
+    command = [sys.executable, "-m", "benchmarks.cold_start_benchmark", "--child", function_name, "--mode", mode, "--chunks-path", chunks_path]
+    completed = subprocess.run(command, capture_output=True, text=True, check=True)
+    result = next(line for line in completed.stdout.splitlines() if line.startswith(RESULT_PREFIX))
+    return json.loads(result[len(RESULT_PREFIX):])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--functions", default=",".join(FUNCTIONS), help="comma separated functions to start")
+    parser.add_argument("--trials", type=int, default=3, help="instances started per function and mode")
+    parser.add_argument("--json", dest="json_path", default=None, help="write the report as JSON to this path")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--mode", default="cold", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--chunks-path", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(RESULT_PREFIX + json.dumps(run_child(args.child, args.mode, args.chunks_path)), flush=True)
+        return
+
+    chunks_path = write_knowledge_chunks()
+    report: Dict[str, Dict[str, Dict[str, float]]] = {}
+    try:
+        for function_name in args.functions.split(","):
+            for mode in MODES:
+                trials: List[Dict[str, float]] = []
+                for _ in range(args.trials):
+                    try:
+                        trials.append(run_trial(function_name, mode, chunks_path))
+                    except subprocess.CalledProcessError as e:
+                        print(f"{function_name} ({mode}) failed:\n{e.stderr[-2000:]}", file=sys.stderr)
+                if trials:
+                    report.setdefault(function_name, {})[mode] = {name: median(trial[name] for trial in trials) for name in trials[0]}
+    finally:
+        os.remove(chunks_path)
+
+    print(f"median of {args.trials} instances per function and mode\n")
+    header = f"{'function':<32}{'mode':<6}" + "".join(
+        f"{name:>14}" for name in ["module load", "warm-up", "1st request", "2nd request", "user latency"]
+    )
+    print(header)
+    print("-" * len(header))
+    for function_name, modes in report.items():
+        for mode, result in modes.items():
+            print(
+                f"{function_name:<32}{mode:<6}" + "".join(
+                    f"{result[name] * 1000:>12.0f}ms"
+                    for name in ["import_sec", "warm_up_sec", "first_request_sec", "second_request_sec", "user_latency_sec"]
+                )
+            )
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Recall, size and latency of the knowledge base vector index per embedding size and quantization.
+
+Embeds the knowledge base chunks and the hand labeled symptoms of
+`fixtures/symptom_severity.json` (used as queries) once with the full 3072
+dimensions of text-embedding-3-large. Shorter embeddings are derived by
+truncating and renormalizing, which is what the `dimensions` parameter of the
+model does. Each index variant reports its recall@k against the exact float
+3072-d ranking, the bytes scanned per search and the search latency. Needs
+OPENAI_API_KEY and the Pinecone variables, or `--fake` to embed with the local
+stand-in of the OpenAI API (random vectors: the recall then measures how much
+of the ranking each variant keeps, not the retrieval quality).
+
+Usage (from backend/functions):
+    python -m benchmarks.embedding_index_benchmark [--dimensions 256,512,1024,3072] [--quantizations float32,int8,binary] [--top-k 10] [--fake]
+"""
+import argparse
+import json
+import os
+import time
+from typing import Dict, List
+import numpy as np
+from benchmarks.pipeline_benchmark import summarize
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "symptom_severity.json")
+FULL_DIMENSIONS = 3072
+
+
+def load_queries() -> List[str]:
+    with open(FIXTURE_PATH, "r", encoding="utf-8") as f:
+        return [label["text"] for label in json.load(f)]
+
+
+def recall_at_k(results: List[List[int]], reference: List[List[int]]) -> float:
+    """Share of the reference top-k found in the top-k of the results, averaged over the queries."""
+    return sum(len(set(found) & set(expected)) / len(expected) for found, expected in zip(results, reference)) / len(reference)
+
+
+def run_variant(index, query_vectors: np.ndarray, top_k: int, rounds: int) -> Dict:
+    doc_ids = {id(doc): doc_id for doc_id, doc in enumerate(index.documents)}
+    search_times: List[float] = []
+    results: List[List[int]] = []
+    for round_index in range(rounds):
+        for query_vector in query_vectors:
+            started_at = time.perf_counter()
+            matches = index.search(query_vector, top_k)
+            search_times.append(time.perf_counter() - started_at)
+            if round_index == 0:
+                results.append([doc_ids[id(doc)] for doc, _ in matches])
+    return {"results": results, "search_time": summarize(search_times), "code_bytes": index.code_bytes}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dimensions", default="256,512,1024,1536,3072", help="comma separated embedding sizes")
+    parser.add_argument("--quantizations", default="float32,int8,binary", help="comma separated index quantizations")
+    parser.add_argument("--top-k", type=int, default=10, help="k of recall@k")
+    parser.add_argument("--rerank-factor", type=int, default=4, help="candidates re-ranked with float vectors, times k")
+    parser.add_argument("--rounds", type=int, default=20, help="passes over the queries to measure latency")
+    parser.add_argument("--fake", action="store_true", help="embed with the local stand-in of the OpenAI API")
+    parser.add_argument("--json", dest="json_path", default=None, help="write the report as JSON to this path")
+    args = parser.parse_args()
+
+    if args.fake:
+        from benchmarks.fakes.services import FakeServices
+        from benchmarks.pipeline_benchmark import configure_environment
+        configure_environment(FakeServices().start().base_url, 0)
+
+    # imported after the environment is configured
+    from langchain_openai import OpenAIEmbeddings
+    from repositories.medical_knowledge_base_repository import MedicalKnowledgeRepository
+    from repositories.vector_index import QuantizedVectorIndex
+
+    chunks = MedicalKnowledgeRepository.split_documents(MedicalKnowledgeRepository.read_local_documents())
+    queries = load_queries()
+    embeddings = OpenAIEmbeddings(model="text-embedding-3-large", dimensions=FULL_DIMENSIONS)
+    chunk_vectors = np.array(embeddings.embed_documents([chunk.page_content for chunk in chunks]), dtype=np.float32)
+    query_vectors = np.array(embeddings.embed_documents(queries), dtype=np.float32)
+
+    baseline_index = QuantizedVectorIndex(chunks, chunk_vectors, "float32")
+    baseline = run_variant(baseline_index, query_vectors, args.top_k, 1)["results"]
+
+    report: Dict[str, Dict] = {}
+    for dimensions in (int(value) for value in args.dimensions.split(",")):
+        for quantization in args.quantizations.split(","):
+            index = QuantizedVectorIndex(chunks, chunk_vectors, quantization, args.rerank_factor, dimensions)
+            result = run_variant(index, query_vectors, args.top_k, args.rounds)
+            result["recall"] = recall_at_k(result.pop("results"), baseline)
+            result["bytes_per_vector"] = result["code_bytes"] / len(chunks)
+            report[f"{dimensions}/{quantization}"] = result
+
+    print(f"{len(chunks)} chunks, {len(queries)} queries, recall@{args.top_k} against float32 {FULL_DIMENSIONS}-d\n")
+    header = f"{'dims/quantization':<20}{'bytes/vector':>14}{'recall@' + str(args.top_k):>11}" + "".join(
+        f"{name:>12}" for name in ["search p50", "search p95", "search p99"]
+    )
+    print(header)
+    print("-" * len(header))
+    for variant, result in report.items():
+        search = result["search_time"]
+        print(
+            f"{variant:<20}{result['bytes_per_vector']:>14.0f}{result['recall']:>11.2%}"
+            f"{search['p50'] * 1000:>10.3f}ms{search['p95'] * 1000:>10.3f}ms{search['p99'] * 1000:>10.3f}ms"
+        )
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+In-memory stand-in for the subset of the Firestore client used by the repositories.
+
+Document creations are reported to an `on_create` callback so the benchmark can
+dispatch the `on_document_created` triggers the same way Firestore would.
+"""
+import copy
+import operator
+import threading
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+from google.api_core.exceptions import AlreadyExists, NotFound
+from google.cloud.firestore_v1 import transforms
+
+OnCreate = Callable[[str, str, dict], None]
+
+OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "in": lambda value, options: value in options,
+    "array_contains": lambda value, item: item in (value or []),
+}
+
+
+def resolve_transforms(data: Any, current: Any = None) -> Any:
+    """Replace server side sentinels (SERVER_TIMESTAMP, Increment, ArrayUnion) by their values."""
+    if data is transforms.SERVER_TIMESTAMP:
+        return datetime.now(timezone.utc)
+    if isinstance(data, transforms.Increment):
+        return (current or 0) + data.value
+    if isinstance(data, transforms.ArrayUnion):
+        result = list(current or [])
+        result.extend(value for value in data.values if value not in result)
+        return result
+    if isinstance(data, dict):
+        current = current if isinstance(current, dict) else {}
+        return {key: resolve_transforms(value, current.get(key)) for key, value in data.items()}
+    return copy.deepcopy(data)
+
+
+class FakeDocumentSnapshot:
+    def __init__(self, reference: "FakeDocumentReference", data: Optional[dict]) -> None:
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[dict]:
+        return copy.deepcopy(self._data)
+
+    def get(self, field_path: str) -> Any:
+        value: Any = self._data
+        for part in field_path.split("."):
+            value = (value or {}).get(part)
+        return copy.deepcopy(value)
+
+
+class FakeDocumentReference:
+    def __init__(self, db: "InMemoryFirestore", collection: str, document_id: str) -> None:
+        self._db = db
+        self.collection_name = collection
+        self.id = document_id
+        self.path = f"{collection}/{document_id}"
+
+    def get(self, field_paths: Optional[List[str]] = None, transaction: Any = None) -> FakeDocumentSnapshot:
+        with self._db.lock:
+            self._db.reads += 1
+            data = self._db.documents[self.collection_name].get(self.id)
+            if data is not None and field_paths:
+                data = {key: value for key, value in data.items() if key in field_paths}
+            return FakeDocumentSnapshot(self, copy.deepcopy(data))
+
+    def create(self, document_data: dict) -> None:
+        with self._db.lock:
+            if self.id in self._db.documents[self.collection_name]:
+                raise AlreadyExists(f"Document already exists: {self.path}")
+            self._write(document_data)
+        self._db.notify_create(self.collection_name, self.id)
+
+    def set(self, document_data: dict, merge: bool = False) -> None:
+        with self._db.lock:
+            existing = self._db.documents[self.collection_name].get(self.id)
+            if merge and existing is not None:
+                self._update(document_data)
+                return
+            self._write(document_data)
+        if existing is None:
+            self._db.notify_create(self.collection_name, self.id)
+
+    def update(self, field_updates: dict) -> None:
+        with self._db.lock:
+            if self.id not in self._db.documents[self.collection_name]:
+                raise NotFound(f"No document to update: {self.path}")
+            self._update(field_updates)
+
+    def delete(self) -> None:
+        with self._db.lock:
+            self._db.writes += 1
+            self._db.documents[self.collection_name].pop(self.id, None)
+
+    def _write(self, document_data: dict) -> None:
+        self._db.writes += 1
+        self._db.documents[self.collection_name][self.id] = resolve_transforms(document_data)
+
+    def _update(self, field_updates: dict) -> None:
+        self._db.writes += 1
+        document = self._db.documents[self.collection_name][self.id]
+        for field_path, value in field_updates.items():
+            *parents, leaf = field_path.split(".")
+            target = document
+            for part in parents:
+                target = target.setdefault(part, {})
+            target[leaf] = resolve_transforms(value, target.get(leaf))
+
+
+class FakeQuery:
+    def __init__(self, db: "InMemoryFirestore", collection: str) -> None:
+        self._db = db
+        self._collection = collection
+        self._filters: List[tuple] = []
+        self._fields: Optional[List[str]] = None
+        self._order_by: List[tuple] = []
+        self._limit: Optional[int] = None
+
+    def _copy(self) -> "FakeQuery":
+        query = FakeQuery(self._db, self._collection)
+        query._filters = list(self._filters)
+        query._fields = self._fields
+        query._order_by = list(self._order_by)
+        query._limit = self._limit
+        return query
+
+    def where(self, field_path: Optional[str] = None, op_string: Optional[str] = None, value: Any = None, *, filter: Any = None) -> "FakeQuery":
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        query = self._copy()
+        query._filters.append((field_path, OPERATORS[op_string], value))
+        return query
+
+    def select(self, field_paths: List[str]) -> "FakeQuery":
+        query = self._copy()
+        query._fields = list(field_paths)
+        return query
+
+    def order_by(self, field_path: str, direction: str = "ASCENDING") -> "FakeQuery":
+        query = self._copy()
+        query._order_by.append((field_path, direction == "DESCENDING"))
+        return query
+
+    def limit(self, count: int) -> "FakeQuery":
+        query = self._copy()
+        query._limit = count
+        return query
+
+    def stream(self, transaction: Any = None):
+        with self._db.lock:
+            matches = []
+            for document_id, data in self._db.documents[self._collection].items():
+                if all(field in data and op(data[field], value) for field, op, value in self._filters):
+                    matches.append((document_id, data))
+            for field_path, descending in reversed(self._order_by):
+                matches.sort(key=lambda item: item[1].get(field_path), reverse=descending)
+            if self._limit is not None:
+                matches = matches[:self._limit]
+            self._db.reads += max(len(matches), 1)
+            snapshots = []
+            for document_id, data in matches:
+                if self._fields:
+                    data = {key: value for key, value in data.items() if key in self._fields}
+                reference = FakeDocumentReference(self._db, self._collection, document_id)
+                snapshots.append(FakeDocumentSnapshot(reference, copy.deepcopy(data)))
+        return iter(snapshots)
+
+    def get(self, transaction: Any = None) -> List[FakeDocumentSnapshot]:
+        return list(self.stream(transaction))
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, db: "InMemoryFirestore", collection: str) -> None:
+        super().__init__(db, collection)
+        self.id = collection
+
+    def document(self, document_id: Optional[str] = None) -> FakeDocumentReference:
+        return FakeDocumentReference(self._db, self._collection, document_id or uuid.uuid4().hex)
+
+
+class FakeWriteBatch:
+    """Buffer writes and apply them atomically on commit."""
+    def __init__(self, db: "InMemoryFirestore") -> None:
+        self._db = db
+        self._writes: List[Callable[[], None]] = []
+
+    def create(self, reference: FakeDocumentReference, document_data: dict) -> None:
+        self._writes.append(lambda: reference.create(document_data))
+
+    def set(self, reference: FakeDocumentReference, document_data: dict, merge: bool = False) -> None:
+        self._writes.append(lambda: reference.set(document_data, merge=merge))
+
+    def update(self, reference: FakeDocumentReference, field_updates: dict) -> None:
+        self._writes.append(lambda: reference.update(field_updates))
+
+    def delete(self, reference: FakeDocumentReference) -> None:
+        self._writes.append(reference.delete)
+
+    def commit(self) -> None:
+        with self._db.deferred_notifications():
+            with self._db.lock:
+                for write in self._writes:
+                    write()
+        self._writes = []
+
+
+class FakeTransaction(FakeWriteBatch):
+    """
+    Transaction usable with `firestore.transactional`.
+    The database lock is held from `_begin` to `_commit`/`_rollback`, which
+    serializes the transactions instead of retrying them on contention.
+    """
+    _read_only = False
+    _max_attempts = 1
+
+    def __init__(self, db: "InMemoryFirestore") -> None:
+        super().__init__(db)
+        self._id: Optional[bytes] = None
+
+    def _clean_up(self) -> None:
+        self._writes = []
+
+    def _begin(self, retry_id: Optional[bytes] = None) -> None:
+        self._db.lock.acquire()
+        self._id = uuid.uuid4().bytes
+
+    def _release(self) -> None:
+        if self._id is not None:
+            self._id = None
+            self._db.lock.release()
+
+    def _commit(self) -> None:
+        try:
+            with self._db.deferred_notifications():
+                for write in self._writes:
+                    write()
+                self._release()
+        finally:
+            self._release()
+            self._writes = []
+
+    def _rollback(self) -> None:
+        self._release()
+        self._writes = []
+
+
+class InMemoryFirestore:
+    """Thread safe in-memory Firestore client."""
+    def __init__(self, on_create: Optional[OnCreate] = None) -> None:
+        self.lock = threading.RLock()
+        self.documents: Dict[str, Dict[str, dict]] = defaultdict(dict)
+        self.on_create = on_create
+        self.reads = 0
+        self.writes = 0
+        self._local = threading.local()
+
+    def collection(self, collection_path: str) -> FakeCollectionReference:
+        return FakeCollectionReference(self, collection_path)
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
+
+    def transaction(self, **kwargs: Any) -> FakeTransaction:
+        return FakeTransaction(self)
+
+    def notify_create(self, collection: str, document_id: str) -> None:
+        pending = getattr(self._local, "pending", None)
+        if pending is not None:
+            pending.append((collection, document_id))
+            return
+        if self.on_create:
+            data = self.documents[collection].get(document_id)
+            self.on_create(collection, document_id, copy.deepcopy(data))
+
+    def deferred_notifications(self):
+        """Context manager delaying create notifications until the block completes (batches)."""
+        db = self
+
+        class _Deferred:
+            def __enter__(self):
+                db._local.pending = []
+
+            def __exit__(self, exc_type, exc, tb):
+                pending, db._local.pending = db._local.pending, None
+                if exc_type is None:
+                    for collection, document_id in pending:
+                        db.notify_create(collection, document_id)
+
+        return _Deferred()
@@ -0,0 +1,502 @@
+"""
+Local HTTP stand-in for the OpenAI, Pinecone and Cloud Storage APIs with configurable latency.
+
+The server answers the endpoints used by the pipeline:
+- POST /v1/chat/completions (regular and streaming, with a simulated prompt cache)
+- POST /v1/embeddings
+- POST /v1/audio/transcriptions
+- POST /query (with namespace and metadata filter), /vectors/upsert, /describe_index_stats (Pinecone data plane)
+- GET /audio/<file> serving audio fixtures, like a third-party host
+- POST /upload/storage/v1/b/<bucket>/o and GET /download/storage/v1/b/<bucket>/o/<name>
+  (Cloud Storage media upload and range reads, like the Storage emulator)
+
+A share of the audio responses (downloads and range reads) can be cut off
+mid-transfer to simulate flaky connections.
+"""
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qs, unquote, urlsplit
+from repositories.lexical_index import matches_filter
+
+BENCHMARKS_DIR = os.path.dirname(os.path.dirname(__file__))
+REPO_ROOT = os.path.abspath(os.path.join(BENCHMARKS_DIR, "..", "..", ".."))
+AUDIO_FILES = {"doctor_appointment.mp3": os.path.join(REPO_ROOT, "doctor_appointment.mp3")}
+
+EXTRACTION_RESPONSE = {
+    "summary": "John Smith, 45, reports acute chest pressure radiating to the left arm with shortness of breath and sweating. Smoker with high cholesterol.",
+    "patient_info": {"name": "John Smith", "age": 45, "id_number": "MS123456", "gender": "male"},
+    "symptoms": [
+        {"name": "chest pain", "duration": "2 hours", "intensity": "severe"},
+        {"name": "shortness of breath", "duration": "2 hours", "intensity": "moderate"},
+        {"name": "nausea", "duration": "2 hours", "intensity": "mild"},
+        {"name": "sweating", "duration": "2 hours", "intensity": "moderate"},
+    ],
+    "reason_for_visit": "Acute chest pain radiating to the left arm",
+}
+
+# low acuity case answered for the tension headache fixture, it takes the diagnosis fast path
+HEADACHE_EXTRACTION_RESPONSE = {
+    "summary": "Lucas Pereira, 29, reports a daily band-like headache for two weeks with neck stiffness, long working hours and little sleep.",
+    "patient_info": {"name": "Lucas Pereira", "age": 29, "nationality": "Brazilian"},
+    "symptoms": [
+        {"name": "headache", "duration": "two weeks", "intensity": "moderate"},
+        {"name": "neck stiffness", "duration": "two weeks", "intensity": "mild"},
+    ],
+    "reason_for_visit": "Daily headache for two weeks",
+}
+
+DIAGNOSIS_RESPONSE = {
+    "summary": "45 year old male smoker with acute chest pressure radiating to the left arm.",
+    "diagnosis_probabilities": [
+        {"name": "Acute Coronary Syndrome", "probability": 65, "reasoning": "Typical chest pressure with radiation and risk factors.", "symptoms": ["chest pain", "shortness of breath", "sweating"]},
+        {"name": "Myocardial Infarction", "probability": 25, "reasoning": "Cannot be excluded without ECG and troponin.", "symptoms": ["chest pain", "nausea"]},
+        {"name": "Pneumonia", "probability": 10, "reasoning": "Shortness of breath, no fever reported.", "symptoms": ["shortness of breath"]},
+    ],
+    "conclusion": "Acute Coronary Syndrome is the most likely diagnosis given the presentation and risk factors.",
+}
+
+TREATMENT_PLAN_RESPONSE = {
+    "treatments": [
+        {"name": "Aspirin", "type": "pharmacological", "details": "300 mg chewed", "reasoning": "Antiplatelet therapy for suspected acute coronary syndrome."},
+        {"name": "Nitroglycerin", "type": "pharmacological", "details": "0.4 mg sublingual", "reasoning": "Relieves ischemic chest pain."},
+        {"name": "Oxygen", "type": "non_pharmacological", "details": "Only if hypoxemic"},
+    ],
+    "red_flags": ["Chest pain with radiation to the left arm and jaw, treat as an emergency."],
+    "diagnostic_tests": ["Serial ECGs", "Troponin measurements"],
+    "recommendations": [{"text": "Urgent cardiology evaluation.", "reasoning": "High pretest probability of acute coronary syndrome."}],
+    "follow_up": "Continuous cardiac monitoring until myocardial infarction is excluded.",
+}
+
+REPORT_RESPONSE = """# Clinical Report
+
+## Summary
+- **Patient:** John Smith, 45, male
+- **Reason for visit:** acute *chest pain* radiating to the left arm
+
+## Diagnosis
+### Acute Coronary Syndrome (65%)
+- Typical chest pressure with radiation and cardiovascular risk factors.
+### Myocardial Infarction (25%)
+- Must be excluded with *ECG* and *troponin*.
+
+## Treatment Plan
+- Aspirin, oxygen if hypoxemic, nitroglycerin.
+- Urgent cardiology evaluation.
+
+## Recommendations
+- **Red flag:** chest pain with radiation, treat as emergency.
+- Serial ECGs and troponin measurements.
+"""
+
+
+@dataclass
+class LatencyModel:
+    """Log-normal latency distribution defined by its median and sigma."""
+    median_ms: float
+    sigma: float = 0.5
+
+    def sample(self) -> float:
+        if self.median_ms <= 0:
+            return 0.0
+        return random.lognormvariate(math.log(self.median_ms), self.sigma) / 1000
+
+    def wait(self, scale: float = 1.0) -> None:
+        time.sleep(self.sample() * scale)
+
+
+@dataclass
+class ServiceLatencies:
+    chat: LatencyModel = field(default_factory=lambda: LatencyModel(800))
+    # delay between streamed chunks
+    chat_token: LatencyModel = field(default_factory=lambda: LatencyModel(15, 0.3))
+    embeddings: LatencyModel = field(default_factory=lambda: LatencyModel(80))
+    transcription: LatencyModel = field(default_factory=lambda: LatencyModel(3000))
+    vector_query: LatencyModel = field(default_factory=lambda: LatencyModel(60))
+    audio_download: LatencyModel = field(default_factory=lambda: LatencyModel(200))
+    # range read of an uploaded file from a bucket in the region of the functions
+    storage_read: LatencyModel = field(default_factory=lambda: LatencyModel(20))
+
+
+class ServiceStats:
+    """Thread safe counters of the requests served by the fake services."""
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.requests: Dict[str, int] = {}
+        self.prompt_tokens = 0
+        self.cached_prompt_tokens = 0
+        self.completion_tokens = 0
+        self.embedding_tokens = 0
+
+    def record(
+        self, route: str, prompt_tokens: int = 0, completion_tokens: int = 0,
+        embedding_tokens: int = 0, cached_prompt_tokens: int = 0
+    ) -> None:
+        with self._lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+            self.prompt_tokens += prompt_tokens
+            self.cached_prompt_tokens += cached_prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.embedding_tokens += embedding_tokens
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens + self.embedding_tokens
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class PromptCache:
+    """
+    Simulates the OpenAI prompt cache: prompts of at least 1024 tokens are cached in
+    increments of 128 tokens, and a request reuses the longest prefix seen before.
+    Tokens are estimated as 4 characters.
+    """
+    MIN_TOKENS = 1024
+    INCREMENT_TOKENS = 128
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._prefixes: set = set()
+
+    def lookup(self, prompt: str) -> int:
+        """Return the cached tokens of the prompt and cache its prefixes."""
+        boundaries = range(self.MIN_TOKENS * 4, len(prompt) + 1, self.INCREMENT_TOKENS * 4)
+        digests = [hashlib.sha1(prompt[:end].encode("utf-8")).digest() for end in boundaries]
+        cached = 0
+        with self._lock:
+            for end, digest in zip(boundaries, digests):
+                if digest not in self._prefixes:
+                    break
+                cached = end // 4
+            self._prefixes.update(digests)
+        return cached
+
+
+def fake_embedding(value: str, dimensions: int) -> List[float]:
+    """Deterministic unit vector derived from the hash of the input."""
+    seed = int.from_bytes(hashlib.sha1(value.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    vector = [rng.gauss(0, 1) for _ in range(dimensions)]
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [round(v / norm, 6) for v in vector]
+
+
+class FakeServices:
+    """Run the fake OpenAI and Pinecone endpoints in a background thread."""
+    def __init__(
+        self,
+        latencies: Optional[ServiceLatencies] = None,
+        transcription_text: str = "",
+        knowledge_chunks: Optional[List[dict]] = None,
+        malformed_rate: float = 0.0,
+        audio_failure_rate: float = 0.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        self.latencies = latencies or ServiceLatencies()
+        # share of the JSON answers truncated, to measure the repair of structured outputs
+        self.malformed_rate = malformed_rate
+        # share of the audio responses cut off mid-transfer
+        self.audio_failure_rate = audio_failure_rate
+        # (bucket, name) -> uploaded object, and the callback of the finalize events
+        self.objects: Dict[tuple, dict] = {}
+        self.on_object_finalized: Optional[Callable[[dict], None]] = None
+        self.transcription_text = transcription_text
+        self.knowledge_chunks = knowledge_chunks or []
+        self.stats = ServiceStats()
+        self.prompt_cache = PromptCache()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeServices":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def chat_content(self, messages: List[dict]) -> str:
+        content = self._chat_answer(messages)
+        is_repair = "are missing or invalid" in str(messages[-1].get("content", ""))
+        if content.startswith("{") and not is_repair and random.random() < self.malformed_rate:
+            return content[:random.randint(len(content) // 4, len(content) - 1)]
+        return content
+
+    def _chat_answer(self, messages: List[dict]) -> str:
+        prompt = " ".join(str(message.get("content", "")) for message in messages)
+        if "partial summaries" in prompt:
+            return EXTRACTION_RESPONSE["summary"]
+        if "medical information extractor" in prompt:
+            # the transcription is in the last message with one, the few-shot examples come before it
+            transcription = [str(m.get("content", "")) for m in messages if "<transcription>" in str(m.get("content", ""))]
+            if transcription and "headache" in transcription[-1]:
+                return json.dumps(HEADACHE_EXTRACTION_RESPONSE)
+            return json.dumps(EXTRACTION_RESPONSE)
+        if "clinical diagnosis and clinical documentation" in prompt:
+            return json.dumps({**DIAGNOSIS_RESPONSE, "treatment_plan": TREATMENT_PLAN_RESPONSE})
+        if "expertise in generating treatment plan" in prompt:
+            return json.dumps(TREATMENT_PLAN_RESPONSE)
+        if "expertise in clinical diagnosis" in prompt:
+            return json.dumps(DIAGNOSIS_RESPONSE)
+        return REPORT_RESPONSE
+
+    def _handler_class(self):
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):  # silence per request logging
+                pass
+
+            def _read_body(self) -> bytes:
+                length = int(self.headers.get("Content-Length") or 0)
+                return self.rfile.read(length) if length else b""
+
+            def _send_json(self, payload: dict, status: int = 200) -> None:
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_audio(self, body: bytes, content_type: str, status: int = 200, headers: Optional[dict] = None) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                if random.random() < services.audio_failure_rate:
+                    # the connection drops after part of the body
+                    self.wfile.write(body[:len(body) // 2])
+                    self.close_connection = True
+                    return
+                self.wfile.write(body)
+
+            def do_GET(self):
+                name = self.path.rsplit("/", 1)[-1]
+                if self.path.startswith("/audio/") and name in AUDIO_FILES:
+                    services.latencies.audio_download.wait()
+                    with open(AUDIO_FILES[name], "rb") as f:
+                        body = f.read()
+                    services.stats.record("audio")
+                    self._send_audio(body, "audio/mpeg")
+                    return
+                if self.path.startswith("/download/storage/v1/b/"):
+                    self._storage_read()
+                    return
+                self._send_json({"error": "not found"}, status=404)
+
+            def _storage_read(self) -> None:
+                url = urlsplit(self.path)
+                bucket, _, name = url.path[len("/download/storage/v1/b/"):].partition("/o/")
+                stored = services.objects.get((bucket, unquote(name)))
+                if not stored:
+                    self._send_json({"error": {"code": 404, "message": "No such object"}}, status=404)
+                    return
+                services.stats.record("storage_read")
+                services.latencies.storage_read.wait()
+                data = stored["data"]
+                byte_range = self.headers.get("Range")
+                if not byte_range:
+                    self._send_audio(data, stored["contentType"])
+                    return
+                start, _, end = byte_range.split("=", 1)[1].partition("-")
+                start, end = int(start), min(int(end or len(data) - 1), len(data) - 1)
+                self._send_audio(
+                    data[start:end + 1], stored["contentType"], status=206,
+                    headers={"Content-Range": f"bytes {start}-{end}/{len(data)}"},
+                )
+
+            def _storage_upload(self, body: bytes) -> None:
+                url = urlsplit(self.path)
+                bucket = url.path[len("/upload/storage/v1/b/"):].split("/", 1)[0]
+                name = parse_qs(url.query)["name"][0]
+                stored = {
+                    "bucket": bucket,
+                    "name": name,
+                    "size": str(len(body)),
+                    "generation": str(time.time_ns()),
+                    "contentType": self.headers.get("Content-Type", "application/octet-stream"),
+                }
+                services.objects[(bucket, name)] = {**stored, "data": body}
+                services.stats.record("storage_upload")
+                self._send_json(stored)
+                if services.on_object_finalized:
+                    services.on_object_finalized(stored)
+
+            def do_POST(self):
+                body = self._read_body()
+                path = self.path.split("?", 1)[0]
+                if path.startswith("/upload/storage/v1/b/"):
+                    self._storage_upload(body)
+                    return
+                routes = {
+                    "/v1/chat/completions": self._chat_completions,
+                    "/v1/embeddings": self._embeddings,
+                    "/v1/audio/transcriptions": self._transcriptions,
+                    "/query": self._query,
+                    "/vectors/upsert": self._upsert,
+                    "/describe_index_stats": self._describe_index_stats,
+                }
+                handler = routes.get(path)
+                if not handler:
+                    self._send_json({"error": f"unknown route {path}"}, status=404)
+                    return
+                handler(body)
+
+            def _chat_completions(self, body: bytes) -> None:
+                request = json.loads(body)
+                content = services.chat_content(request.get("messages", []))
+                prompt = json.dumps(request.get("messages", []))
+                prompt_tokens = estimate_tokens(prompt)
+                cached_tokens = min(services.prompt_cache.lookup(prompt), prompt_tokens)
+                completion_tokens = estimate_tokens(content)
+                services.stats.record("chat", prompt_tokens, completion_tokens, cached_prompt_tokens=cached_tokens)
+                usage = {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                    "prompt_tokens_details": {"cached_tokens": cached_tokens},
+                }
+                completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+                # cached prefixes skip prefill, up to half of the time to first token here
+                services.latencies.chat.wait(1 - 0.5 * cached_tokens / prompt_tokens)
+
+                if not request.get("stream"):
+                    self._send_json({
+                        "id": completion_id,
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": request.get("model"),
+                        "choices": [{
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": "stop",
+                        }],
+                        "usage": usage,
+                    })
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+
+                def send_event(choices: list, event_usage: Optional[dict] = None) -> None:
+                    chunk = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": request.get("model"),
+                        "choices": choices,
+                    }
+                    if event_usage:
+                        chunk["usage"] = event_usage
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+
+                pieces = [content[i:i + 16] for i in range(0, len(content), 16)]
+                for index, piece in enumerate(pieces):
+                    delta = {"content": piece}
+                    if index == 0:
+                        delta["role"] = "assistant"
+                    send_event([{"index": 0, "delta": delta, "finish_reason": None}])
+                    services.latencies.chat_token.wait()
+                send_event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+                if (request.get("stream_options") or {}).get("include_usage"):
+                    send_event([], usage)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+            def _embeddings(self, body: bytes) -> None:
+                request = json.loads(body)
+                inputs = request.get("input")
+                if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+                    inputs = [inputs]
+                model = request.get("model", "")
+                dimensions = request.get("dimensions") or (3072 if model.endswith("large") else 1536)
+                tokens = sum(len(value) if isinstance(value, list) else estimate_tokens(value) for value in inputs)
+                services.stats.record("embeddings", embedding_tokens=tokens)
+                services.latencies.embeddings.wait()
+                self._send_json({
+                    "object": "list",
+                    "model": model,
+                    "data": [
+                        {"object": "embedding", "index": index, "embedding": fake_embedding(str(value), dimensions)}
+                        for index, value in enumerate(inputs)
+                    ],
+                    "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+                })
+
+            def _transcriptions(self, body: bytes) -> None:
+                services.stats.record("transcriptions")
+                services.latencies.transcription.wait()
+                self._send_json({
+                    "task": "transcribe",
+                    "language": "english",
+                    "duration": 312.4,
+                    "text": services.transcription_text,
+                    "segments": [],
+                })
+
+            def _query(self, body: bytes) -> None:
+                request = json.loads(body)
+                top_k = int(request.get("topK") or request.get("top_k") or 10)
+                services.stats.record("vector_query")
+                services.latencies.vector_query.wait()
+                seed = hashlib.sha1(json.dumps(request.get("vector", [])[:8]).encode("utf-8")).hexdigest()
+                namespace = request.get("namespace", "")
+                chunks = [
+                    chunk for chunk in services.knowledge_chunks
+                    if chunk.get("namespace", "") == namespace and matches_filter(chunk["metadata"], request.get("filter"))
+                ]
+                chunks = sorted(chunks, key=lambda c: hashlib.sha1((seed + c["id"]).encode()).hexdigest())
+                self._send_json({
+                    "matches": [
+                        {"id": chunk["id"], "score": round(0.9 - rank * 0.02, 4), "values": [], "metadata": chunk["metadata"]}
+                        for rank, chunk in enumerate(chunks[:top_k])
+                    ],
+                    "namespace": namespace,
+                    "usage": {"readUnits": 1},
+                })
+
+            def _upsert(self, body: bytes) -> None:
+                request = json.loads(body)
+                services.stats.record("vector_upsert")
+                self._send_json({"upsertedCount": len(request.get("vectors", []))})
+
+            def _describe_index_stats(self, body: bytes) -> None:
+                self._send_json({
+                    "dimension": 3072,
+                    "indexFullness": 0.0,
+                    "totalVectorCount": len(services.knowledge_chunks),
+                    "namespaces": {
+                        namespace: {"vectorCount": count}
+                        for namespace, count in Counter(chunk.get("namespace", "") for chunk in services.knowledge_chunks).items()
+                    },
+                })
+
+        return Handler
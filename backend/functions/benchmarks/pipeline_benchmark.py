@@ -0,0 +1,490 @@
+"""
+End-to-end benchmark of the start_process -> diagnosis pipeline.
+
+Runs the real triggers and services against an in-memory Firestore (or the
+Firestore emulator when FIRESTORE_EMULATOR_HOST is set) and local stand-ins of
+the OpenAI, Pinecone and Cloud Storage APIs with configurable latency distributions.
+
+Usage (from backend/functions):
+    python -m benchmarks.pipeline_benchmark --sessions 50 --concurrency 10
+    python -m benchmarks.pipeline_benchmark --audio-ratio 0.5 --llm-latency-ms 1200 --json results.json
+    python -m benchmarks.pipeline_benchmark --redelivery-rate 0.2
+    python -m benchmarks.pipeline_benchmark --audio-ratio 1 --upload-ratio 0.5 --audio-failure-rate 0.1
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from glob import glob
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+from benchmarks.fakes.services import AUDIO_FILES, FakeServices, LatencyModel, ServiceLatencies
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+# Firestore collection -> stage triggered by the creation of a document
+STAGES = {
+    "queue": "transcription",
+    "transcriptions": "information_extraction",
+    "clinical_record": "diagnosis",
+}
+# stage triggered by the upload of an audio file to the bucket
+UPLOAD_STAGE = "upload"
+UPLOAD_BUCKET = "benchmark"
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Percentile with linear interpolation between closest ranks."""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * pct / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+    }
+
+
+@dataclass
+class SessionTiming:
+    submitted_at: float
+    finished_at: Optional[float] = None
+    failed: bool = False
+
+
+@dataclass
+class BenchmarkMetrics:
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    sessions: Dict[str, SessionTiming] = field(default_factory=dict)
+    queue_wait: Dict[str, List[float]] = field(default_factory=lambda: defaultdict(list))
+    run_time: Dict[str, List[float]] = field(default_factory=lambda: defaultdict(list))
+    errors: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    redelivered_run_time: List[float] = field(default_factory=list)
+    deduplicated: int = 0
+
+    def record_stage(self, stage: str, queue_wait: float, run_time: float, failed: bool) -> None:
+        with self.lock:
+            self.queue_wait[stage].append(queue_wait)
+            self.run_time[stage].append(run_time)
+            if failed:
+                self.errors[stage] += 1
+
+
+class TriggerDispatcher:
+    """
+    Dispatch `on_document_created` triggers, one bounded worker pool per stage
+    to mirror the max_instances limit of the deployed functions.
+    A share of the events is delivered a second time once the first delivery
+    ends, like Firestore does when an execution is not acknowledged.
+    """
+    def __init__(self, handlers: Dict[str, Callable], metrics: BenchmarkMetrics, workers: int, redelivery_rate: float = 0.0) -> None:
+        self.handlers = handlers
+        self.metrics = metrics
+        self.redelivery_rate = redelivery_rate
+        self.executors = {stage: ThreadPoolExecutor(max_workers=workers) for stage in handlers}
+        self._inflight = 0
+        self._idle = threading.Condition()
+
+    def on_create(self, collection: str, document_id: str, snapshot: Any) -> None:
+        stage = STAGES.get(collection)
+        if not stage:
+            return
+        self._submit(stage, document_id, snapshot)
+
+    def on_object_finalized(self, stored: dict) -> None:
+        """Dispatch `on_object_finalized` for an upload, `stored` is the object resource of the Storage API."""
+        # the fields of StorageObjectData read by the handler, sizes are strings like in the events
+        data = SimpleNamespace(
+            bucket=stored["bucket"],
+            name=stored["name"],
+            size=stored["size"],
+            generation=stored["generation"],
+            content_type=stored["contentType"],
+        )
+        self._submit(UPLOAD_STAGE, stored["name"].split("/")[1], data)
+
+    def _submit(self, stage: str, session_id: str, data: Any) -> None:
+        created_at = time.perf_counter()
+        event = SimpleNamespace(
+            id=str(uuid.uuid4()),
+            params={"session_id": session_id},
+            data=data,
+            time=datetime.now(timezone.utc),
+        )
+        with self._idle:
+            self._inflight += 1
+        self.executors[stage].submit(self._run, stage, event, created_at, False)
+
+    def _run(self, stage: str, event: Any, created_at: float, redelivered: bool) -> None:
+        session_id = event.params["session_id"]
+        started_at = time.perf_counter()
+        failed = False
+        try:
+            # call the undecorated handler, the decorator only adapts the CloudEvent payload
+            self.handlers[stage].__wrapped__(event)
+        except Exception as e:
+            failed = True
+            print(f"[{stage}] session {session_id} failed: {e}", file=sys.stderr)
+        finally:
+            finished_at = time.perf_counter()
+            if redelivered:
+                with self.metrics.lock:
+                    self.metrics.redelivered_run_time.append(finished_at - started_at)
+            else:
+                self.metrics.record_stage(stage, started_at - created_at, finished_at - started_at, failed)
+            if stage == "diagnosis" and not redelivered:
+                with self.metrics.lock:
+                    timing = self.metrics.sessions.get(session_id)
+                    if timing:
+                        timing.finished_at = finished_at
+                        timing.failed = failed
+            if not redelivered and random.random() < self.redelivery_rate:
+                with self._idle:
+                    self._inflight += 1
+                self.executors[stage].submit(self._run, stage, event, time.perf_counter(), True)
+            with self._idle:
+                self._inflight -= 1
+                self._idle.notify_all()
+
+    def wait_idle(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        with self._idle:
+            while self._inflight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def shutdown(self) -> None:
+        for executor in self.executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def load_text_fixtures() -> List[str]:
+    fixtures = []
+    for file_path in sorted(glob(os.path.join(FIXTURES_DIR, "*.txt"))):
+        with open(file_path, "r", encoding="utf-8") as f:
+            fixtures.append(f.read())
+    return fixtures
+
+
+def configure_environment(base_url: str, dedup_window_sec: float) -> None:
+    """Point the OpenAI and Pinecone clients at the fake services (must run before importing triggers)."""
+    # the fixtures are replayed several times, deduplication is off unless measured on purpose
+    os.environ["SESSION_DEDUP_WINDOW_SEC"] = str(dedup_window_sec)
+    os.environ["OPENAI_API_KEY"] = "benchmark"
+    os.environ["OPENAI_BASE_URL"] = f"{base_url}/v1"
+    os.environ["PINECONE_API_KEY"] = "benchmark"
+    os.environ["PINECONE_HOST"] = base_url
+    os.environ["PINECONE_INDEX_NAME"] = "benchmark"
+    os.environ["STORAGE_EMULATOR_HOST"] = base_url
+    os.environ["AUDIO_UPLOAD_BUCKET"] = UPLOAD_BUCKET
+
+
+def install_firestore(dispatcher: TriggerDispatcher):
+    """
+    Use the Firestore emulator when FIRESTORE_EMULATOR_HOST is set, an in-memory fake otherwise.
+    Returns the in-memory client, or None when running against the emulator.
+    """
+    import firebase_admin
+    from firebase_admin import firestore
+
+    if os.getenv("FIRESTORE_EMULATOR_HOST"):
+        if not firebase_admin._apps:
+            firebase_admin.initialize_app(options={"projectId": os.getenv("GCLOUD_PROJECT", "demo-benchmark")})
+        db = firestore.client()
+        for collection in STAGES:
+            initial = threading.Event()
+
+            def on_snapshot(_, changes, __, collection=collection, initial=initial):
+                # the first callback lists the documents already in the collection
+                if not initial.is_set():
+                    initial.set()
+                    return
+                for change in changes:
+                    if change.type.name == "ADDED":
+                        dispatcher.on_create(collection, change.document.id, change.document)
+
+            db.collection(collection).on_snapshot(on_snapshot)
+        return None
+
+    from benchmarks.fakes.firestore import InMemoryFirestore, FakeDocumentReference
+
+    def on_create(collection: str, document_id: str, _: dict) -> None:
+        reference = FakeDocumentReference(db, collection, document_id)
+        dispatcher.on_create(collection, document_id, reference.get())
+
+    db = InMemoryFirestore(on_create=on_create)
+    firestore.client = lambda *args, **kwargs: db
+    return db
+
+
+def install_storage() -> None:
+    """Serve the buckets from the fake services (STORAGE_EMULATOR_HOST), without credentials."""
+    from firebase_admin import storage
+    from google.auth.credentials import AnonymousCredentials
+    from google.cloud.storage import Client
+
+    client = Client(project="benchmark", credentials=AnonymousCredentials())
+    storage.bucket = lambda name=None, app=None: client.bucket(name or UPLOAD_BUCKET)
+
+
+def build_latencies(args: argparse.Namespace) -> ServiceLatencies:
+    sigma = args.latency_sigma
+    return ServiceLatencies(
+        chat=LatencyModel(args.llm_latency_ms, sigma),
+        chat_token=LatencyModel(args.llm_token_latency_ms, sigma),
+        embeddings=LatencyModel(args.embedding_latency_ms, sigma),
+        transcription=LatencyModel(args.whisper_latency_ms, sigma),
+        vector_query=LatencyModel(args.vector_latency_ms, sigma),
+        audio_download=LatencyModel(args.audio_latency_ms, sigma),
+        storage_read=LatencyModel(args.storage_latency_ms, sigma),
+    )
+
+
+def count_output_repairs(db: Any) -> int:
+    """LLM calls repairing structured outputs, from the stage metrics saved on the sessions."""
+    return sum(
+        stage_metrics.get("output_repairs", 0)
+        for document in db.documents["transcriptions"].values()
+        for stage_metrics in (document.get("metrics") or {}).values()
+    )
+
+
+def summarize_routes(db: Any) -> Dict[str, dict]:
+    """Per-route latency and token usage of the diagnosis stage, from the stage metrics saved on the sessions."""
+    routes: Dict[str, List[dict]] = defaultdict(list)
+    for document in db.documents["transcriptions"].values():
+        diagnosis_metrics = (document.get("metrics") or {}).get("diagnosis")
+        if diagnosis_metrics and diagnosis_metrics.get("route"):
+            routes[diagnosis_metrics["route"]].append(diagnosis_metrics)
+    return {
+        route: {
+            "run_time": summarize([m["wall_time_ms"] / 1000 for m in stage_metrics]),
+            "llm_calls": sum(m["llm_calls"] for m in stage_metrics) / len(stage_metrics),
+            "tokens": sum(m["total_tokens"] for m in stage_metrics) / len(stage_metrics),
+        }
+        for route, stage_metrics in sorted(routes.items())
+    }
+
+
+def print_report(report: dict) -> None:
+    print()
+    print(f"sessions: {report['completed']}/{report['sessions']} completed, {report['failed']} failed")
+    if report["deduplicated"]:
+        print(f"deduplicated submissions: {report['deduplicated']}")
+    print(f"wall time: {report['wall_time_sec']:.1f}s, throughput: {report['sessions_per_min']:.1f} sessions/min")
+    print(f"tokens/session: {report['tokens_per_session']:.0f}, requests: {report['service_requests']}")
+    if report["prompt_tokens"]:
+        print(f"cached prompt tokens: {report['cached_prompt_tokens'] / report['prompt_tokens']:.1%}")
+    if report.get("firestore_writes_per_session") is not None:
+        print(
+            f"firestore/session: {report['firestore_reads_per_session']:.1f} reads, "
+            f"{report['firestore_writes_per_session']:.1f} writes"
+        )
+    if report.get("output_repairs"):
+        print(f"structured output repairs: {report['output_repairs']}")
+    redelivered = report["redelivered"]
+    if redelivered["count"]:
+        print(f"redelivered events: {redelivered['count']}, run p50 {redelivered['p50']:.3f}s, p95 {redelivered['p95']:.3f}s")
+    print()
+    header = f"{'stage':<24}{'count':>7}{'errors':>8}" + "".join(
+        f"{name:>10}" for name in ["wait p50", "wait p95", "wait p99", "run p50", "run p95", "run p99"]
+    )
+    print(header)
+    print("-" * len(header))
+    for stage, values in report["stages"].items():
+        wait, run = values["queue_wait"], values["run_time"]
+        print(
+            f"{stage:<24}{run['count']:>7}{values['errors']:>8}"
+            f"{wait['p50']:>10.2f}{wait['p95']:>10.2f}{wait['p99']:>10.2f}"
+            f"{run['p50']:>10.2f}{run['p95']:>10.2f}{run['p99']:>10.2f}"
+        )
+    e2e = report["end_to_end"]
+    print(f"{'end_to_end':<24}{e2e['count']:>7}{'':>8}{'':>30}{e2e['p50']:>10.2f}{e2e['p95']:>10.2f}{e2e['p99']:>10.2f}")
+    print("(times in seconds)")
+    if report.get("diagnosis_routes"):
+        print()
+        header = f"{'diagnosis route':<24}{'count':>7}{'llm calls':>11}{'tokens':>9}" + "".join(
+            f"{name:>10}" for name in ["run p50", "run p95", "run p99"]
+        )
+        print(header)
+        print("-" * len(header))
+        for route, values in report["diagnosis_routes"].items():
+            run = values["run_time"]
+            print(
+                f"{route:<24}{run['count']:>7}{values['llm_calls']:>11.1f}{values['tokens']:>9.0f}"
+                f"{run['p50']:>10.2f}{run['p95']:>10.2f}{run['p99']:>10.2f}"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20, help="total sessions to replay")
+    parser.add_argument("--concurrency", type=int, default=5, help="concurrent clients submitting sessions")
+    parser.add_argument("--workers", type=int, default=10, help="max concurrent executions per triggered stage")
+    parser.add_argument("--audio-ratio", type=float, default=0.25, help="share of sessions submitted as audio")
+    parser.add_argument("--upload-ratio", type=float, default=0.0, help="share of the audio sessions uploaded to Cloud Storage instead of submitted by URL")
+    parser.add_argument("--audio-failure-rate", type=float, default=0.0, help="share of the audio downloads and range reads cut off mid-transfer")
+    parser.add_argument("--llm-latency-ms", type=float, default=800)
+    parser.add_argument("--llm-token-latency-ms", type=float, default=15)
+    parser.add_argument("--embedding-latency-ms", type=float, default=80)
+    parser.add_argument("--whisper-latency-ms", type=float, default=3000)
+    parser.add_argument("--vector-latency-ms", type=float, default=60)
+    parser.add_argument("--audio-latency-ms", type=float, default=200)
+    parser.add_argument("--storage-latency-ms", type=float, default=20)
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="sigma of the log-normal latency distributions")
+    parser.add_argument("--redelivery-rate", type=float, default=0.0, help="share of trigger events delivered twice")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="share of the LLM JSON answers truncated")
+    parser.add_argument("--dedup-window-sec", type=float, default=0, help="window of the session deduplication, 0 disables it")
+    parser.add_argument("--timeout", type=float, default=600, help="max seconds to wait for the sessions to finish")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", dest="json_path", default=None, help="write the report as JSON to this path")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    fixtures = load_text_fixtures()
+    services = FakeServices(
+        latencies=build_latencies(args), transcription_text=fixtures[0], malformed_rate=args.malformed_rate,
+        audio_failure_rate=args.audio_failure_rate,
+    ).start()
+    configure_environment(services.base_url, args.dedup_window_sec)
+
+    # imported after the environment points at the fake services
+    from firebase_functions import https_fn
+    from werkzeug.test import EnvironBuilder
+    from repositories.medical_knowledge_base_repository import NAMESPACE_BY_SPECIALTY, MedicalKnowledgeRepository
+    from triggers.audio_transcription import transcription_handler
+    from triggers.audio_upload import audio_upload_handler, create_audio_upload
+    from triggers.medical_information_extractor import information_extractor_handler
+    from triggers.diagnosis_generation import diagnosis_generation_handler
+    from triggers.start_process import start_process
+
+    chunks = MedicalKnowledgeRepository.split_documents(MedicalKnowledgeRepository.read_local_documents())
+    services.knowledge_chunks = [
+        {
+            "id": f"chunk-{index}",
+            "namespace": chunk.metadata["specialty"] if NAMESPACE_BY_SPECIALTY else "",
+            "metadata": {**chunk.metadata, "text": chunk.page_content},
+        }
+        for index, chunk in enumerate(chunks)
+    ]
+
+    metrics = BenchmarkMetrics()
+    dispatcher = TriggerDispatcher(
+        {
+            UPLOAD_STAGE: audio_upload_handler,
+            "transcription": transcription_handler,
+            "information_extraction": information_extractor_handler,
+            "diagnosis": diagnosis_generation_handler,
+        },
+        metrics,
+        args.workers,
+        args.redelivery_rate,
+    )
+    db = install_firestore(dispatcher)
+    install_storage()
+    services.on_object_finalized = dispatcher.on_object_finalized
+
+    audio_url = f"{services.base_url}/audio/doctor_appointment.mp3"
+    with open(AUDIO_FILES["doctor_appointment.mp3"], "rb") as f:
+        audio = f.read()
+
+    def upload_audio() -> https_fn.Response:
+        """Create the upload like the frontend, then upload the file to the returned URL."""
+        import requests
+
+        body = {"content_type": "audio/mpeg", "size_bytes": len(audio)}
+        response = create_audio_upload(EnvironBuilder(method="POST", json=body).get_request(cls=https_fn.Request))
+        if response.status_code == 200:
+            upload = json.loads(response.get_data())["upload"]
+            requests.request(upload["method"], upload["url"], headers=upload["headers"], data=audio).raise_for_status()
+        return response
+
+    def submit(index: int) -> None:
+        submitted_at = time.perf_counter()
+        audio_sessions = args.sessions * args.audio_ratio
+        if index < audio_sessions * args.upload_ratio:
+            response = upload_audio()
+        else:
+            if index < audio_sessions:
+                body = {"audio_url": audio_url}
+            else:
+                body = {"transcription_text": fixtures[index % len(fixtures)]}
+            response = start_process(EnvironBuilder(method="POST", json=body).get_request(cls=https_fn.Request))
+        if response.status_code != 200:
+            print(f"session submission failed: {response.get_data(as_text=True)}", file=sys.stderr)
+            return
+        session_id = json.loads(response.get_data())["session_id"]
+        with metrics.lock:
+            metrics.deduplicated += session_id in metrics.sessions
+            metrics.sessions.setdefault(session_id, SessionTiming(submitted_at))
+        metrics.record_stage("start_process", 0.0, time.perf_counter() - submitted_at, False)
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as clients:
+        list(clients.map(submit, range(args.sessions)))
+    if not dispatcher.wait_idle(args.timeout):
+        print("timed out waiting for sessions to finish", file=sys.stderr)
+    wall_time = time.perf_counter() - started_at
+    dispatcher.shutdown()
+    services.stop()
+
+    timings = list(metrics.sessions.values())
+    completed = [t for t in timings if t.finished_at and not t.failed]
+    report = {
+        "sessions": args.sessions,
+        "deduplicated": metrics.deduplicated,
+        "completed": len(completed),
+        "failed": len(timings) - len(completed),
+        "wall_time_sec": wall_time,
+        "sessions_per_min": len(completed) / wall_time * 60 if wall_time else 0.0,
+        "tokens_per_session": services.stats.total_tokens / max(len(timings), 1),
+        "prompt_tokens": services.stats.prompt_tokens,
+        "cached_prompt_tokens": services.stats.cached_prompt_tokens,
+        "completion_tokens": services.stats.completion_tokens,
+        "embedding_tokens": services.stats.embedding_tokens,
+        "service_requests": dict(services.stats.requests),
+        "firestore_reads_per_session": db.reads / max(len(timings), 1) if db else None,
+        "firestore_writes_per_session": db.writes / max(len(timings), 1) if db else None,
+        "redelivered": summarize(metrics.redelivered_run_time),
+        "diagnosis_routes": summarize_routes(db) if db else {},
+        "output_repairs": count_output_repairs(db) if db else None,
+        "end_to_end": summarize([t.finished_at - t.submitted_at for t in completed]),
+        "stages": {
+            stage: {
+                "queue_wait": summarize(metrics.queue_wait[stage]),
+                "run_time": summarize(metrics.run_time[stage]),
+                "errors": metrics.errors[stage],
+            }
+            for stage in ["start_process", *([UPLOAD_STAGE] if args.upload_ratio else []), *STAGES.values()]
+        },
+    }
+
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
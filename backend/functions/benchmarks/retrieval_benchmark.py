@@ -0,0 +1,177 @@
+"""
+Retrieval quality and latency of the medical knowledge base per search backend.
+
+Runs labeled symptom queries against each backend of MedicalKnowledgeRepository
+and reports, at the document level (the `disease_name` of the chunks, best
+ranked first), the recall@k of the expected diseases, the mean reciprocal rank
+of the first expected one and the per-query latency. The queries are the hand
+labeled ones of `fixtures/retrieval_queries.json`, written like the query of the
+diagnosis stage (reason for visit and symptom names), and queries generated
+from the symptom bullets of each document of `repositories/documents/`.
+
+Backends:
+- pinecone: vector search in Pinecone
+- local: vector search in the quantized in-memory index (KNOWLEDGE_BASE_QUANTIZATION)
+- lexical: BM25 over the local chunks
+- hybrid: BM25 and vector search (KNOWLEDGE_BASE_VECTOR_BACKEND) merged with reciprocal rank fusion
+- full_docs: retrieve_full_docs, the full documents of the best vector matches
+
+The first query of each backend builds its indexes and is timed apart as the
+warm-up. Needs OPENAI_API_KEY and the Pinecone variables, or `--fake` to use the
+local stand-ins of the OpenAI and Pinecone APIs (random embeddings: only the
+lexical results are meaningful then). Unavailable backends are skipped.
+
+Usage (from backend/functions):
+    python -m benchmarks.retrieval_benchmark [--backends pinecone,local,lexical,hybrid,full_docs] [--top-k 10] [--fake]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Callable, Dict, List
+from langchain.schema import Document
+from benchmarks.pipeline_benchmark import summarize
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "retrieval_queries.json")
+RECALL_KS = (1, 3, 5)
+
+
+def load_labeled_queries() -> List[dict]:
+    with open(FIXTURE_PATH, "r", encoding="utf-8") as f:
+        return [{**label, "source": "fixture"} for label in json.load(f)]
+
+
+def generate_queries(documents: List[Document], per_document: int, symptoms_per_query: int, seed: int) -> List[dict]:
+    """Queries made of symptoms named in the symptom sections of each document, expecting that document."""
+    from repositories.symptom_lexicon import extract_symptom_terms
+
+    rng = random.Random(seed)
+    queries = []
+    for document in sorted(documents, key=lambda doc: doc.metadata["disease_name"]):
+        symptoms = sorted(set(extract_symptom_terms(document).values()))
+        for _ in range(per_document if symptoms else 0):
+            sample = rng.sample(symptoms, min(symptoms_per_query, len(symptoms)))
+            queries.append({"query": " ".join(sample), "diseases": [document.metadata["disease_name"]], "source": "generated"})
+    return queries
+
+
+def rank_diseases(docs: List[Document]) -> List[str]:
+    """Diseases of the retrieved documents, in the order of their best ranked document."""
+    return list(dict.fromkeys(doc.metadata["disease_name"] for doc in docs))
+
+
+def score_query(ranked: List[str], expected: List[str]) -> Dict[str, float]:
+    scores = {f"recall@{k}": len(set(ranked[:k]) & set(expected)) / len(expected) for k in RECALL_KS}
+    first_relevant = next((rank for rank, disease in enumerate(ranked, start=1) if disease in expected), None)
+    scores["reciprocal_rank"] = 1 / first_relevant if first_relevant else 0.0
+    return scores
+
+
+def build_backends(top_k: int) -> Dict[str, Callable[[str], List[Document]]]:
+    from repositories.medical_knowledge_base_repository import MedicalKnowledgeRepository
+
+    pinecone = MedicalKnowledgeRepository("pinecone")
+    local = MedicalKnowledgeRepository("local")
+    configured = MedicalKnowledgeRepository()
+    return {
+        "pinecone": lambda query: [doc for doc, _ in pinecone.similarity_search_with_score(query, top_k)],
+        "local": lambda query: [doc for doc, _ in local.similarity_search_with_score(query, top_k)],
+        "lexical": lambda query: [doc for doc, _ in configured.lexical_search(query, top_k)],
+        "hybrid": lambda query: [doc for doc, _ in configured.hybrid_search_with_score(query, top_k)],
+        "full_docs": lambda query: configured.retrieve_full_docs(query, top_k),
+    }
+
+
+def run_backend(search: Callable[[str], List[Document]], queries: List[dict]) -> Dict:
+    started_at = time.perf_counter()
+    search(queries[0]["query"])
+    warm_up_time = time.perf_counter() - started_at
+
+    rows = []
+    for label in queries:
+        started_at = time.perf_counter()
+        docs = search(label["query"])
+        latency = time.perf_counter() - started_at
+        ranked = rank_diseases(docs)
+        rows.append({**label, "ranked": ranked, "latency_sec": latency, **score_query(ranked, label["diseases"])})
+
+    metrics = {f"recall@{k}": sum(row[f"recall@{k}"] for row in rows) / len(rows) for k in RECALL_KS}
+    metrics["mrr"] = sum(row["reciprocal_rank"] for row in rows) / len(rows)
+    return {
+        **metrics,
+        "warm_up_sec": warm_up_time,
+        "latency": summarize([row["latency_sec"] for row in rows]),
+        "queries": rows,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="pinecone,local,lexical,hybrid,full_docs", help="comma separated backends to compare")
+    parser.add_argument("--top-k", type=int, default=10, help="chunks (documents for full_docs) retrieved per query")
+    parser.add_argument("--generated-per-document", type=int, default=3, help="queries generated from each document, 0 for the labeled ones only")
+    parser.add_argument("--symptoms-per-query", type=int, default=3, help="symptoms named in each generated query")
+    parser.add_argument("--seed", type=int, default=7, help="seed of the generated queries")
+    parser.add_argument("--fake", action="store_true", help="use the local stand-ins of the OpenAI and Pinecone APIs")
+    parser.add_argument("--json", dest="json_path", default=None, help="write the report, with the results of each query, as JSON to this path")
+    args = parser.parse_args()
+
+    services = None
+    if args.fake:
+        from benchmarks.fakes.services import FakeServices
+        from benchmarks.pipeline_benchmark import configure_environment
+        services = FakeServices().start()
+        configure_environment(services.base_url, 0)
+
+    # imported after the environment is configured
+    from repositories.medical_knowledge_base_repository import NAMESPACE_BY_SPECIALTY, MedicalKnowledgeRepository
+
+    documents = MedicalKnowledgeRepository.read_local_documents()
+    if services:
+        services.knowledge_chunks = [
+            {
+                "id": f"chunk-{index}",
+                "namespace": chunk.metadata["specialty"] if NAMESPACE_BY_SPECIALTY else "",
+                "metadata": {**chunk.metadata, "text": chunk.page_content},
+            }
+            for index, chunk in enumerate(MedicalKnowledgeRepository.split_documents(documents))
+        ]
+
+    queries = load_labeled_queries() + generate_queries(documents, args.generated_per_document, args.symptoms_per_query, args.seed)
+    backends = build_backends(args.top_k)
+
+    report: Dict[str, Dict] = {}
+    for backend in args.backends.split(","):
+        try:
+            report[backend] = run_backend(backends[backend], queries)
+        except Exception as e:
+            print(f"skipping {backend}: {e}", file=sys.stderr)
+
+    if not report:
+        print("no backend available", file=sys.stderr)
+        sys.exit(1)
+
+    generated = sum(query["source"] == "generated" for query in queries)
+    print(f"{len(queries)} queries ({len(queries) - generated} labeled, {generated} generated), top_k {args.top_k}\n")
+    header = f"{'backend':<11}" + "".join(f"{'recall@' + str(k):>10}" for k in RECALL_KS) + f"{'MRR':>8}{'warm-up':>10}" + "".join(
+        f"{name:>12}" for name in ["query p50", "query p95", "query p99"]
+    )
+    print(header)
+    print("-" * len(header))
+    for backend, result in report.items():
+        latency = result["latency"]
+        print(
+            f"{backend:<11}" + "".join(f"{result['recall@' + str(k)]:>10.2%}" for k in RECALL_KS)
+            + f"{result['mrr']:>8.3f}{result['warm_up_sec']:>9.2f}s"
+            f"{latency['p50'] * 1000:>10.1f}ms{latency['p95'] * 1000:>10.1f}ms{latency['p99'] * 1000:>10.1f}ms"
+        )
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Microbenchmark of response serialization and compression per HTTP endpoint.
+
+Compares the previous `json.dumps(model.model_dump())` path with the shared
+response layer in `middlewares/request_middleware.py`.
+
+Usage (from backend/functions):
+    python -m benchmarks.serialization_benchmark [--iterations 2000]
+"""
+import argparse
+import json
+import os
+import timeit
+from datetime import datetime, timezone
+from glob import glob
+from typing import Any, Callable, Dict
+from models.clinical_record import ClinicalRecord, ClassifiedSymptoms, DiagnosisProbability
+from models.medical_extraction import PatientInfo, Symptom
+from models.transcription import Transcription, TranscriptionStatus
+from middlewares.request_middleware import serialize, compress, brotli
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+DOCS_FOLDER = os.path.join(BASE_DIR, "repositories", "documents")
+
+
+def read_markdown_documents() -> Dict[str, str]:
+    docs = {}
+    for file_path in sorted(glob(os.path.join(DOCS_FOLDER, "*.md"))):
+        with open(file_path, "r", encoding="utf-8") as f:
+            docs[os.path.splitext(os.path.basename(file_path))[0]] = f.read()
+    return docs
+
+
+def build_payloads() -> Dict[str, Any]:
+    """Build representative payloads for each endpoint."""
+    docs = read_markdown_documents()
+    now = datetime.now(timezone.utc)
+
+    symptoms = [
+        Symptom(name=name, duration="2 days", intensity="moderate")
+        for name in ["chest pain", "shortness of breath", "nausea", "cold sweats", "dizziness"]
+    ]
+    clinical_record = ClinicalRecord(
+        session_id="benchmark-session",
+        summary="Patient reports chest pain radiating to the left arm for the last two hours.",
+        patient_info=PatientInfo(name="John Smith", age=45, id_number="MS123456", gender="male"),
+        symptoms=symptoms,
+        reason_for_visit="Acute chest pain",
+        classified_symptoms=[
+            ClassifiedSymptoms(
+                name=s.name, intensity=s.intensity, severity="severe",
+                duration=s.duration, confidence_score=0.82,
+            )
+            for s in symptoms
+        ],
+        # a full markdown document is comparable in size to a generated report
+        diagnosis_report=docs.get("acute_coronary_syndrome", ""),
+        diagnosis=[
+            DiagnosisProbability(
+                name=name, probability=probability,
+                reasoning="Symptoms are consistent with the condition. " * 10,
+                symptoms=[s.name for s in symptoms],
+            )
+            for name, probability in [("Acute Coronary Syndrome", 70), ("Myocardial Infarction", 20), ("Pneumonia", 10)]
+        ],
+        created_at=now,
+        updated_at=now,
+    )
+    transcription = Transcription(
+        session_id="benchmark-session",
+        audio_url="https://example.com/doctor_appointment.mp3",
+        text="Doctor: What brings you in today? Patient: I've had chest pain since this morning. " * 40,
+        language="english",
+        duration=312.4,
+        status=TranscriptionStatus.DIAGNOSIS_FINISHED,
+        created_at=now,
+        updated_at=now,
+    )
+    full_docs = [
+        {"page_content": text, "metadata": {"disease_name": name}}
+        for name, text in list(docs.items())[:3]
+    ]
+    chunks = [
+        {"page_content": text[i:i + 1000], "metadata": {"disease_name": name}}
+        for name, text in docs.items()
+        for i in range(0, len(text), 850)
+    ][:10]
+
+    return {
+        "get_clinical_record": {"success": True, "data": clinical_record},
+        "get_transcription": {"success": True, "data": transcription},
+        "query_documents": {"success": True, "documents": full_docs},
+        "similarity_search": {"success": True, "documents": chunks},
+    }
+
+
+def legacy_serialize(payload: Any) -> bytes:
+    """The previous path: dump models to dicts, convert datetimes and call json.dumps."""
+    def to_dict(value: Any) -> Any:
+        if hasattr(value, "model_dump"):
+            return value.model_dump(mode="json")
+        if isinstance(value, dict):
+            return {k: to_dict(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [to_dict(v) for v in value]
+        return value
+    return json.dumps(to_dict(payload)).encode("utf-8")
+
+
+def measure(func: Callable[[], Any], iterations: int) -> float:
+    """Return the mean time per call in microseconds."""
+    return timeit.timeit(func, number=iterations) / iterations * 1_000_000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    encodings = ["gzip"] + (["br"] if brotli else [])
+    header = f"{'endpoint':<22}{'size':>9}{'json.dumps':>13}{'to_json':>11}"
+    for encoding in encodings:
+        header += f"{encoding + ' size':>11}{encoding + ' time':>11}"
+    print(header)
+    print("-" * len(header))
+
+    for endpoint, payload in build_payloads().items():
+        body = serialize(payload)
+        row = (
+            f"{endpoint:<22}{len(body):>9}"
+            f"{measure(lambda: legacy_serialize(payload), args.iterations):>11.1f}us"
+            f"{measure(lambda: serialize(payload), args.iterations):>9.1f}us"
+        )
+        for encoding in encodings:
+            compressed = compress(body, encoding)
+            elapsed = measure(lambda: compress(body, encoding), max(args.iterations // 10, 1))
+            row += f"{len(compressed):>11}{elapsed:>9.1f}us"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Accuracy and latency of the symptom severity classification per embedding backend.
+
+Classifies the hand labeled symptoms of `fixtures/symptom_severity.json` with
+each backend, in batches the size of a typical extraction, and reports the
+accuracy, the agreement with the first backend and the model load and
+per-batch latencies. The OpenAI backend needs OPENAI_API_KEY, the local one
+an ONNX model in LOCAL_EMBEDDING_MODEL_DIR; unavailable backends are skipped.
+
+Usage (from backend/functions):
+    python -m benchmarks.severity_benchmark [--backends openai,local] [--batch-size 4] [--rounds 5]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, List
+from benchmarks.pipeline_benchmark import summarize
+from services.symptom_severity_classifier import SymptomSeverityClassifier, build_embeddings
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "symptom_severity.json")
+
+
+def load_labels() -> List[dict]:
+    with open(FIXTURE_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def run_backend(backend: str, labels: List[dict], batch_size: int, rounds: int) -> Dict:
+    started_at = time.perf_counter()
+    classifier = SymptomSeverityClassifier(build_embeddings(backend), backend)
+    # the anchors are embedded once per instance, count them in the load time
+    classifier._anchor_vectors()
+    load_time = time.perf_counter() - started_at
+
+    texts = [label["text"] for label in labels]
+    batch_times: List[float] = []
+    predictions: List[str] = []
+    for round_index in range(rounds):
+        round_predictions = []
+        for start in range(0, len(texts), batch_size):
+            batch_started_at = time.perf_counter()
+            results = classifier.classify(texts[start:start + batch_size])
+            batch_times.append(time.perf_counter() - batch_started_at)
+            round_predictions.extend(severity for severity, _ in results)
+        if round_index == 0:
+            predictions = round_predictions
+
+    correct = sum(prediction == label["severity"] for prediction, label in zip(predictions, labels))
+    return {
+        "accuracy": correct / len(labels),
+        "load_time_sec": load_time,
+        "batch_time": summarize(batch_times),
+        "predictions": predictions,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="openai,local", help="comma separated backends to compare")
+    parser.add_argument("--batch-size", type=int, default=4, help="symptoms classified per call, like one extraction")
+    parser.add_argument("--rounds", type=int, default=5, help="passes over the labeled symptoms")
+    parser.add_argument("--json", dest="json_path", default=None, help="write the report as JSON to this path")
+    args = parser.parse_args()
+
+    labels = load_labels()
+    report: Dict[str, Dict] = {}
+    for backend in args.backends.split(","):
+        try:
+            report[backend] = run_backend(backend, labels, args.batch_size, args.rounds)
+        except Exception as e:
+            print(f"skipping {backend}: {e}", file=sys.stderr)
+
+    if not report:
+        print("no backend available", file=sys.stderr)
+        sys.exit(1)
+
+    reference = next(iter(report.values()))["predictions"]
+    print(f"{len(labels)} labeled symptoms, batches of {args.batch_size}, {args.rounds} rounds\n")
+    header = f"{'backend':<10}{'accuracy':>10}{'agreement':>11}{'load (s)':>10}" + "".join(
+        f"{name:>12}" for name in ["batch p50", "batch p95", "batch p99"]
+    )
+    print(header)
+    print("-" * len(header))
+    for backend, result in report.items():
+        agreement = sum(a == b for a, b in zip(result["predictions"], reference)) / len(labels)
+        result["agreement"] = agreement
+        batch = result["batch_time"]
+        print(
+            f"{backend:<10}{result['accuracy']:>10.2%}{agreement:>11.2%}{result['load_time_sec']:>10.2f}"
+            f"{batch['p50'] * 1000:>10.1f}ms{batch['p95'] * 1000:>10.1f}ms{batch['p99'] * 1000:>10.1f}ms"
+        )
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
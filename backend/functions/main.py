@@ -2,24 +2,33 @@ from firebase_functions import https_fn
 from firebase_functions.options import set_global_options
 from firebase_admin import initialize_app
 from triggers.audio_transcription import transcription_handler
+from triggers.audio_upload import audio_upload_handler, create_audio_upload
 from triggers.diagnosis_generation import diagnosis_generation_handler
 from triggers.get_clinical_record import get_clinical_record
 from triggers.get_transcription_status import get_transcription
+from triggers.get_session import get_session
 from triggers.medical_information_extractor import information_extractor_handler
 from triggers.vector_db import load_documents, get_index_stats, query_documents, similarity_search
 from triggers.start_process import start_process
+from utils.warm_up import start_warm_up
 
 set_global_options(max_instances=10)
 
 initialize_app()
 
+# pre-initialize the clients and caches of this instance's function before its first request
+start_warm_up()
+
 # Export the functions properly
 __all__ = [
+    "create_audio_upload",
+    "audio_upload_handler",
     "transcription_handler",
     "information_extractor_handler",
     "diagnosis_generation_handler",
     "get_transcription",
     "get_clinical_record",
+    "get_session",
     "load_documents",
     "get_index_stats",
     "query_documents",
@@ -1,15 +1,28 @@
 from functools import wraps
-from typing import Callable, Union, List
+from typing import Any, Callable, Optional, Union, List
 from firebase_functions import https_fn
+from pydantic_core import to_json
+import gzip
 import json
 
+try:
+    import brotli
+except ImportError:  # brotli is optional, responses fall back to gzip
+    brotli = None
+
 CORS_HEADERS = {
     "Content-Type": "application/json",
     "Access-Control-Allow-Origin": "*",
     "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
-    "Access-Control-Allow-Headers": "Content-Type",
+    "Access-Control-Allow-Headers": "Content-Type, If-None-Match",
+    "Access-Control-Expose-Headers": "ETag",
 }
 
+# Payloads smaller than this are sent uncompressed, compression overhead isn't worth it
+MIN_COMPRESSION_SIZE = 1024
+GZIP_COMPRESS_LEVEL = 6
+BROTLI_QUALITY = 5
+
 def with_cors(func: Callable) -> Callable:
     @wraps(func)
     def wrapper(req: https_fn.Request) -> https_fn.Response:
@@ -45,4 +58,78 @@ def with_methods(allowed_methods: Union[str, List[str]]) -> Callable:
                 )
             return func(req)
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator
+
+def serialize(payload: Any) -> bytes:
+    """
+    Serialize a response payload to JSON bytes.
+
+    Pydantic models, datetimes and enums are serialized natively by pydantic-core,
+    so models don't need to be dumped to an intermediate dict first.
+    """
+    return to_json(payload)
+
+def negotiate_encoding(req: https_fn.Request) -> Optional[str]:
+    """
+    Pick the best supported content encoding from the `Accept-Encoding` header.
+
+    Returns:
+        "br", "gzip" or None when the client doesn't accept a supported encoding.
+    """
+    accept_encoding = req.headers.get("Accept-Encoding", "")
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    if brotli and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+def compress(body: bytes, encoding: Optional[str]) -> bytes:
+    """Compress the body with the given content encoding."""
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_COMPRESS_LEVEL)
+    return body
+
+def json_response(
+    req: https_fn.Request,
+    payload: Any,
+    status: int = 200,
+    headers: Optional[dict] = None,
+) -> https_fn.Response:
+    """
+    Build a JSON response, compressed according to the client's `Accept-Encoding`.
+
+    Args:
+        req: The HTTP request, used for content negotiation
+        payload: Any JSON serializable value, including Pydantic models
+        status: The HTTP status code
+        headers: Extra headers merged over the CORS headers
+    """
+    body = serialize(payload)
+    response_headers = {**CORS_HEADERS, **(headers or {}), "Vary": "Accept-Encoding"}
+
+    encoding = negotiate_encoding(req) if len(body) >= MIN_COMPRESSION_SIZE else None
+    if encoding:
+        body = compress(body, encoding)
+        response_headers["Content-Encoding"] = encoding
+
+    return https_fn.Response(
+        status=status,
+        response=body,
+        headers=response_headers
+    )
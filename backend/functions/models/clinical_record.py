@@ -1,3 +1,4 @@
+from enum import Enum
 from typing import List, Optional, Dict, Any
 from pydantic import Field, BaseModel
 from models.medical_extraction import MedicalExtraction
@@ -13,6 +14,25 @@ class DiagnosisProbability(BaseModel):
     reasoning: Optional[str] = Field(default=None, description="The reasoning for the diagnosis probability")
     symptoms: Optional[List[str]] = Field(default=None, description="The symptoms the patient has that are related to the disease")
 
+class DiagnosisList(BaseModel):
+    summary: str = Field(description="A summary about the report.")
+    diagnosis_probabilities: List[DiagnosisProbability] = Field(description="List of probable diagnoses")
+    conclusion: str = Field(description="A conclusion about the most likely diagnosis of the patient with justification for the selection with clinical reasoning.")
+
+class ReportStatus(str, Enum):
+    """
+    Enum for the generation status of the diagnosis report.
+    """
+    STREAMING = "streaming"
+    COMPLETED = "completed"
+
+class DiagnosisRoute(str, Enum):
+    """
+    Enum for the diagnosis generation path chosen by the router.
+    """
+    FAST = "fast"
+    FULL = "full"
+
 class ClassifiedSymptoms(BaseModel):
     name: str = Field(description="The symptom name")
     intensity: Optional[str] = Field(description="Intensity: mild, moderate, severe, critical")
@@ -27,6 +47,7 @@ class ClinicalRecord(MedicalExtraction):
     session_id: str
     classified_symptoms: Optional[List[ClassifiedSymptoms]] = Field(description="List of symptoms")
     diagnosis_report: Optional[str] = Field(default=None, description="The diagnosis report")
+    report_status: Optional[ReportStatus] = Field(default=None, description="Generation status of the diagnosis report")
     diagnosis: Optional[List[DiagnosisProbability]] = Field(default=None, description="List probable diagnoses")
     created_at: Optional[datetime] = Field(default=None, description="Timestamp when the record was created")
     updated_at: Optional[datetime] = Field(default=None, description="Timestamp when the transcription was last updated")
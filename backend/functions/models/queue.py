@@ -16,6 +16,10 @@ class Queue(BaseModel):
     Database Model representing a queue.
     """
     session_id: str = Field(..., description="Unique session ID for the process")
-    audio_url: str = Field(..., description="The URL of the audio file to be transcribed")
+    audio_url: str = Field(..., description="The URL of the audio file to be transcribed, gs:// for uploaded files")
+    content_hash: Optional[str] = Field(default=None, description="SHA-256 fingerprint of the uploaded audio, computed at upload")
+    content_type: Optional[str] = Field(default=None, description="content type of the uploaded audio")
+    size_bytes: Optional[int] = Field(default=None, description="size of the uploaded audio")
+    generation: Optional[int] = Field(default=None, description="Cloud Storage generation of the uploaded audio")
     status: Optional[QueueStatus] = Field(default=QueueStatus.WAITING, description="transcription status")
     created_at: Optional[datetime] = Field(default=None, description="date created")
\ No newline at end of file
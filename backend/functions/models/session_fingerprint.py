@@ -0,0 +1,20 @@
+from enum import Enum
+from datetime import datetime
+from pydantic import BaseModel, Field
+
+class FingerprintKind(str, Enum):
+    """
+    Enum for the content a session fingerprint is computed from.
+    """
+    TEXT = "text"
+    AUDIO_URL = "audio_url"
+    AUDIO = "audio"
+
+class SessionFingerprint(BaseModel):
+    """
+    Database Model mapping the hash of a submitted content to the session processing it.
+    """
+    content_hash: str = Field(..., description="SHA-256 of the submitted content")
+    kind: FingerprintKind = Field(..., description="The content the hash was computed from")
+    session_id: str = Field(..., description="The session processing the content")
+    registered_at: datetime = Field(..., description="date the session was registered for the content")
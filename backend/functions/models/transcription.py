@@ -31,5 +31,6 @@ class Transcription(BaseModel):
     context: Optional[str] = Field(default=None, description="Additional context or notes about the transcription")
     status: Optional[TranscriptionStatus] = Field(default=None, description="Current status of the transcription process")
     error_message: Optional[str] = Field(default=None, description="Error message if transcription failed")
+    source_session_id: Optional[str] = Field(default=None, description="Session the results were cloned from, when the same content was already processed")
     created_at: Optional[datetime] = Field(default=None, description="Date when transcription document was created")
     updated_at: Optional[datetime] = Field(default=None, description="Timestamp when the transcription was last updated")
@@ -0,0 +1,31 @@
+from enum import Enum
+from typing import List, Optional
+from pydantic import BaseModel, Field
+
+class TreatmentType(str, Enum):
+    """
+    Enum for the kind of intervention of a treatment.
+    """
+    PHARMACOLOGICAL = "pharmacological"
+    NON_PHARMACOLOGICAL = "non_pharmacological"
+
+class Treatment(BaseModel):
+    name: str = Field(description="The medication, procedure or intervention")
+    type: TreatmentType = Field(description="pharmacological or non_pharmacological")
+    details: Optional[str] = Field(default=None, description="Dose, frequency and duration, or how to carry out the intervention")
+    reasoning: Optional[str] = Field(default=None, description="The clinical reasoning behind the treatment")
+
+class Recommendation(BaseModel):
+    text: str = Field(description="The recommendation to the doctor managing the case")
+    reasoning: Optional[str] = Field(default=None, description="The clinical reasoning behind the recommendation")
+
+class TreatmentPlan(BaseModel):
+    """
+    Treatment plan and recommendations generated for a diagnosis,
+    rendered in the markdown report by `utils.report_renderer`.
+    """
+    treatments: List[Treatment] = Field(default_factory=list, description="Personalized treatments, with intensity adjusted to the symptom severity")
+    red_flags: List[str] = Field(default_factory=list, description="Critical or red-flag symptoms present or to watch for")
+    diagnostic_tests: List[str] = Field(default_factory=list, description="Diagnostic tests and procedures to improve the diagnosis accuracy")
+    recommendations: List[Recommendation] = Field(default_factory=list, description="Recommendations directed to the doctor managing the case")
+    follow_up: Optional[str] = Field(default=None, description="Follow-up actions or monitoring")
@@ -0,0 +1,23 @@
+from enum import Enum
+from typing import Optional
+from datetime import datetime
+from pydantic import BaseModel, Field
+
+class ClaimStatus(str, Enum):
+    """
+    Enum for the status of a trigger claim.
+    """
+    PROCESSING = "processing"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+class TriggerClaim(BaseModel):
+    """
+    Database Model recording which event is processing a pipeline stage of a session.
+    """
+    session_id: str = Field(..., description="Unique session ID for the process")
+    stage: str = Field(..., description="The pipeline stage claimed")
+    event_id: str = Field(..., description="ID of the event that claimed the stage")
+    status: ClaimStatus = Field(default=ClaimStatus.PROCESSING, description="claim status")
+    lease_expires_at: datetime = Field(..., description="date after which a processing claim is considered abandoned")
+    claimed_at: Optional[datetime] = Field(default=None, description="date claimed")
@@ -0,0 +1,160 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Iterator, Optional, Tuple
+from urllib.parse import quote
+import google.auth.transport.requests
+from firebase_admin import storage
+from google.auth.credentials import Signing
+from google.cloud.storage import Blob, Bucket
+from utils.http_clients import request_timeout
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Bucket receiving the audio uploads, the default bucket of the project when unset
+AUDIO_UPLOAD_BUCKET = os.getenv("AUDIO_UPLOAD_BUCKET") or None
+# Folder of the uploaded audio files, one object per session: <prefix>/<session_id>/audio.<ext>
+AUDIO_UPLOAD_PREFIX = os.getenv("AUDIO_UPLOAD_PREFIX", "uploads")
+# Seconds a signed upload URL stays valid
+AUDIO_UPLOAD_URL_EXPIRATION_SEC = int(os.getenv("AUDIO_UPLOAD_URL_EXPIRATION_SEC", "900"))
+# Largest accepted upload, the file size limit of the transcription API
+AUDIO_MAX_UPLOAD_BYTES = int(os.getenv("AUDIO_MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+# Bytes read per range request when hashing and downloading an upload
+AUDIO_READ_CHUNK_BYTES = int(os.getenv("AUDIO_READ_CHUNK_BYTES", str(4 * 1024 * 1024)))
+# Range requests of a download in flight at once
+AUDIO_READ_CONCURRENCY = int(os.getenv("AUDIO_READ_CONCURRENCY", "4"))
+
+# Accepted content types and the file extension the transcription API detects the format from
+AUDIO_CONTENT_TYPES = {
+    "audio/mpeg": ".mp3",
+    "audio/mp3": ".mp3",
+    "audio/mp4": ".m4a",
+    "audio/x-m4a": ".m4a",
+    "audio/wav": ".wav",
+    "audio/x-wav": ".wav",
+    "audio/webm": ".webm",
+    "audio/ogg": ".ogg",
+    "audio/flac": ".flac",
+}
+
+UPLOAD_NAME_PATTERN = re.compile(rf"^{re.escape(AUDIO_UPLOAD_PREFIX)}/(?P<session_id>[0-9a-f-]{{36}})/audio\.\w+$")
+STORAGE_URL_PREFIX = "gs://"
+
+range_read_executor = ThreadPoolExecutor(max_workers=AUDIO_READ_CONCURRENCY)
+
+
+@lru_cache(maxsize=1)
+def get_audio_bucket() -> Bucket:
+    return storage.bucket(AUDIO_UPLOAD_BUCKET)
+
+
+def upload_object_name(session_id: str, content_type: str) -> str:
+    return f"{AUDIO_UPLOAD_PREFIX}/{session_id}/audio{AUDIO_CONTENT_TYPES[content_type]}"
+
+
+def session_id_of(object_name: str) -> Optional[str]:
+    """Session of an uploaded audio object, None for the other objects of the bucket."""
+    match = UPLOAD_NAME_PATTERN.match(object_name)
+    return match.group("session_id") if match else None
+
+
+def upload_session_id(bucket_name: str, object_name: str) -> Optional[str]:
+    """Session of an audio upload of the upload bucket, None for any other object."""
+    if bucket_name != get_audio_bucket().name:
+        return None
+    return session_id_of(object_name)
+
+
+def storage_url(bucket_name: str, object_name: str) -> str:
+    return f"{STORAGE_URL_PREFIX}{bucket_name}/{object_name}"
+
+
+def parse_storage_url(url: str) -> Optional[Tuple[str, str]]:
+    """(bucket, object name) of a `gs://` URL, None for other URLs."""
+    if not url.startswith(STORAGE_URL_PREFIX):
+        return None
+    bucket_name, _, object_name = url[len(STORAGE_URL_PREFIX):].partition("/")
+    return bucket_name, object_name
+
+
+def _signing_options(bucket: Bucket) -> dict:
+    """
+    Credentials of the URL signature. The runtime service account has no private
+    key on Cloud Functions, the URL is then signed with the IAM signBlob API.
+    """
+    credentials = bucket.client._credentials
+    if isinstance(credentials, Signing):
+        return {"credentials": credentials}
+    if not credentials.valid:
+        credentials.refresh(google.auth.transport.requests.Request())
+    return {"service_account_email": credentials.service_account_email, "access_token": credentials.token}
+
+
+def create_upload_url(session_id: str, content_type: str) -> dict:
+    """
+    URL the client uploads the audio of a session to, with the method and headers
+    of the request. The signature binds the content type and the size limit, so
+    the upload is rejected by Cloud Storage when they don't match. With the
+    Storage emulator, which doesn't check signatures, it is the emulator upload URL.
+    """
+    bucket = get_audio_bucket()
+    object_name = upload_object_name(session_id, content_type)
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=AUDIO_UPLOAD_URL_EXPIRATION_SEC)
+    headers = {"Content-Type": content_type}
+
+    emulator_host = os.getenv("STORAGE_EMULATOR_HOST")
+    if emulator_host:
+        if not emulator_host.startswith("http"):
+            emulator_host = f"http://{emulator_host}"
+        url = (
+            f"{emulator_host}/upload/storage/v1/b/{bucket.name}/o"
+            f"?uploadType=media&name={quote(object_name, safe='')}"
+        )
+        return {"url": url, "method": "POST", "headers": headers, "object_name": object_name, "expires_at": expires_at.isoformat()}
+
+    headers["x-goog-content-length-range"] = f"0,{AUDIO_MAX_UPLOAD_BYTES}"
+    url = bucket.blob(object_name).generate_signed_url(
+        version="v4",
+        method="PUT",
+        expiration=timedelta(seconds=AUDIO_UPLOAD_URL_EXPIRATION_SEC),
+        content_type=content_type,
+        headers={"x-goog-content-length-range": headers["x-goog-content-length-range"]},
+        **_signing_options(bucket),
+    )
+    return {"url": url, "method": "PUT", "headers": headers, "object_name": object_name, "expires_at": expires_at.isoformat()}
+
+
+def read_ranges(blob: Blob, size: int, generation: Optional[int] = None) -> Iterator[bytes]:
+    """
+    Read an object in AUDIO_READ_CHUNK_BYTES range requests, AUDIO_READ_CONCURRENCY
+    at a time, yielding the chunks in order. A failed range is retried alone by the
+    Storage client instead of restarting the whole download, and `generation` pins
+    every range to the same version of the object.
+    """
+    def read_range(start: int) -> bytes:
+        end = min(start + AUDIO_READ_CHUNK_BYTES, size) - 1
+        return blob.download_as_bytes(
+            start=start, end=end, if_generation_match=generation, timeout=request_timeout(), checksum=None
+        )
+
+    yield from range_read_executor.map(read_range, range(0, size, AUDIO_READ_CHUNK_BYTES))
+
+
+def read_object(bucket_name: str, object_name: str, size: int, generation: Optional[int] = None) -> Iterator[bytes]:
+    """Chunks of an object of known size, in order, read with range requests."""
+    return read_ranges(storage.bucket(bucket_name).blob(object_name), size, generation)
+
+
+def download_object(bucket_name: str, object_name: str, size: Optional[int] = None, generation: Optional[int] = None) -> bytes:
+    """Download an object with parallel range reads, reading its size first when unknown."""
+    if size is None:
+        blob = storage.bucket(bucket_name).get_blob(object_name, timeout=request_timeout())
+        if blob is None:
+            raise FileNotFoundError(storage_url(bucket_name, object_name))
+        size, generation = blob.size, blob.generation
+    content = b"".join(read_object(bucket_name, object_name, size, generation))
+    logger.debug("read %s from storage in %d ranges", object_name, -(-size // AUDIO_READ_CHUNK_BYTES))
+    return content
@@ -1,37 +1,77 @@
+from typing import List, Optional
 from firebase_admin import firestore
-from models.clinical_record import ClinicalRecord, ReportOutput
+from repositories.session_state import set_document, update_document
+from utils.instrumentation import record_firestore_read
+from utils.logger import get_logger
+from models.clinical_record import ClinicalRecord, DiagnosisProbability, ReportOutput, ReportStatus
+
+logger = get_logger(__name__)
 
 def save_clinical_record(clinical_record: ClinicalRecord):
-    print('Saving clinical record')
+    logger.debug("saving clinical record")
     db = firestore.client()
     doc_ref = db.collection('clinical_record').document(clinical_record.session_id)
     
-    doc_ref.set(clinical_record.model_dump())
-    print(f"Clinical Record saved to Firestore for session: {clinical_record.session_id}")
+    set_document(doc_ref, clinical_record.model_dump())
+    logger.info("clinical record saved to Firestore for session: %s", clinical_record.session_id)
 
 def save_diagnosis_report(session_id: str, diagnosis: ReportOutput) -> None:
     """
     Save the diagnosis report to Firestore.
     """
-    print(f'Saving diagnosis report for session: {session_id}')
+    logger.debug("saving diagnosis report for session: %s", session_id)
     db = firestore.client()
     doc_ref = db.collection('clinical_record').document(session_id)
     
-    doc_ref.update({
+    update_document(doc_ref, {
         "diagnosis_report": diagnosis.report,
         "diagnosis": [d.model_dump() for d in diagnosis.diagnosis_probabilities],
+        "report_status": ReportStatus.COMPLETED.value,
         "updated_at": firestore.SERVER_TIMESTAMP
     })
-    print(f"Diagnosis report saved to Firestore for session: {session_id}")
+    logger.info("diagnosis report saved to Firestore for session: %s", session_id)
+
+def save_partial_diagnosis_report(
+    session_id: str,
+    partial_report: str,
+    diagnosis_probabilities: Optional[List[DiagnosisProbability]] = None,
+) -> None:
+    """
+    Save the report generated so far while it is being streamed.
+    The report is marked as completed by `save_diagnosis_report`.
+    Partial reports are written right away so clients can follow the stream.
+    """
+    db = firestore.client()
+    doc_ref = db.collection('clinical_record').document(session_id)
 
-def get_clinical_record_by_session(session_id: str) -> dict:
-    """Retrieve clinical record data from Firestore by session_id."""
+    data = {
+        "diagnosis_report": partial_report,
+        "report_status": ReportStatus.STREAMING.value,
+        "updated_at": firestore.SERVER_TIMESTAMP
+    }
+    if diagnosis_probabilities is not None:
+        data["diagnosis"] = [d.model_dump() for d in diagnosis_probabilities]
+
+    update_document(doc_ref, data, immediate=True)
+
+def get_clinical_record_by_session(session_id: str, fields: Optional[List[str]] = None) -> dict:
+    """
+    Retrieve clinical record data from Firestore by session_id.
+
+    Args:
+        session_id: The unique session identifier
+        fields: Optional list of top-level fields to read. When provided, only
+            these fields are fetched from Firestore.
+    """
     db = firestore.client()
     
     # Query the clinical_records collection for the given session_id
     clinical_records_ref = db.collection("clinical_record")
     query = clinical_records_ref.where("session_id", "==", session_id)
+    if fields:
+        query = query.select(fields)
     docs = query.stream()
+    record_firestore_read()
     
     # Get the first (and should be only) document
     clinical_record_doc = None
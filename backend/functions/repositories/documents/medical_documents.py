@@ -1,6 +1,31 @@
-from typing import List
+import re
+from functools import lru_cache
+from typing import Dict, List
 from langchain.schema import Document
 
+# Knowledge base namespace of each topic when the chunks are split by specialty
+TOPIC_SPECIALTIES = {
+    "cardiac_emergency": "cardiology",
+    "hypertension": "cardiology",
+    "headache": "neurology",
+    "dizziness": "neurology",
+    "respiratory_infection": "pulmonology",
+    "chronic_respiratory_disease": "pulmonology",
+    "acute_gastrointeritis": "gastroenterology",
+    "food_poisoning": "gastroenterology",
+    "appendicitis": "gastroenterology",
+    "joint_pain": "musculoskeletal",
+    "back_pain": "musculoskeletal",
+    "diabetes": "endocrinology",
+    "allergic_reaction": "immunology",
+    "urinary_tract_infection": "urology",
+    "skin_rash": "dermatology",
+    "eye_problems": "ophthalmology",
+    "mental_health": "psychiatry",
+    "pregnancy_concerns": "obstetrics",
+}
+DEFAULT_SPECIALTY = "general"
+
 
 def get_medical_documents() -> List[Document]:
     """
@@ -31,6 +56,10 @@ def get_medical_documents() -> List[Document]:
             page_content="DIAGNOSIS: Pneumonia. PRIMARY SYMPTOMS: High fever, productive cough with colored sputum, difficulty breathing, chest pain. SECONDARY SYMPTOMS: Fatigue, loss of appetite, sweating, chills, confusion in elderly. CAUSES: Bacterial infections (Streptococcus pneumoniae, Haemophilus influenzae), viral infections (influenza, RSV), fungal infections, aspiration of food/liquid, smoking, chronic lung disease, weakened immune system, recent surgery, mechanical ventilation, age over 65, alcohol abuse. DIAGNOSTIC TESTS: Chest X-ray, sputum culture, blood tests (CBC, CRP), pulse oximetry, CT scan if needed. TREATMENT PLAN: Antibiotics, oxygen therapy, rest, hydration, fever reducers, hospitalization if severe.",
             metadata={"topic": "respiratory_infection", "urgency": "moderate"},
         ),
+        Document(
+            page_content="DIAGNOSIS: Chronic Obstructive Pulmonary Disease (COPD). PRIMARY SYMPTOMS: Increased shortness of breath, increased cough, change in sputum volume or color. SECONDARY SYMPTOMS: Wheezing, chest tightness, fatigue, fever, confusion, cyanosis. CAUSES: Smoking, respiratory infections (viral or bacterial), air pollution, occupational dusts and chemicals, non-adherence to inhaled medications, cold weather. DIAGNOSTIC TESTS: Pulse oximetry, arterial blood gases, chest X-ray, spirometry, sputum culture, complete blood count. TREATMENT PLAN: Short-acting bronchodilators, systemic corticosteroids, antibiotics if bacterial infection is suspected, controlled oxygen therapy, non-invasive ventilation in respiratory failure.",
+            metadata={"topic": "chronic_respiratory_disease", "urgency": "high"},
+        ),
         Document(
             page_content="DIAGNOSIS: Acute Gastroenteritis. PRIMARY SYMPTOMS: Diarrhea, nausea, vomiting, abdominal cramps. SECONDARY SYMPTOMS: Low-grade fever, loss of appetite, dehydration, fatigue. CAUSES: Viral infections (norovirus, rotavirus, adenovirus), bacterial infections (Salmonella, E. coli, Campylobacter), parasitic infections (Giardia), contaminated food or water, poor hand hygiene, close contact with infected individuals, travel to developing countries, weakened immune system, recent antibiotic use. DIAGNOSTIC TESTS: Stool culture, blood tests (CBC, electrolytes), rapid tests for specific pathogens. TREATMENT PLAN: Oral rehydration solutions, antiemetics, antidiarrheals, dietary modifications (BRAT diet), rest.",
             metadata={"topic": "acute_gastrointeritis", "urgency": "moderate"},
@@ -128,3 +157,24 @@ def get_medical_documents() -> List[Document]:
             metadata={"topic": "pregnancy_concerns", "urgency": "high"},
         ),
     ]
+
+
+def diagnosis_slug(name: str) -> str:
+    """File name stem of a diagnosis, e.g. `Acute Coronary Syndrome (ACS)` -> `acute_coronary_syndrome`."""
+    name = re.sub(r"\(.*?\)", "", name)
+    return "_".join(re.findall(r"[a-z0-9]+", name.lower()))
+
+
+@lru_cache(maxsize=1)
+def get_document_metadata() -> Dict[str, dict]:
+    """
+    Get the topic, urgency and specialty of each diagnosis, by file name stem.
+    """
+    metadata = {}
+    for doc in get_medical_documents():
+        diagnosis = re.match(r"DIAGNOSIS: (.+?)\. ", doc.page_content).group(1)
+        metadata[diagnosis_slug(diagnosis)] = {
+            **doc.metadata,
+            "specialty": TOPIC_SPECIALTIES.get(doc.metadata["topic"], DEFAULT_SPECIALTY),
+        }
+    return metadata
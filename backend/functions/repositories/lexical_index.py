@@ -0,0 +1,124 @@
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from langchain.schema import Document
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "in",
+    "is", "it", "its", "of", "on", "or", "that", "the", "to", "was", "were", "with",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase the text and split it into terms, removing stopwords."""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+COMPARISONS = {
+    "$gt": lambda value, operand: value > operand,
+    "$gte": lambda value, operand: value >= operand,
+    "$lt": lambda value, operand: value < operand,
+    "$lte": lambda value, operand: value <= operand,
+}
+MISSING = object()
+
+
+def matches_filter(metadata: Dict[str, Any], filter: Optional[dict]) -> bool:
+    """
+    Evaluate a Pinecone metadata filter (`$eq`, `$ne`, `$gt`, `$gte`, `$lt`, `$lte`,
+    `$in`, `$nin`, `$exists`, `$and`, `$or`, or a plain value for equality) against
+    the metadata of a document.
+    """
+    if not filter:
+        return True
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(metadata, clause) for clause in condition):
+                return False
+        elif not _matches_condition(metadata.get(key, MISSING), condition):
+            return False
+    return True
+
+
+def _matches_condition(value: Any, condition: Any) -> bool:
+    if not isinstance(condition, dict):
+        return value == condition
+    for operator, operand in condition.items():
+        if operator == "$exists":
+            if (value is not MISSING) != operand:
+                return False
+        elif operator in COMPARISONS:
+            # numbers only, like Pinecone
+            is_number = isinstance(value, (int, float)) and not isinstance(value, bool)
+            if not is_number or not COMPARISONS[operator](value, operand):
+                return False
+        elif operator == "$eq":
+            if value != operand:
+                return False
+        elif operator == "$ne":
+            if value == operand:
+                return False
+        elif operator == "$in":
+            if value not in operand:
+                return False
+        elif operator == "$nin":
+            if value in operand:
+                return False
+        else:
+            raise ValueError(f"unsupported filter operator: {operator}")
+    return True
+
+
+class BM25Index:
+    """
+    In-memory inverted index ranking documents with Okapi BM25.
+    """
+    def __init__(self, documents: List[Document], k1: float = 1.5, b: float = 0.75) -> None:
+        self.documents = documents
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.doc_lengths: List[int] = []
+
+        for doc_id, doc in enumerate(documents):
+            terms = tokenize(doc.page_content)
+            self.doc_lengths.append(len(terms))
+            for term, frequency in Counter(terms).items():
+                self.postings[term].append((doc_id, frequency))
+
+        total_docs = len(documents)
+        self.avg_doc_length = sum(self.doc_lengths) / total_docs if total_docs else 0.0
+        self.idf = {
+            term: math.log(1 + (total_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+    def search(self, query: str, top_k: int = 10, filter: Optional[dict] = None) -> List[Tuple[Document, float]]:
+        """
+        Return the top_k documents matching the query with their BM25 score.
+
+        `filter` is a Pinecone metadata filter, so the same filter narrows the
+        lexical and the vector search.
+        """
+        allowed = None
+        if filter:
+            allowed = {doc_id for doc_id, doc in enumerate(self.documents) if matches_filter(doc.metadata, filter)}
+
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc_id, frequency in self.postings[term]:
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                length_norm = 1 - self.b + self.b * self.doc_lengths[doc_id] / self.avg_doc_length
+                scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [(self.documents[doc_id], score) for doc_id, score in ranked]
@@ -0,0 +1,58 @@
+from typing import List
+from langchain.schema import Document
+from langchain.text_splitter import MarkdownHeaderTextSplitter, RecursiveCharacterTextSplitter
+
+HEADERS_TO_SPLIT_ON = [("#", "h1"), ("##", "h2"), ("###", "h3"), ("####", "h4")]
+HEADING_PATH_SEPARATOR = " > "
+
+
+class MarkdownSectionSplitter:
+    """
+    Split markdown documents into one chunk per headed section.
+
+    Each chunk starts with its heading path (e.g. `Pneumonia > 6. Urgency Level and
+    Management > A. Mild to Moderate Urgency`) so it can be read without the rest of
+    the document, and gets it as `heading_path` metadata. Sections shorter than
+    `min_section_size` characters are merged with their first subsection, and
+    sections longer than `max_chunk_size` are split at paragraphs without overlap.
+    """
+    def __init__(self, max_chunk_size: int, min_section_size: int) -> None:
+        self.min_section_size = min_section_size
+        self.header_splitter = MarkdownHeaderTextSplitter(HEADERS_TO_SPLIT_ON, strip_headers=True)
+        self.section_splitter = RecursiveCharacterTextSplitter(chunk_size=max_chunk_size, chunk_overlap=0)
+
+    def split_documents(self, docs: List[Document]) -> List[Document]:
+        chunks = []
+        for doc in docs:
+            for headings, body in self._merge_short_sections(self._sections(doc.page_content)):
+                heading_path = HEADING_PATH_SEPARATOR.join(headings)
+                for text in self.section_splitter.split_text(body):
+                    chunks.append(Document(
+                        page_content=f"{heading_path}\n\n{text}" if heading_path else text,
+                        metadata={**doc.metadata, "heading_path": heading_path},
+                    ))
+        return chunks
+
+    def _sections(self, text: str) -> List[tuple]:
+        """(headings, body) of each section, in document order."""
+        return [
+            ([section.metadata[key] for _, key in HEADERS_TO_SPLIT_ON if key in section.metadata], section.page_content)
+            for section in self.header_splitter.split_text(text)
+        ]
+
+    def _merge_short_sections(self, sections: List[tuple]) -> List[tuple]:
+        merged = []
+        pending = None
+        for headings, body in sections:
+            if pending and headings[:len(pending[0])] == pending[0]:
+                body = f"{pending[1]}\n\n{body}"
+            elif pending:
+                merged.append(pending)
+            pending = None
+            if len(body) < self.min_section_size:
+                pending = (headings, body)
+            else:
+                merged.append((headings, body))
+        if pending:
+            merged.append(pending)
+        return merged
@@ -1,15 +1,27 @@
-from importlib import metadata
 import os
+import re
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import lru_cache
 from glob import glob
-from typing import List
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
 from dotenv import load_dotenv
 from langchain.schema import Document
 from langchain_pinecone import PineconeVectorStore
 from langchain_openai.embeddings import OpenAIEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from repositories.documents.medical_documents import get_medical_documents
+from repositories.documents.medical_documents import DEFAULT_SPECIALTY, get_document_metadata
+from repositories.lexical_index import BM25Index
+from repositories.markdown_splitter import HEADING_PATH_SEPARATOR, MarkdownSectionSplitter
+from repositories.vector_index import QuantizedVectorIndex
+from utils.http_clients import HTTP_POOL_SIZE, openai_client_options, request_timeout
+from utils.instrumentation import InstrumentedEmbeddings, record_cache
+from utils.logger import get_logger
 from pinecone import Pinecone, ServerlessSpec
 
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
 load_dotenv()
 
 host = os.getenv("PINECONE_HOST")
@@ -22,83 +34,329 @@ assert index_name, "Missing PINECONE_INDEX_NAME env variable"
 BASE_DIR = os.path.dirname(__file__)
 docs_folder_path = os.path.join(BASE_DIR, "documents")
 
+# Embedding size of text-embedding-3-large, shorter embeddings need an index created with the same dimension
+EMBEDDING_DIMENSIONS = int(os.getenv("KNOWLEDGE_BASE_EMBEDDING_DIMENSIONS", "3072"))
+# Vector search backend: "pinecone" or "local" (quantized in-memory index over the local documents)
+VECTOR_BACKEND = os.getenv("KNOWLEDGE_BASE_VECTOR_BACKEND", "pinecone")
+# Vectors of the local index: "float32", "int8" or "binary"
+QUANTIZATION = os.getenv("KNOWLEDGE_BASE_QUANTIZATION", "int8")
+# Candidates of the quantized search re-ranked with float vectors, as a multiple of top_k
+RERANK_FACTOR = int(os.getenv("KNOWLEDGE_BASE_RERANK_FACTOR", "4"))
+# Max seconds to wait for the vector store before falling back to lexical results
+VECTOR_SEARCH_TIMEOUT_SEC = float(os.getenv("KNOWLEDGE_BASE_VECTOR_TIMEOUT_SEC", "3.0"))
+# Rank constant of reciprocal rank fusion
+RRF_K = 60
+# Store the chunks of each specialty in its own namespace, queries without a namespace search all of them
+NAMESPACE_BY_SPECIALTY = os.getenv("KNOWLEDGE_BASE_NAMESPACE_BY_SPECIALTY", "false").lower() == "true"
+# Namespaces searched by a hybrid search without a namespace: the specialties of the best lexical matches
+HYBRID_SEARCH_MAX_NAMESPACES = int(os.getenv("KNOWLEDGE_BASE_HYBRID_MAX_NAMESPACES", "2"))
+
+# Sections longer than this (in characters) are split in several chunks
+CHUNK_SIZE = int(os.getenv("KNOWLEDGE_BASE_CHUNK_SIZE", "2000"))
+# Sections shorter than this (e.g. the introduction of a heading with subsections) are merged with the next one
+MIN_SECTION_SIZE = int(os.getenv("KNOWLEDGE_BASE_MIN_SECTION_SIZE", "400"))
+
+# Section of a chunk, from the innermost heading of its heading path matching one of these patterns
+SECTION_PATTERNS = [
+    ("primary_symptoms", re.compile(r"primary symptoms|classic presentation", re.IGNORECASE)),
+    ("secondary_symptoms", re.compile(r"secondary symptoms|associated signs", re.IGNORECASE)),
+    ("atypical_symptoms", re.compile(r"atypical", re.IGNORECASE)),
+    ("symptoms", re.compile(r"symptoms|clinical presentation|clinical manifestations", re.IGNORECASE)),
+    ("treatment", re.compile(r"management|urgency", re.IGNORECASE)),
+    ("causes", re.compile(r"etiology|pathophysiology|types|defining", re.IGNORECASE)),
+    ("overview", re.compile(r"introduction|conclusion", re.IGNORECASE)),
+]
+DEFAULT_SECTION = "overview"
+
+vector_search_executor = ThreadPoolExecutor(max_workers=4)
+# separate pool, the namespace queries are submitted from vector_search_executor tasks
+namespace_search_executor = ThreadPoolExecutor(max_workers=8)
+
+
+@lru_cache(maxsize=1)
+def get_lexical_index() -> BM25Index:
+    """Build the BM25 index over the local document chunks once per instance."""
+    chunks = MedicalKnowledgeRepository.split_documents(MedicalKnowledgeRepository.read_local_documents())
+    logger.info("built lexical index with %d chunks", len(chunks))
+    return BM25Index(chunks)
+
+
+def cached(builder: Callable[[], T]) -> T:
+    """
+    Value of an lru_cache builder, recording a cache miss in the stage metrics
+    when the call built it and a hit otherwise.
+    """
+    misses = builder.cache_info().misses
+    value = builder()
+    record_cache(hit=builder.cache_info().misses == misses)
+    return value
+
+
+def build_knowledge_embeddings() -> InstrumentedEmbeddings:
+    # chunks and queries are far below the input limit of the model, they aren't split
+    # by tokens, which would load a tiktoken encoding
+    return InstrumentedEmbeddings(OpenAIEmbeddings(
+        model="text-embedding-3-large",
+        dimensions=EMBEDDING_DIMENSIONS,
+        check_embedding_ctx_length=False,
+        **openai_client_options(),
+    ))
+
+
+@lru_cache(maxsize=1)
+def get_vectorstore() -> PineconeVectorStore:
+    """
+    Vector store shared by the repositories of the instance, so the searches reuse
+    the keep-alive connections of its index client, sized for the parallel
+    searches (namespace fan-out of concurrent sessions). The Pinecone client
+    retries 5xx responses itself.
+    """
+    index = Pinecone(api_key=api_key).Index(host=host, connection_pool_maxsize=HTTP_POOL_SIZE)
+    return PineconeVectorStore(index=index, embedding=build_knowledge_embeddings())
+
+
+@lru_cache(maxsize=1)
+def get_local_vector_index() -> QuantizedVectorIndex:
+    """Embed the local document chunks and build the quantized index once per instance."""
+    chunks = MedicalKnowledgeRepository.split_documents(MedicalKnowledgeRepository.read_local_documents())
+    vectors = build_knowledge_embeddings().embed_documents([chunk.page_content for chunk in chunks])
+    index = QuantizedVectorIndex(chunks, vectors, QUANTIZATION, RERANK_FACTOR)
+    logger.info(
+        "built %s vector index with %d chunks of %d dimensions (%d bytes)",
+        QUANTIZATION, len(chunks), index.dimensions, index.code_bytes,
+    )
+    return index
+
+
+def reciprocal_rank_fusion(*rankings: List[Document], k: int = RRF_K) -> List[Tuple[Document, float]]:
+    """Merge rankings of documents, scoring each one by the sum of 1 / (k + rank)."""
+    scores: Dict[Tuple[str, str], float] = {}
+    documents: Dict[Tuple[str, str], Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = (doc.metadata.get("disease_name"), doc.page_content)
+            documents.setdefault(key, doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    return [(documents[key], score) for key, score in ranked]
+
+
+def document_metadata(disease_name: str) -> dict:
+    """Metadata of a knowledge base document: disease name, topic, urgency and specialty."""
+    metadata = get_document_metadata().get(disease_name)
+    if metadata is None:
+        logger.warning("no topic and urgency found for document: %s", disease_name)
+        metadata = {"topic": disease_name, "urgency": "unknown", "specialty": DEFAULT_SPECIALTY}
+    return {"disease_name": disease_name, **metadata}
+
+
+def section_of(headings: List[str]) -> str:
+    """Section of a chunk from its heading path, e.g. `primary_symptoms` or `treatment`."""
+    for heading in reversed(headings):
+        for section, pattern in SECTION_PATTERNS:
+            if pattern.search(heading):
+                return section
+    return DEFAULT_SECTION
+
+
+@lru_cache(maxsize=1)
+def knowledge_base_namespaces() -> List[str]:
+    """Namespaces holding the knowledge base chunks: the specialties of the loaded documents."""
+    if not NAMESPACE_BY_SPECIALTY:
+        return [""]
+    return sorted({doc.metadata["specialty"] for doc in MedicalKnowledgeRepository.read_local_documents()})
+
+
+def namespace_filter(filter: Optional[dict], namespace: Optional[str]) -> Optional[dict]:
+    """Metadata filter equivalent to searching a namespace, for the lexical index."""
+    if not namespace:
+        return filter
+    specialty = {"specialty": {"$eq": namespace}}
+    return {"$and": [filter, specialty]} if filter else specialty
+
 
 class MedicalKnowledgeRepository:
-    def __init__(self) -> None:
-        self.embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
-        self.vectorstore = PineconeVectorStore(
-            index_name=index_name, embedding=self.embeddings, host=host
-        )
+    def __init__(self, vector_backend: str = VECTOR_BACKEND) -> None:
+        self.vector_backend = vector_backend
+        self.vectorstore = get_vectorstore()
+        self.embeddings = self.vectorstore.embeddings
 
     def load_documents(self):
         """Populate the medical knowledge base with documents."""
         try:
-            print("loading documents")
+            logger.info("loading documents")
             docs = self.read_local_documents()
 
             pc = Pinecone()
 
             if index_name not in pc.list_indexes().names():
-                print(f"creating index {index_name}")
+                logger.info("creating index %s", index_name)
                 pc.create_index(
                     name=index_name,
-                    dimension=3072,  # matches OpenAI text-embedding-3-large
+                    dimension=EMBEDDING_DIMENSIONS,  # matches the OpenAI text-embedding-3-large embeddings
                     metric="cosine",
                     spec=ServerlessSpec(cloud="aws", region="us-east-1"),
                 )
-                self.vectorstore = PineconeVectorStore(
-                    index_name=index_name, embedding=self.embeddings, host=host
-                )
-            print("creating splitter")
-            splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000, chunk_overlap=150
-            )
-            print("generating chunks and adding to vectorstore")
+            logger.info("generating chunks and adding to vectorstore")
             for doc in docs:
-                chunks = splitter.split_documents([doc])
-                self.vectorstore.add_documents(chunks)
-                print(
-                    f"Inserted: {doc.metadata['disease_name']} ({len(chunks)} chunks)"
-                )
+                chunks = self.split_documents([doc])
+                namespace = doc.metadata["specialty"] if NAMESPACE_BY_SPECIALTY else None
+                self.vectorstore.add_documents(chunks, namespace=namespace, _request_timeout=request_timeout())
+                logger.info("inserted: %s (%d chunks, namespace %s)", doc.metadata["disease_name"], len(chunks), namespace or "default")
         except Exception as e:
-            print(f"error when trying to add documents to vectorstore: {e}")
+            logger.exception("error when trying to add documents to vectorstore: %s", e)
+
+    @staticmethod
+    def split_documents(docs: List[Document]) -> List[Document]:
+        """
+        Split documents into the chunks stored in the vector store and the lexical index.
+
+        Each chunk is a section of the document and keeps its metadata, with the
+        heading path and the section it belongs to.
+        """
+        chunks = MarkdownSectionSplitter(CHUNK_SIZE, MIN_SECTION_SIZE).split_documents(docs)
+        for chunk in chunks:
+            chunk.metadata["section"] = section_of(chunk.metadata["heading_path"].split(HEADING_PATH_SEPARATOR))
+        return chunks
 
-    def read_local_documents(self):
-        print("reading documents locally")
+    @staticmethod
+    def read_local_documents():
+        logger.debug("reading documents locally")
         docs = []
         for file_path in glob(os.path.join(docs_folder_path, "*.md")):
             with open(file_path, "r", encoding="utf-8") as f:
                 text = f.read()
             disease_name = os.path.splitext(os.path.basename(file_path))[0]
-            docs.append(Document(page_content=text, metadata={"disease_name": disease_name}))
-        print(f"Loaded {len(docs)} markdown documents from {docs_folder_path}")
+            docs.append(Document(page_content=text, metadata=document_metadata(disease_name)))
+        logger.info("loaded %d markdown documents from %s", len(docs), docs_folder_path)
         return docs
 
     def get_index_stats(self):
         """Verify if vector store exists"""
         index = self.vectorstore.get_pinecone_index(index_name)
         if not index:
-            print("index does not exist")
+            logger.warning("index does not exist")
             return None
         stats = index.describe_index_stats()
         return {
             "dimension": stats.dimension,
             "index_fullness": stats.index_fullness,
             "total_vector_count": stats.total_vector_count,
+            "namespaces": {name: summary.vector_count for name, summary in stats.namespaces.items()},
         }
 
-    def similarity_search(self, query: str, top_k=10) -> List[Document]:
-        """Search the medical knowledge base for relevant documents."""
-        docs = self.vectorstore.similarity_search(query=query, k=top_k)
+    def similarity_search(
+        self, query: str, top_k=10, filter: Optional[dict] = None, namespace: Optional[str] = None
+    ) -> List[Document]:
+        """
+        Search the medical knowledge base for relevant documents.
+
+        `filter` is a Pinecone metadata filter on `disease_name`, `topic`, `urgency`,
+        `specialty` or `section`, e.g. `{"section": {"$in": ["primary_symptoms", "secondary_symptoms"]}}`.
+        """
+        docs = [doc for doc, _ in self.similarity_search_with_score(query, top_k, filter, namespace)]
         sorted_docs = sorted(docs, key=lambda d: d.metadata.get('disease_name'))
         return sorted_docs
 
-    def retrieve_full_docs(self, query: str, top_k=3) -> List[Document]:
-        retriever = self.vectorstore.as_retriever(search_kwargs={"k": top_k})
-        matches = retriever.invoke(query)
+    def similarity_search_with_score(
+        self,
+        query: str,
+        top_k=10,
+        filter: Optional[dict] = None,
+        namespace: Optional[str] = None,
+        namespaces: Optional[List[str]] = None,
+    ) -> List[Tuple[Document, float]]:
+        """
+        Search the medical knowledge base, returning each document with its similarity score.
+
+        Without a namespace, the `namespaces` (every namespace by default) are
+        searched and the best matches are kept.
+        """
+        if self.vector_backend == "local":
+            if not namespace and namespaces:
+                filter = {"$and": [filter, {"specialty": {"$in": namespaces}}]} if filter else {"specialty": {"$in": namespaces}}
+            return cached(get_local_vector_index).search(
+                self.embeddings.embed_query(query), top_k, namespace_filter(filter, namespace)
+            )
+
+        namespaces = [namespace] if namespace else namespaces or knowledge_base_namespaces()
+        if len(namespaces) == 1:
+            return self.vectorstore.similarity_search_with_score(
+                query=query, k=top_k, filter=filter, namespace=namespaces[0] or None
+            )
+
+        # embed once and query the namespaces in parallel
+        embedding = self.embeddings.embed_query(query)
+        futures = [
+            namespace_search_executor.submit(
+                contextvars.copy_context().run,
+                self.vectorstore.similarity_search_by_vector_with_score,
+                embedding, k=top_k, filter=filter, namespace=name,
+            )
+            for name in namespaces
+        ]
+        results = [result for future in futures for result in future.result()]
+        return sorted(results, key=lambda result: result[1], reverse=True)[:top_k]
+
+    def lexical_search(
+        self, query: str, top_k=10, filter: Optional[dict] = None, namespace: Optional[str] = None
+    ) -> List[Tuple[Document, float]]:
+        """Search the local BM25 index of the medical knowledge base."""
+        return cached(get_lexical_index).search(query, top_k=top_k, filter=namespace_filter(filter, namespace))
+
+    def hybrid_search_with_score(
+        self, query: str, top_k=10, filter: Optional[dict] = None, namespace: Optional[str] = None
+    ) -> List[Tuple[Document, float]]:
+        """
+        Search the knowledge base combining BM25 and vector search with reciprocal rank fusion.
+
+        The lexical results are returned alone when the vector store fails or
+        doesn't answer within VECTOR_SEARCH_TIMEOUT_SEC.
+        """
+        return self.hybrid_search(query, top_k, filter, namespace)[0]
+
+    def hybrid_search(
+        self, query: str, top_k=10, filter: Optional[dict] = None, namespace: Optional[str] = None
+    ) -> Tuple[List[Tuple[Document, float]], bool]:
+        """
+        `hybrid_search_with_score`, along with whether the vector search answered.
+
+        With a namespace per specialty, a search without a namespace only queries the
+        namespaces of the specialties of the best lexical matches (at most
+        HYBRID_SEARCH_MAX_NAMESPACES), or every namespace when nothing matched lexically.
+        """
+        lexical_docs = [doc for doc, _ in self.lexical_search(query, top_k, filter, namespace)]
+        namespaces = None
+        if NAMESPACE_BY_SPECIALTY and not namespace and lexical_docs:
+            specialties = dict.fromkeys(doc.metadata.get("specialty", DEFAULT_SPECIALTY) for doc in lexical_docs)
+            namespaces = list(specialties)[:HYBRID_SEARCH_MAX_NAMESPACES]
+
+        # run in a copy of the current context so the stage metrics are still recorded
+        vector_future = vector_search_executor.submit(
+            contextvars.copy_context().run, self.similarity_search_with_score, query, top_k, filter, namespace, namespaces
+        )
+
+        vector_answered = False
+        try:
+            vector_docs = [doc for doc, _ in vector_future.result(timeout=VECTOR_SEARCH_TIMEOUT_SEC)]
+            vector_answered = True
+        except FutureTimeoutError:
+            logger.warning("vector search timed out after %ss, using lexical results", VECTOR_SEARCH_TIMEOUT_SEC)
+            vector_docs = []
+        except Exception as e:
+            logger.warning("vector search failed, using lexical results: %s", e)
+            vector_docs = []
+
+        return reciprocal_rank_fusion(vector_docs, lexical_docs)[:top_k], vector_answered
+
+    def retrieve_full_docs(
+        self, query: str, top_k=3, filter: Optional[dict] = None, namespace: Optional[str] = None
+    ) -> List[Document]:
+        matches = [doc for doc, _ in self.similarity_search_with_score(query, top_k, filter, namespace)]
 
-        # Collect unique disease_names from matches
-        disease_names = {m.metadata["disease_name"] for m in matches}
+        # Collect unique disease_names from matches, best match first
+        disease_names = list(dict.fromkeys(m.metadata["disease_name"] for m in matches))
 
         # Load full documents from filesystem based on disease_names
         full_docs = []
@@ -109,10 +367,10 @@ class MedicalKnowledgeRepository:
                     full_docs.append(
                         Document(
                             page_content=f.read(),
-                            metadata={"disease_name": disease_name},
+                            metadata=document_metadata(disease_name),
                         )
                     )
             else:
-                print(f"Warning: Document file not found for disease: {disease_name}")
+                logger.warning("document file not found for disease: %s", disease_name)
 
         return full_docs
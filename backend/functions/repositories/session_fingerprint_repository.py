@@ -0,0 +1,147 @@
+import hashlib
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional, Union
+from firebase_admin import firestore
+from models.clinical_record import ReportStatus
+from models.queue import QueueStatus
+from models.session_fingerprint import FingerprintKind, SessionFingerprint
+from models.transcription import Transcription, TranscriptionStatus
+from repositories.session_state import set_document
+from utils.instrumentation import record_firestore_read
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Seconds during which a repeated submission returns the session already processing
+# the same content. Set to 0 to disable the deduplication.
+SESSION_DEDUP_WINDOW_SEC = float(os.getenv("SESSION_DEDUP_WINDOW_SEC", "600"))
+# Seconds a registered session has to create its first document, which is written right after the
+# registration (the upload trigger registers the audio once hashed). After that a session without
+# documents was abandoned, e.g. the write failed, and the content can be submitted again.
+SESSION_REGISTRATION_GRACE_SEC = float(os.getenv("SESSION_REGISTRATION_GRACE_SEC", "60"))
+
+FAILED_STATUSES = {
+    TranscriptionStatus.TRANSCRIPTION_ERROR.value,
+    TranscriptionStatus.INFORMATION_EXTRACTION_ERROR.value,
+    TranscriptionStatus.DIAGNOSIS_ERROR.value,
+}
+
+
+def hash_content(kind: FingerprintKind, content: Union[str, bytes]) -> str:
+    """
+    Hash a submitted content. Whitespace is normalized in texts so that the
+    same transcription pasted twice gets the same hash.
+    """
+    if isinstance(content, str):
+        content = " ".join(content.split()).encode("utf-8")
+    return hash_chunks(kind, [content])
+
+
+def hash_chunks(kind: FingerprintKind, chunks: Iterable[bytes]) -> str:
+    """Hash a content read in chunks (e.g. an uploaded file), equal to `hash_content` of the whole content."""
+    digest = hashlib.sha256(kind.value.encode("utf-8") + b":")
+    for chunk in chunks:
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _session_failed(transaction, db, fingerprint: SessionFingerprint, now: datetime) -> bool:
+    """
+    Whether the session of a fingerprint failed, or was abandoned without any
+    document once the registration grace period is over.
+    """
+    transcription = db.collection("transcriptions").document(fingerprint.session_id).get(transaction=transaction)
+    if transcription.exists:
+        return transcription.to_dict().get("status") in FAILED_STATUSES
+    queue = db.collection("queue").document(fingerprint.session_id).get(transaction=transaction)
+    if queue.exists:
+        return queue.to_dict().get("status") == QueueStatus.ERROR.value
+    return fingerprint.registered_at < now - timedelta(seconds=SESSION_REGISTRATION_GRACE_SEC)
+
+
+@firestore.transactional
+def _find_or_register(transaction, db, fingerprint: SessionFingerprint) -> Optional[str]:
+    doc_ref = db.collection("session_fingerprints").document(fingerprint.content_hash)
+    snapshot = doc_ref.get(transaction=transaction)
+    if snapshot.exists:
+        current = SessionFingerprint(**snapshot.to_dict())
+        window_start = fingerprint.registered_at - timedelta(seconds=SESSION_DEDUP_WINDOW_SEC)
+        if current.registered_at > window_start and not _session_failed(transaction, db, current, fingerprint.registered_at):
+            return current.session_id
+
+    transaction.set(doc_ref, fingerprint.model_dump())
+    return None
+
+
+def find_or_register_session(kind: FingerprintKind, content: Union[str, bytes], session_id: str) -> Optional[str]:
+    """
+    Look up the session that processed the same content within the dedup window.
+
+    The lookup and the registration of `session_id` run in a transaction, so
+    concurrent submissions of the same content (e.g. a double click) resolve
+    to a single session. Sessions that failed are not returned.
+
+    Returns:
+        The ID of the existing session, or None if `session_id` was registered for the content
+    """
+    return find_or_register_hash(kind, hash_content(kind, content), session_id)
+
+
+def find_or_register_hash(kind: FingerprintKind, content_hash: str, session_id: str) -> Optional[str]:
+    """`find_or_register_session` for a content hashed beforehand, see `hash_chunks`."""
+    if SESSION_DEDUP_WINDOW_SEC <= 0:
+        return None
+    db = firestore.client()
+    fingerprint = SessionFingerprint(
+        content_hash=content_hash,
+        kind=kind,
+        session_id=session_id,
+        registered_at=datetime.now(timezone.utc),
+    )
+    existing_session_id = _find_or_register(db.transaction(), db, fingerprint)
+    record_firestore_read()
+    if existing_session_id:
+        logger.info("%s already submitted in session %s", kind.value, existing_session_id)
+    return existing_session_id
+
+
+def clone_finished_session(source_session_id: str, session_id: str, audio_url: Optional[str] = None) -> Optional[Transcription]:
+    """
+    Copy the transcription and clinical record of a finished session into `session_id`.
+    The copies are saved as finished, so the triggers fired by their creation skip them.
+
+    Returns:
+        The cloned transcription, or None if the source session didn't finish
+    """
+    db = firestore.client()
+    source_transcription = db.collection("transcriptions").document(source_session_id).get()
+    source_clinical_record = db.collection("clinical_record").document(source_session_id).get()
+    record_firestore_read(2)
+    if not source_transcription.exists or not source_clinical_record.exists:
+        return None
+    transcription_data = source_transcription.to_dict()
+    clinical_record_data = source_clinical_record.to_dict()
+    if transcription_data.get("status") != TranscriptionStatus.DIAGNOSIS_FINISHED.value:
+        return None
+    if clinical_record_data.get("report_status") != ReportStatus.COMPLETED.value:
+        return None
+
+    transcription_data.pop("metrics", None)
+    transcription_data.update({
+        "session_id": session_id,
+        "audio_url": audio_url,
+        "source_session_id": source_session_id,
+        "created_at": firestore.SERVER_TIMESTAMP,
+        "updated_at": firestore.SERVER_TIMESTAMP,
+    })
+    clinical_record_data.update({
+        "session_id": session_id,
+        "created_at": firestore.SERVER_TIMESTAMP,
+        "updated_at": firestore.SERVER_TIMESTAMP,
+    })
+    set_document(db.collection("transcriptions").document(session_id), transcription_data)
+    set_document(db.collection("clinical_record").document(session_id), clinical_record_data)
+    logger.info("cloned session %s into %s", source_session_id, session_id)
+
+    return Transcription(**{**transcription_data, "created_at": None, "updated_at": None})
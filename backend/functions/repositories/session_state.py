@@ -0,0 +1,123 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+from firebase_admin import firestore
+from utils.instrumentation import record_firestore_write
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def expand_field_paths(data: dict) -> dict:
+    """Convert dotted field paths (`metrics.diagnosis`) into nested maps, as expected by `set`."""
+    expanded: dict = {}
+    for field_path, value in data.items():
+        *parents, leaf = field_path.split(".")
+        target = expanded
+        for part in parents:
+            target = target.setdefault(part, {})
+        target[leaf] = value
+    return expanded
+
+
+def merge_nested(target: dict, source: dict) -> dict:
+    for key, value in source.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            merge_nested(target[key], value)
+        else:
+            target[key] = value
+    return target
+
+
+class PendingWrite:
+    def __init__(self, doc_ref, operation: str, data: dict) -> None:
+        self.doc_ref = doc_ref
+        self.operation = operation
+        self.data = data
+
+    def merge(self, operation: str, data: dict) -> None:
+        if operation == "set":
+            # a set replaces whatever was pending for the document
+            self.operation, self.data = "set", dict(data)
+        elif self.operation == "set":
+            merge_nested(self.data, expand_field_paths(data))
+        else:
+            self.data.update(data)
+
+
+class SessionStateManager:
+    """
+    Buffer the document writes of a pipeline stage and commit them in a single batch.
+
+    Writes to the same document are coalesced into one operation, so a stage
+    that saves its payload, its final status and its metrics costs one write
+    per document instead of one per call.
+    """
+    def __init__(self) -> None:
+        self.pending: Dict[str, PendingWrite] = {}
+
+    def add(self, doc_ref, operation: str, data: dict) -> None:
+        pending = self.pending.get(doc_ref.path)
+        if pending:
+            pending.merge(operation, data)
+        else:
+            self.pending[doc_ref.path] = PendingWrite(doc_ref, operation, dict(data))
+
+    def has_pending(self, doc_ref) -> bool:
+        return doc_ref.path in self.pending
+
+    def write_count(self) -> int:
+        """Number of document writes the commit will perform."""
+        return len(self.pending)
+
+    def commit(self) -> None:
+        if not self.pending:
+            return
+        batch = firestore.client().batch()
+        for pending in self.pending.values():
+            if pending.operation == "set":
+                batch.set(pending.doc_ref, pending.data)
+            else:
+                batch.update(pending.doc_ref, pending.data)
+        batch.commit()
+        logger.debug("committed %d coalesced document writes", len(self.pending))
+        self.pending = {}
+
+
+current_session_state: ContextVar[Optional[SessionStateManager]] = ContextVar("current_session_state", default=None)
+
+
+@contextmanager
+def buffered_writes() -> Iterator[SessionStateManager]:
+    """
+    Buffer the writes made through `set_document`/`update_document` inside the block.
+    The buffer is committed when the block exits, also when it raises, so the
+    writes made before an error are kept.
+    """
+    manager = SessionStateManager()
+    token = current_session_state.set(manager)
+    try:
+        yield manager
+    finally:
+        current_session_state.reset(token)
+        manager.commit()
+
+
+def set_document(doc_ref, data: dict, immediate: bool = False) -> None:
+    """Set a document, buffered when called inside `buffered_writes` unless `immediate`."""
+    manager = current_session_state.get()
+    if manager and not immediate:
+        manager.add(doc_ref, "set", data)
+        return
+    doc_ref.set(data)
+    record_firestore_write()
+
+
+def update_document(doc_ref, data: dict, immediate: bool = False) -> None:
+    """Update a document, buffered when called inside `buffered_writes` unless `immediate`."""
+    manager = current_session_state.get()
+    if manager and not immediate:
+        manager.add(doc_ref, "update", data)
+        return
+    doc_ref.update(data)
+    record_firestore_write()
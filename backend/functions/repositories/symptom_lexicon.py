@@ -0,0 +1,136 @@
+import os
+import re
+from functools import lru_cache
+from glob import glob
+from typing import Dict, List, Optional, Tuple
+from langchain.schema import Document
+
+DOCUMENTS_FOLDER = os.path.join(os.path.dirname(__file__), "documents")
+
+SYMPTOM_SECTION_PATTERN = re.compile(r"symptom|manifestation|presentation", re.IGNORECASE)
+EXCLUDED_SECTION_PATTERN = re.compile(r"atypical", re.IGNORECASE)
+HEADING_PATTERN = re.compile(r"^(#{2,6})\s+(.*)$")
+# top level bullets only, nested bullets describe the symptom
+BULLET_TERM_PATTERN = re.compile(r"^[*-]\s+\*\*(.+?)\*\*")
+PARENTHESIS_PATTERN = re.compile(r"\(([^)]*)\)")
+TERM_SEPARATOR_PATTERN = re.compile(r"\s+(?:and|or)\s+|/|,")
+QUALIFIER_PATTERN = re.compile(r"^(?:increased|decreased|signs of|severe|mild)\s+")
+
+# Bullets of symptom sections that describe the presentation instead of naming a symptom
+EXCLUDED_TERMS = {"pain quality", "location", "intensity", "radiation of pain", "duration", "discomfort", "neurological symptoms"}
+
+# How patients usually describe the symptoms named in the documents
+COLLOQUIAL_ALIASES = {
+    "short of breath": "shortness of breath",
+    "out of breath": "shortness of breath",
+    "hard to breathe": "shortness of breath",
+    "nauseous": "nausea",
+    "throwing up": "vomiting",
+    "threw up": "vomiting",
+    "vomited": "vomiting",
+    "sweaty": "sweating",
+    "dizzy": "dizziness",
+    "lightheaded": "lightheadedness",
+    "tired": "fatigue",
+    "exhausted": "fatigue",
+    "feverish": "fever",
+    "chills": "chills",
+    "stomach ache": "abdominal pain",
+    "stomach pain": "abdominal pain",
+    "belly pain": "abdominal pain",
+    "chest pain": "chest pain",
+    "headache": "headache",
+    "sore throat": "sore throat",
+    "body aches": "myalgia",
+    "muscle aches": "myalgia",
+    "no appetite": "anorexia",
+    "loss of appetite": "anorexia",
+    "racing heart": "palpitations",
+    "heart racing": "palpitations",
+}
+
+
+class SymptomLexicon:
+    """
+    Symptom vocabulary, mapping each surface form to the symptom it names.
+    Surface forms are matched with a single compiled regex, longest first.
+    """
+    def __init__(self, terms: Dict[str, str]) -> None:
+        self.terms = terms
+        alternatives = sorted(terms, key=len, reverse=True)
+        self.pattern = re.compile(
+            r"\b(" + "|".join(re.escape(term) for term in alternatives) + r")(?:e?s)?\b",
+            re.IGNORECASE,
+        )
+
+    def find(self, text: str) -> List[Tuple[str, re.Match]]:
+        """Find the symptoms named in the text, with the match of their surface form."""
+        return [(self.terms[match.group(1).lower()], match) for match in self.pattern.finditer(text)]
+
+
+def _clean_term(term: str) -> Optional[str]:
+    term = term.strip().strip(":").strip().strip('"').lower()
+    while QUALIFIER_PATTERN.match(term):
+        term = QUALIFIER_PATTERN.sub("", term)
+    if not term or term in EXCLUDED_TERMS or term.startswith("no ") or len(term.split()) > 4:
+        return None
+    return term
+
+
+def extract_symptom_terms(document: Document) -> Dict[str, str]:
+    """
+    Read the symptom names from the bullets of the symptom sections of a markdown document.
+    Parenthesized and `and`/`or` separated names are split, parenthesized ones
+    are synonyms of the main name (e.g. `Dyspnea (Shortness of Breath)`).
+    """
+    terms: Dict[str, str] = {}
+    in_symptom_section = False
+    for line in document.page_content.splitlines():
+        heading = HEADING_PATTERN.match(line)
+        if heading:
+            title = heading.group(2)
+            if SYMPTOM_SECTION_PATTERN.search(title):
+                in_symptom_section = not EXCLUDED_SECTION_PATTERN.search(title)
+            elif len(heading.group(1)) == 2:
+                # a new top level section ends the symptoms, subsections inherit them
+                in_symptom_section = False
+            continue
+        if not in_symptom_section:
+            continue
+        bullet = BULLET_TERM_PATTERN.match(line)
+        if not bullet:
+            continue
+
+        label = bullet.group(1)
+        synonyms = PARENTHESIS_PATTERN.findall(label)
+        names = [_clean_term(name) for name in TERM_SEPARATOR_PATTERN.split(PARENTHESIS_PATTERN.sub("", label))]
+        names = [name for name in names if name]
+        for index, name in enumerate(names):
+            terms.setdefault(name, name)
+            if index == 0:
+                for synonym in synonyms:
+                    for synonym_name in TERM_SEPARATOR_PATTERN.split(synonym):
+                        synonym_name = _clean_term(synonym_name)
+                        if synonym_name:
+                            terms.setdefault(synonym_name, name)
+    return terms
+
+
+def build_symptom_lexicon(documents: List[Document]) -> SymptomLexicon:
+    terms: Dict[str, str] = {}
+    for document in documents:
+        for term, symptom in extract_symptom_terms(document).items():
+            terms.setdefault(term, symptom)
+    for alias, symptom in COLLOQUIAL_ALIASES.items():
+        terms.setdefault(alias, terms.get(symptom, symptom))
+    return SymptomLexicon(terms)
+
+
+@lru_cache(maxsize=1)
+def get_symptom_lexicon() -> SymptomLexicon:
+    """Lexicon built from the markdown documents of the knowledge base, once per instance."""
+    documents = []
+    for file_path in sorted(glob(os.path.join(DOCUMENTS_FOLDER, "*.md"))):
+        with open(file_path, "r", encoding="utf-8") as f:
+            documents.append(Document(page_content=f.read()))
+    return build_symptom_lexicon(documents)
@@ -1,10 +1,17 @@
+from typing import List, Optional
 from firebase_admin import firestore
+from google.api_core.exceptions import NotFound
 from models.transcription import Transcription, TranscriptionStatus
+from repositories.session_state import current_session_state, set_document, update_document
+from utils.instrumentation import record_firestore_read
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
 
 
 def save_transcription(transcription: Transcription):
     # Save transcription to Firestore to trigger information extraction
-    print(f"Saving transcription for session {transcription.session_id}")
+    logger.debug("saving transcription for session %s", transcription.session_id)
 
     db = firestore.client()
 
@@ -13,20 +20,28 @@ def save_transcription(transcription: Transcription):
     # Convert Pydantic model to dict and add server timestamp
     transcription_dict = transcription.model_dump()
     transcription_dict["created_at"] = firestore.SERVER_TIMESTAMP
-    doc_ref.set(transcription_dict)
+    set_document(doc_ref, transcription_dict)
+
+    logger.info("transcription saved to Firestore for session: %s", transcription.session_id)
 
-    print(
-        f"Transcription saved to Firestore for session: {transcription.session_id}"
-    )
+def get_transcription_by_session_id(session_id: str, fields: Optional[List[str]] = None) -> dict:
+    """
+    Retrieve transcription data from Firestore by session_id.
 
-def get_transcription_by_session_id(session_id: str) -> dict:
-    """Retrieve transcription data from Firestore by session_id."""
+    Args:
+        session_id: The unique session identifier
+        fields: Optional list of top-level fields to read. When provided, only
+            these fields are fetched from Firestore.
+    """
     # Query the transcriptions collection for the given session_id
     db = firestore.client()
 
     transcriptions_ref = db.collection("transcriptions")
     query = transcriptions_ref.where("session_id", "==", session_id)
+    if fields:
+        query = query.select(fields)
     docs = query.stream()
+    record_firestore_read()
     
     # Get the first (and should be only) document
     transcription_doc = None
@@ -48,12 +63,35 @@ def get_transcription_by_session_id(session_id: str) -> dict:
     
     return transcription_data
 
-def set_processing_status(session_id: str, status: TranscriptionStatus, error_message: str = "") -> None:
+def set_processing_status(session_id: str, status: TranscriptionStatus, error_message: str = "", immediate: bool = False) -> None:
+    """
+    Update the processing status of the session.
+    Inside a pipeline stage the update is committed with the other writes of the
+    stage, use `immediate` for transitions that must be visible right away.
+    """
     db = firestore.client()
     doc_ref = db.collection('transcriptions').document(session_id)
-    doc_ref.update({
+    update_document(doc_ref, {
         "status": status.value,
         "error_message": error_message,
         "updated_at": firestore.SERVER_TIMESTAMP
-    })
-    print(f"Updated session {session_id}. Status: {status}")
\ No newline at end of file
+    }, immediate=immediate)
+    logger.info("updated session %s status: %s", session_id, status.value)
+
+def save_stage_metrics(session_id: str, stage: str, metrics: dict) -> None:
+    """
+    Save the metrics of a pipeline stage in the `metrics` map of the transcription document.
+    The metrics are merged into a pending write of the document when there is one,
+    so they don't cost a write of their own.
+    """
+    db = firestore.client()
+    doc_ref = db.collection('transcriptions').document(session_id)
+    session_state = current_session_state.get()
+    if session_state and session_state.has_pending(doc_ref):
+        session_state.add(doc_ref, "update", {f"metrics.{stage}": metrics})
+        return
+    try:
+        doc_ref.update({f"metrics.{stage}": metrics})
+    except NotFound:
+        # the transcription document is only created once the audio is transcribed
+        logger.warning("no transcription to save %s metrics for session %s", stage, session_id)
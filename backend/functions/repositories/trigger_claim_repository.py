@@ -0,0 +1,76 @@
+import os
+from datetime import datetime, timedelta, timezone
+from firebase_admin import firestore
+from models.trigger_claim import ClaimStatus, TriggerClaim
+from repositories.session_state import update_document
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Seconds after which a processing claim is considered abandoned (e.g. the instance
+# crashed) and can be taken over. Must be longer than the longest function timeout.
+CLAIM_LEASE_SEC = float(os.getenv("TRIGGER_CLAIM_LEASE_SEC", "600"))
+
+
+def _claim_ref(session_id: str, stage: str):
+    db = firestore.client()
+    return db.collection("trigger_claims").document(f"{session_id}_{stage}")
+
+
+@firestore.transactional
+def _claim_in_transaction(transaction, doc_ref, claim: TriggerClaim) -> bool:
+    snapshot = doc_ref.get(transaction=transaction)
+    if snapshot.exists:
+        current = TriggerClaim(**snapshot.to_dict())
+        if current.status == ClaimStatus.PROCESSING and current.lease_expires_at > datetime.now(timezone.utc):
+            # another execution is working on the stage
+            return False
+        if current.status == ClaimStatus.COMPLETED and current.event_id == claim.event_id:
+            # redelivery of an event that was already processed
+            return False
+
+    data = claim.model_dump()
+    data["claimed_at"] = firestore.SERVER_TIMESTAMP
+    transaction.set(doc_ref, data)
+    return True
+
+
+def claim_stage(session_id: str, stage: str, event_id: str) -> bool:
+    """
+    Claim a pipeline stage of a session for the event being processed.
+
+    Firestore triggers are delivered at least once, the claim is taken in a
+    transaction so a redelivered event, or a duplicate running concurrently,
+    is dropped before doing any work. A failed or abandoned claim can be taken
+    over by a retry.
+
+    Returns:
+        True if the stage was claimed and the event must be processed
+    """
+    db = firestore.client()
+    claim = TriggerClaim(
+        session_id=session_id,
+        stage=stage,
+        event_id=event_id,
+        lease_expires_at=datetime.now(timezone.utc) + timedelta(seconds=CLAIM_LEASE_SEC),
+    )
+    claimed = _claim_in_transaction(db.transaction(), _claim_ref(session_id, stage), claim)
+    if not claimed:
+        logger.info("dropping duplicate %s event %s for session %s", stage, event_id, session_id)
+    return claimed
+
+
+def complete_stage_claim(session_id: str, stage: str) -> None:
+    """Mark the claim as completed, committed with the other writes of the stage."""
+    update_document(_claim_ref(session_id, stage), {
+        "status": ClaimStatus.COMPLETED.value,
+        "updated_at": firestore.SERVER_TIMESTAMP
+    })
+
+
+def release_stage_claim(session_id: str, stage: str) -> None:
+    """Mark the claim as failed so a retry of the event can process the stage again."""
+    update_document(_claim_ref(session_id, stage), {
+        "status": ClaimStatus.FAILED.value,
+        "updated_at": firestore.SERVER_TIMESTAMP
+    }, immediate=True)
@@ -0,0 +1,92 @@
+from typing import List, Optional, Tuple
+import numpy as np
+from langchain.schema import Document
+from repositories.lexical_index import matches_filter
+
+QUANTIZATIONS = ("float32", "int8", "binary")
+# set bits of each byte value, to count the differing bits of binary codes
+POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint16)
+
+
+def reduce_dimensions(vectors: np.ndarray, dimensions: int) -> np.ndarray:
+    """
+    Keep the first `dimensions` components and renormalize, which is how the
+    `dimensions` parameter of the text-embedding-3 models shortens embeddings.
+    """
+    reduced = np.asarray(vectors, dtype=np.float32)[:, :dimensions]
+    return reduced / np.clip(np.linalg.norm(reduced, axis=1, keepdims=True), 1e-12, None)
+
+
+class QuantizedVectorIndex:
+    """
+    In-memory cosine similarity index over normalized embeddings, optionally
+    shortened to their first `dimensions` components.
+
+    With `int8` the vectors are scanned as one byte per dimension (scaled per
+    dimension), with `binary` as one bit per dimension (the sign, compared by
+    Hamming distance). The best `top_k * rerank_factor` candidates of the
+    quantized scan are re-ranked with the float vectors, so the scores returned
+    are exact cosine similarities.
+    """
+    def __init__(
+        self,
+        documents: List[Document],
+        vectors: np.ndarray,
+        quantization: str = "int8",
+        rerank_factor: int = 4,
+        dimensions: Optional[int] = None,
+    ) -> None:
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"unknown quantization: {quantization}")
+        self.documents = documents
+        self.quantization = quantization
+        self.rerank_factor = rerank_factor
+        self.vectors = reduce_dimensions(vectors, dimensions or np.shape(vectors)[1])
+
+        if quantization == "int8":
+            self.scales = np.clip(np.abs(self.vectors).max(axis=0), 1e-12, None) / 127
+            self.codes = np.round(self.vectors / self.scales).astype(np.int8)
+        elif quantization == "binary":
+            self.codes = np.packbits(self.vectors > 0, axis=1)
+        else:
+            self.codes = self.vectors
+
+    @property
+    def dimensions(self) -> int:
+        return self.vectors.shape[1]
+
+    @property
+    def code_bytes(self) -> int:
+        """Size of the vectors scanned on each search."""
+        return self.codes.nbytes
+
+    def search(
+        self, query_vector: List[float], top_k: int = 10, filter: Optional[dict] = None
+    ) -> List[Tuple[Document, float]]:
+        """Return the top_k documents most similar to the query with their cosine similarity."""
+        query = reduce_dimensions(np.array([query_vector]), self.dimensions)[0]
+        candidates = np.arange(len(self.documents))
+        if filter:
+            candidates = np.array(
+                [doc_id for doc_id in candidates if matches_filter(self.documents[doc_id].metadata, filter)], dtype=int
+            )
+        if not len(candidates):
+            return []
+
+        scores = self._quantized_scores(query, candidates)
+        if self.quantization != "float32":
+            shortlist = min(len(candidates), top_k * self.rerank_factor)
+            candidates = candidates[np.argsort(-scores, kind="stable")[:shortlist]]
+            scores = self.vectors[candidates] @ query
+
+        best = np.argsort(-scores, kind="stable")[:top_k]
+        return [(self.documents[candidates[i]], float(scores[i])) for i in best]
+
+    def _quantized_scores(self, query: np.ndarray, candidates: np.ndarray) -> np.ndarray:
+        codes = self.codes[candidates]
+        if self.quantization == "int8":
+            return codes.astype(np.float32) @ (query * self.scales)
+        if self.quantization == "binary":
+            query_code = np.packbits(query > 0)
+            return -POPCOUNT[np.bitwise_xor(codes, query_code)].sum(axis=1, dtype=np.float32)
+        return codes @ query
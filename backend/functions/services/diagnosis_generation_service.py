@@ -1,27 +1,65 @@
 
-from typing import List
-from pydantic import BaseModel, Field
-from repositories.medical_knowledge_base_repository import MedicalKnowledgeRepository
-from repositories.clinical_record_repository import save_diagnosis_report
+import os
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple, TypeVar
+from pydantic import Field
+from repositories.medical_knowledge_base_repository import RRF_K, MedicalKnowledgeRepository
+from repositories.clinical_record_repository import save_diagnosis_report, save_partial_diagnosis_report
 from repositories.transcription_repository import set_processing_status
-from models.clinical_record import ClinicalRecord, ClassifiedSymptoms, DiagnosisProbability, ReportOutput
+from models.clinical_record import ClinicalRecord, ClassifiedSymptoms, DiagnosisList, DiagnosisProbability, DiagnosisRoute, ReportOutput
+from models.treatment_plan import TreatmentPlan
 from models.transcription import TranscriptionStatus
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
-from langchain.output_parsers import PydanticOutputParser
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough
 from langchain_community.callbacks import get_openai_callback
 from langchain import hub
-
-class DiagnosisList(BaseModel):
-    summary: str = Field(description="A summary about the report.")
-    diagnosis_probabilities: List[DiagnosisProbability] = Field(description="List of probable diagnoses")
-    conclusion: str = Field(description="A conclusion about the most likely diagnosis of the patient with justification for the selection with clinical reasoning.")
+from services.diagnosis_router import DiagnosisRouter
+from utils.debounce import Debouncer
+from utils.context_assembler import ContextAssembler
+from utils.http_clients import openai_client_options
+from utils.instrumentation import record_llm_usage, record_route, traced
+from utils.logger import get_logger
+from utils.report_renderer import render_diagnosis_report
+from utils.structured_output import StructuredLLM
+
+logger = get_logger(__name__)
+
+# Stream the final report to the clinical record while it is generated
+STREAM_REPORT = os.getenv("DIAGNOSIS_STREAM_REPORT", "true").lower() == "true"
+# Minimum interval in seconds between partial report writes to Firestore
+STREAM_DEBOUNCE_SEC = float(os.getenv("DIAGNOSIS_STREAM_DEBOUNCE_SEC", "1.0"))
+# Token budget of the knowledge base injected in the diagnosis prompt
+KNOWLEDGE_BASE_TOKEN_BUDGET = int(os.getenv("DIAGNOSIS_KNOWLEDGE_BASE_TOKEN_BUDGET", "2500"))
+# Token budget of the diagnosis injected in the treatment plan and report prompts
+DIAGNOSIS_OUTPUT_TOKEN_BUDGET = int(os.getenv("DIAGNOSIS_OUTPUT_TOKEN_BUDGET", "1500"))
+# How the markdown report is built: "template" (rendered from the structured output) or "llm" (an extra formatting call)
+REPORT_RENDERER = os.getenv("DIAGNOSIS_REPORT_RENDERER", "template")
+
+T = TypeVar("T")
+
+class DiagnosisWithTreatmentPlan(DiagnosisList):
+    treatment_plan: TreatmentPlan = Field(description="The treatment plan and recommendations for the most likely diagnosis")
+
+def accumulate(chunks: Iterable[str]) -> Iterator[str]:
+    """Yield the text streamed so far on each chunk."""
+    text = ""
+    for chunk in chunks:
+        text += chunk
+        yield text
 
 class DiagnosisGenerationService:
-    def __init__(self) -> None:
-        self.llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.1)
+    def __init__(
+        self,
+        stream_report: bool = STREAM_REPORT,
+        router: Optional[DiagnosisRouter] = None,
+        report_renderer: str = REPORT_RENDERER
+    ) -> None:
+        # stream_usage keeps token counts available to get_openai_callback when streaming
+        self.llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.1, stream_usage=True, **openai_client_options())
+        self.stream_report = stream_report
+        self.router = router or DiagnosisRouter()
+        self.report_renderer = report_renderer
 
     def process(self, clinical_record: ClinicalRecord) -> None:
         """
@@ -31,7 +69,7 @@ class DiagnosisGenerationService:
         """
         try:
             assert clinical_record.session_id, "session_id not provided"      
-            set_processing_status(clinical_record.session_id, TranscriptionStatus.DIAGNOSIS_STARTED)
+            set_processing_status(clinical_record.session_id, TranscriptionStatus.DIAGNOSIS_STARTED, immediate=True)
             diagnosis_report, parsed_diagnosis = self._generate_diagnosis_report(clinical_record)
             diagnosis_probability: List[DiagnosisProbability] = parsed_diagnosis.diagnosis_probabilities
 
@@ -44,12 +82,28 @@ class DiagnosisGenerationService:
             
             set_processing_status(clinical_record.session_id, TranscriptionStatus.DIAGNOSIS_FINISHED)
         except Exception as e:
-            print(f"Error in diagnosis_generation: {str(e)}")
+            logger.exception("error in diagnosis_generation: %s", e)
             raise e
 
     def _generate_diagnosis_report(self, clinical_record: ClinicalRecord) -> tuple[str, DiagnosisList]:
+        with traced("retrieve_medical_knowledge"):
+            knowledge_base, retrieval_scores, vector_search_answered = self._retrieve_medical_knowledge(clinical_record)
+        symptoms_details = self._format_symptoms_for_prompt(clinical_record.classified_symptoms or [])
+
+        decision = self.router.route(clinical_record.classified_symptoms or [], retrieval_scores, vector_search_answered)
+        record_route(decision.route.value)
+        logger.info("diagnosis route: %s (%s)", decision.route.value, decision.reason, extra={"route": decision.route.value})
+        if decision.route == DiagnosisRoute.FAST:
+            return self._generate_fast_diagnosis_report(clinical_record, knowledge_base, symptoms_details)
+
+        # The prompts start with the static instructions and output schema, and end with the
+        # session content, so the provider prompt cache can reuse the prefix between sessions.
+        # The knowledge base goes before the patient data: sessions with similar symptoms
+        # retrieve the same documents and share a longer prefix.
+
         # Chain 1 - Diagnosis Report
-        diagnosis_template = ChatPromptTemplate.from_template("""
+        diagnosis_template = ChatPromptTemplate.from_messages([
+            ("system", """
             <context>
                 You are a doctor with expertise in clinical diagnosis.
                 You'll be given a summary of a conversation between a doctor and a patient, information about the patient, reason for the visit and details about the symptoms.
@@ -57,6 +111,29 @@ class DiagnosisGenerationService:
                 Consider the patient's age, demographic factors, behavior, lifestyle, nutrition, hydration, and other factors that might be relevant for the diagnosis.
             </context>
 
+            <instructions>
+                1- Generate a list of probable diagnosis using evidence-based reasoning.
+                2- Based on the chances of the patient having the disease, assign probability estimates (0-100%) for each diagnosis.
+                3- Explain the disease and the reasoning behind the probable diagnosis. Relate the patient's symptoms to the diagnosis.
+                4- Refer to the text within `<knowledge-base></knowledge-base>` for evidence-based reasoning. Use it as guidance, but also, feel free to consider alternative diagnoses not listed in the knowledge base.
+            </instructions>
+
+            <output-instructions>
+                Present your response with the following attributes:
+                - summary: Explain what the transcription is about. Include patient's name, age, gender, and symptoms and relevant information for the diagnosis.
+                - diagnosis_probabilities: Provide the list of probable diagnosis according to the instructions.
+                - conclusion: Select the most likely diagnosis of the patient. Justify your selection with clinical reasoning.
+            </output-instructions>
+
+            <output>
+            {diagnosis_output_parser}
+            </output>
+            """),
+            ("human", """
+            <knowledge-base>
+            {knowledge_base}
+            </knowledge-base>
+
             <input>
                 <summary>
                 {summary}
@@ -74,32 +151,12 @@ class DiagnosisGenerationService:
                 {symptoms_details}
                 </symptoms_details>
             </input>
-
-            <instructions>
-                1- Generate a list of probable diagnosis using evidence-based reasoning.
-                2- Based on the chances of the patient having the disease, assign probability estimates (0-100%) for each diagnosis.
-                3- Explain the disease and the reasoning behind the probable diagnosis. Relate the patient's symptoms to the diagnosis.
-                4- Refer to the text within `<knowledge-base></knowledge-base>` for evidence-based reasoning. Use it as guidance, but also, feel free to consider alternative diagnoses not listed in the knowledge base.
-            </instructions>
-            
-            <knowledge-base>
-            {knowledge_base}
-            </knowledge-base>
-            
-            <output-instructions>
-                Present your response with the following attributes:
-                - summary: Explain what the transcription is about. Include patient's name, age, gender, and symptoms and relevant information for the diagnosis.
-                - diagnosis_probabilities: Provide the list of probable diagnosis according to the instructions.
-                - conclusion: Select the most likely diagnosis of the patient. Justify your selection with clinical reasoning.
-            </output-instructions>
-
-            <output>
-            {diagnosis_output_parser}
-            </output>
-            """)
+            """),
+        ])
 
         # Chain 2 - Treatment Plan
-        treatment_plan_template = ChatPromptTemplate.from_template(template="""
+        treatment_plan_template = ChatPromptTemplate.from_messages([
+            ("system", """
             <context>
                 You are a doctor with expertise in generating treatment plan for patients.
                 You'll be given a diagnosis report generated for a patient, having probability estimates (0-100%) based on the chances of the patient having the disease.
@@ -114,24 +171,26 @@ class DiagnosisGenerationService:
                 - Provide a clear **explanation and clinical reasoning** behind each element of the treatment plan.  
 
                 # Recommendations
-                - Write a **recommendation text** directed to the doctor managing the case.  
+                - Write **recommendations** directed to the doctor managing the case.  
                 - **Highlight and alert** if any critical or red-flag symptoms are present.  
                 - Suggest appropriate **diagnostic tests and procedures** to improve accuracy.  
                 - Explain the **clinical reasoning** behind each recommendation.  
                 - Include **follow-up actions or monitoring** if relevant.  
             </instructions>
-            
+            <output>
+            {treatment_plan_output_parser}
+            </output>
+            """),
+            ("human", """
             <diagnosis_report>
             {diagnosis_output}
             </diagnosis_report>
-            
-            <output>
-                - Present your response in two distinct sections, each with its own title: "Treatment Plan" and "Recommendation".
-            </output>
-        """
-        )
+            """),
+        ])
 
-        report_template = ChatPromptTemplate.from_template(template="""
+        # Chain 3 - Report, only used when the report is formatted by the LLM
+        report_template = ChatPromptTemplate.from_messages([
+            ("system", """
             <role>
                 You are an expert in creating structured and professional **markdown reports** for clinical cases.
             </role>
@@ -150,7 +209,11 @@ class DiagnosisGenerationService:
                 - Ensure the report is **intuitive, professional, and easy to navigate** for clinical use.  
             </goal>
 
-            
+            <output>
+                Generate a comprehensive report in markdown format combining the diagnosis and treatment information.
+            </output>
+            """),
+            ("human", """
             <diagnosis_report>
             {diagnosis_output}
             </diagnosis_report>
@@ -158,55 +221,238 @@ class DiagnosisGenerationService:
             <treatment_plan>
             {treatment_plan}
             </treatment_plan>
-            
-            <output>
-                Generate a comprehensive report in markdown format combining the diagnosis and treatment information.
-            </output>
-        """)
+            """),
+        ])
 
-        knowledge_base = self._retrieve_medical_knowledge(clinical_record)
-        symptoms_details = self._format_symptoms_for_prompt(clinical_record.classified_symptoms or [])
-        
         total_tokens = 0
+        cached_prompt_tokens = 0
 
-        with get_openai_callback() as cb:
-            diagnosis_output_parser = PydanticOutputParser(pydantic_object=DiagnosisList)
-            diagnosis_chain = diagnosis_template | self.llm | diagnosis_output_parser
+        with traced("generate_diagnosis"), get_openai_callback() as cb:
+            diagnosis_llm = StructuredLLM(self.llm, DiagnosisList)
+            diagnosis_prompt = diagnosis_template.partial(diagnosis_output_parser=diagnosis_llm.format_instructions)
+            diagnosis_chain = diagnosis_prompt | diagnosis_llm
             parsed_diagnosis = diagnosis_chain.invoke({
                 "knowledge_base": knowledge_base,
                 "summary": clinical_record.summary,
                 "patient_info": clinical_record.patient_info.model_dump_json(),
                 "reason_for_visit": clinical_record.reason_for_visit or "Not specified",
                 "symptoms_details": symptoms_details,
-                "diagnosis_output_parser": diagnosis_output_parser.get_format_instructions()
             })
-            print('diagnosis generated')
+            logger.info("diagnosis generated", extra={"prompt_tokens": cb.prompt_tokens, "cached_prompt_tokens": cb.prompt_tokens_cached})
             total_tokens += cb.total_tokens
+            cached_prompt_tokens += cb.prompt_tokens_cached
+            record_llm_usage(cb.prompt_tokens, cb.completion_tokens, cb.successful_requests, cb.prompt_tokens_cached)
         
         # Convert the parsed diagnosis to a string
-        diagnosis_string = parsed_diagnosis.model_dump_json()
+        diagnosis_string = self._format_diagnosis_for_prompt(parsed_diagnosis)
         
-        print('generating treatment plan and report')
-        # Generate treatment plan and final report in a single chain
-        with get_openai_callback() as cb:
-            treatment_and_report_chain = (
-                {"treatment_plan": treatment_plan_template | self.llm | StrOutputParser()}
-                | {"diagnosis_output": RunnablePassthrough(), "treatment_plan": RunnablePassthrough()}
-                | report_template | self.llm | StrOutputParser()
-            )
-            
-            final_report = treatment_and_report_chain.invoke({
-                "diagnosis_output": diagnosis_string
-            })
+        logger.info("generating treatment plan and report")
+        with traced("generate_treatment_plan_and_report", renderer=self.report_renderer), get_openai_callback() as cb:
+            treatment_plan_llm = StructuredLLM(self.llm, TreatmentPlan)
+            treatment_plan_prompt = treatment_plan_template.partial(treatment_plan_output_parser=treatment_plan_llm.format_instructions)
+            treatment_plan_chain = treatment_plan_prompt | treatment_plan_llm
+            treatment_plan_input = {"diagnosis_output": diagnosis_string}
+
+            if self.report_renderer == "llm":
+                treatment_plan = TreatmentPlan.model_validate(treatment_plan_chain.invoke(treatment_plan_input))
+                report_chain = report_template | self.llm | StrOutputParser()
+                report_input = {
+                    "diagnosis_output": diagnosis_string,
+                    "treatment_plan": treatment_plan.model_dump_json(exclude_none=True)
+                }
+                if self.stream_report:
+                    final_report = self._stream_report(
+                        accumulate(report_chain.stream(report_input)),
+                        lambda report: report,
+                        clinical_record.session_id,
+                        parsed_diagnosis.diagnosis_probabilities
+                    )
+                else:
+                    final_report = report_chain.invoke(report_input)
+            else:
+                if self.stream_report:
+                    # the report is rendered again from the treatment plan generated so far on each write
+                    treatment_plan_output = self._stream_report(
+                        treatment_plan_chain.stream(treatment_plan_input),
+                        lambda partial_plan: render_diagnosis_report(clinical_record, parsed_diagnosis, partial_plan),
+                        clinical_record.session_id,
+                        parsed_diagnosis.diagnosis_probabilities
+                    )
+                else:
+                    treatment_plan_output = treatment_plan_chain.invoke(treatment_plan_input)
+                treatment_plan = TreatmentPlan.model_validate(treatment_plan_output)
+                final_report = render_diagnosis_report(clinical_record, parsed_diagnosis, treatment_plan)
             total_tokens += cb.total_tokens
+            cached_prompt_tokens += cb.prompt_tokens_cached
+            record_llm_usage(cb.prompt_tokens, cb.completion_tokens, cb.successful_requests, cb.prompt_tokens_cached)
         
-        print(f"Total tokens used for generating diagnosis: {total_tokens}")
+        logger.info(
+            "total tokens used for generating diagnosis: %d (%d cached prompt tokens)", total_tokens, cached_prompt_tokens,
+            extra={"total_tokens": total_tokens, "cached_prompt_tokens": cached_prompt_tokens}
+        )
         return final_report, parsed_diagnosis
 
+    def _stream_report(
+        self,
+        partial_outputs: Iterable[T],
+        render: Callable[[T], str],
+        session_id: str,
+        diagnosis_probabilities: List[DiagnosisProbability]
+    ) -> T:
+        """
+        Stream the LLM output and write the partial report rendered from it to the clinical record.
+        Writes are debounced so Firestore isn't updated on every token. Returns the complete output.
+        """
+        logger.info("streaming diagnosis report for session: %s", session_id)
+        include_diagnosis = True
+
+        def write_partial_report(partial_output: T) -> None:
+            nonlocal include_diagnosis
+            # the structured diagnosis is already available, send it along with the first chunk
+            save_partial_diagnosis_report(
+                session_id,
+                render(partial_output),
+                diagnosis_probabilities if include_diagnosis else None
+            )
+            include_diagnosis = False
+
+        debouncer: Debouncer[T] = Debouncer(write_partial_report, STREAM_DEBOUNCE_SEC)
+        output = None
+        for output in partial_outputs:
+            debouncer.push(output)
+
+        # the final report is written by save_diagnosis_report, which also marks completion
+        return output
+
+    def _generate_fast_diagnosis_report(
+        self,
+        clinical_record: ClinicalRecord,
+        knowledge_base: str,
+        symptoms_details: str
+    ) -> tuple[str, DiagnosisList]:
+        """
+        Generate the diagnosis and treatment plan of a low acuity case in a single call.
+        The treatment plan is the last attribute of the output, so the report is streamed once the diagnosis is complete.
+        """
+        fast_template = ChatPromptTemplate.from_messages([
+            ("system", """
+            <context>
+                You are a doctor with expertise in clinical diagnosis and clinical documentation.
+                You'll be given a summary of a conversation between a doctor and a patient, information about the patient, reason for the visit and details about the symptoms of a routine, low acuity case.
+                Consider the patient's age, demographic factors, behavior, lifestyle, nutrition, hydration, and other factors that might be relevant for the diagnosis.
+            </context>
+
+            <instructions>
+                1- Generate a list of probable diagnosis using evidence-based reasoning, with probability estimates (0-100%) for each diagnosis.
+                2- Explain the disease and the reasoning behind the probable diagnosis. Relate the patient's symptoms to the diagnosis.
+                3- Refer to the text within `<knowledge-base></knowledge-base>` for evidence-based reasoning. Use it as guidance, but also, feel free to consider alternative diagnoses not listed in the knowledge base.
+                4- Develop a personalized treatment plan, with pharmacological and non-pharmacological interventions when applicable, and recommendations for the doctor: diagnostic tests, follow-up actions and red-flag symptoms to watch for.
+            </instructions>
+
+            <output-instructions>
+                Present your response with the following attributes, in this order:
+                - summary: Explain what the transcription is about. Include patient's name, age, gender, and symptoms and relevant information for the diagnosis.
+                - diagnosis_probabilities: Provide the list of probable diagnosis according to the instructions.
+                - conclusion: Select the most likely diagnosis of the patient. Justify your selection with clinical reasoning.
+                - treatment_plan: The treatment plan and recommendations for the most likely diagnosis.
+            </output-instructions>
+
+            <output>
+            {output_instructions}
+            </output>
+            """),
+            ("human", """
+            <knowledge-base>
+            {knowledge_base}
+            </knowledge-base>
+
+            <input>
+                <summary>
+                {summary}
+                </summary>
+
+                <patient_info>
+                {patient_info}
+                </patient_info>
+
+                <reason_for_visit>
+                {reason_for_visit}
+                </reason_for_visit>
+
+                <symptoms_details>
+                {symptoms_details}
+                </symptoms_details>
+            </input>
+            """),
+        ])
+
+        fast_llm = StructuredLLM(self.llm, DiagnosisWithTreatmentPlan)
+        chain = fast_template.partial(output_instructions=fast_llm.format_instructions) | fast_llm
+        fast_input = {
+            "knowledge_base": knowledge_base,
+            "summary": clinical_record.summary,
+            "patient_info": clinical_record.patient_info.model_dump_json(),
+            "reason_for_visit": clinical_record.reason_for_visit or "Not specified",
+            "symptoms_details": symptoms_details,
+        }
+
+        with traced("generate_fast_diagnosis"), get_openai_callback() as cb:
+            if self.stream_report:
+                output = self._stream_fast_diagnosis(chain, fast_input, clinical_record)
+            else:
+                output = chain.invoke(fast_input)
+            record_llm_usage(cb.prompt_tokens, cb.completion_tokens, cb.successful_requests, cb.prompt_tokens_cached)
+
+        diagnosis = DiagnosisWithTreatmentPlan.model_validate(output)
+        logger.info(
+            "total tokens used for generating diagnosis: %d (%d cached prompt tokens)", cb.total_tokens, cb.prompt_tokens_cached,
+            extra={"total_tokens": cb.total_tokens, "cached_prompt_tokens": cb.prompt_tokens_cached}
+        )
+        return render_diagnosis_report(clinical_record, diagnosis, diagnosis.treatment_plan), diagnosis
+
+    def _stream_fast_diagnosis(self, chain, fast_input: dict, clinical_record: ClinicalRecord) -> dict:
+        """
+        Stream the output of the fast path and write the partial report to the clinical record.
+        Returns the complete output.
+        """
+        session_id = clinical_record.session_id
+        logger.info("streaming diagnosis report for session: %s", session_id)
+        include_diagnosis = True
+
+        def write_partial_report(partial_output: dict) -> None:
+            nonlocal include_diagnosis
+            diagnosis_probabilities = None
+            if include_diagnosis:
+                # the diagnosis comes before the treatment plan in the output, it is complete by now
+                diagnosis_probabilities = [
+                    DiagnosisProbability.model_validate(d)
+                    for d in partial_output.get("diagnosis_probabilities") or []
+                    if d.get("name")
+                ]
+            partial_report = render_diagnosis_report(clinical_record, partial_output, partial_output["treatment_plan"])
+            save_partial_diagnosis_report(session_id, partial_report, diagnosis_probabilities)
+            include_diagnosis = False
+
+        debouncer: Debouncer[dict] = Debouncer(write_partial_report, STREAM_DEBOUNCE_SEC)
+        output: dict = {}
+        # the output parsed so far is yielded on every chunk, the last one is validated
+        for output in chain.stream(fast_input):
+            if "treatment_plan" in output:
+                debouncer.push(output)
+
+        # the final report is written by save_diagnosis_report, which also marks completion
+        return output
+
     def _format_docs(self, docs):
         return "\n\n".join(doc.page_content for doc in docs)
 
-    def _retrieve_medical_knowledge(self, clinical_record: ClinicalRecord) -> str:
+    def _retrieve_medical_knowledge(self, clinical_record: ClinicalRecord) -> Tuple[str, List[float], bool]:
+        """
+        Retrieve the knowledge base context of the clinical record, along with the
+        score of each retrieved document scaled to 0-1 (1 when a document is ranked
+        first by both the vector and the lexical search) and whether the vector
+        search answered.
+        """
         query_parts = []
         if clinical_record.reason_for_visit:
             query_parts.append(clinical_record.reason_for_visit.lower())
@@ -214,20 +460,20 @@ class DiagnosisGenerationService:
             symptom_names = [s.name.lower() for s in clinical_record.classified_symptoms]
             query_parts.extend(symptom_names)
         if len(query_parts) == 0:
-            return ""
+            return "", [], True
 
         query = " ".join(query_parts)
 
         medical_knowledge = MedicalKnowledgeRepository()
-        print(f"the query is: {query}")
-        relevant_docs = medical_knowledge.similarity_search(query)
-        print(f"found {len(relevant_docs)} relevant documents")
+        logger.debug("knowledge base query: %s", query)
+        relevant_docs, vector_search_answered = medical_knowledge.hybrid_search(query)
+        logger.info("found %d relevant documents", len(relevant_docs))
         # relevant_docs = medical_knowledge.retrieve_full_docs(query)
-        context_parts = []
-        for doc in relevant_docs:
-            context_parts.append(f"- {doc.page_content}")
-        
-        return "\n".join(context_parts) if context_parts else ""
+
+        best_rrf_score = 2 / (RRF_K + 1)
+        retrieval_scores = [score / best_rrf_score for _, score in relevant_docs]
+
+        return ContextAssembler(KNOWLEDGE_BASE_TOKEN_BUDGET).assemble(relevant_docs), retrieval_scores, vector_search_answered
         
 
         # print('loading RAG for medical knowledge')
@@ -249,6 +495,24 @@ class DiagnosisGenerationService:
 
         # return response
 
+    def _format_diagnosis_for_prompt(self, diagnosis: DiagnosisList) -> str:
+        """
+        Serialize the diagnosis for the treatment plan and report prompts within the token budget.
+        The least probable diagnoses are dropped first when the budget is exceeded.
+        """
+        assembler = ContextAssembler(DIAGNOSIS_OUTPUT_TOKEN_BUDGET)
+        probabilities = sorted(
+            diagnosis.diagnosis_probabilities,
+            key=lambda d: d.probability or 0,
+            reverse=True
+        )
+        while True:
+            compact = diagnosis.model_copy(update={"diagnosis_probabilities": probabilities})
+            diagnosis_string = compact.model_dump_json(exclude_none=True)
+            if len(probabilities) <= 1 or assembler.count_tokens(diagnosis_string) <= assembler.token_budget:
+                return diagnosis_string
+            probabilities = probabilities[:-1]
+
     def _format_symptoms_for_prompt(self, symptoms: List[ClassifiedSymptoms]) -> str:
         """Format symptoms data for inclusion in the LLM prompt."""
         if not symptoms:
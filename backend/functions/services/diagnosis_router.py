@@ -0,0 +1,81 @@
+import os
+from dataclasses import dataclass
+from typing import List, Sequence
+from models.clinical_record import ClassifiedSymptoms, DiagnosisRoute
+from services.rule_based_extractor import INTENSITY_RANKS, intensity_rank
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Send low acuity cases to a single LLM call generating the diagnosis and the report
+DIAGNOSIS_ROUTING = os.getenv("DIAGNOSIS_ROUTING", "true").lower() == "true"
+# Cases with more symptoms than this take the full chain
+FAST_PATH_MAX_SYMPTOMS = int(os.getenv("DIAGNOSIS_FAST_PATH_MAX_SYMPTOMS", "4"))
+# Classified severities less similar than this to their reference description are ignored
+MIN_SEVERITY_CONFIDENCE = float(os.getenv("DIAGNOSIS_ROUTER_MIN_SEVERITY_CONFIDENCE", "0.2"))
+# Minimum retrieval score (0-1) of the best knowledge base match to take the fast path
+FAST_PATH_MIN_RETRIEVAL_SCORE = float(os.getenv("DIAGNOSIS_FAST_PATH_MIN_RETRIEVAL_SCORE", "0.5"))
+
+
+@dataclass
+class RouteDecision:
+    route: DiagnosisRoute
+    reason: str
+
+
+class DiagnosisRouter:
+    """
+    Choose how the diagnosis of a clinical record is generated.
+
+    Cases with a severe or critical symptom (by reported intensity, or by
+    classified severity when the classification is confident), many symptoms,
+    a knowledge base match of low confidence, or a retrieval without the vector
+    search (its lexical scores alone say little) take the full chain (diagnosis,
+    treatment plan and report). Other cases take the fast path, a single call
+    generating the diagnosis along with the report.
+    """
+    def __init__(
+        self,
+        enabled: bool = DIAGNOSIS_ROUTING,
+        max_symptoms: int = FAST_PATH_MAX_SYMPTOMS,
+        min_retrieval_score: float = FAST_PATH_MIN_RETRIEVAL_SCORE,
+        min_severity_confidence: float = MIN_SEVERITY_CONFIDENCE,
+    ) -> None:
+        self.enabled = enabled
+        self.max_symptoms = max_symptoms
+        self.min_retrieval_score = min_retrieval_score
+        self.min_severity_confidence = min_severity_confidence
+
+    def route(
+        self, symptoms: List[ClassifiedSymptoms], retrieval_scores: Sequence[float], vector_search_answered: bool = True
+    ) -> RouteDecision:
+        """
+        Args:
+            symptoms: The classified symptoms of the clinical record
+            retrieval_scores: Scores (0-1) of the knowledge base documents retrieved for the case
+            vector_search_answered: False when the vector search failed or timed out and only the lexical search ranked the documents
+        """
+        if not self.enabled:
+            return RouteDecision(DiagnosisRoute.FULL, "routing disabled")
+
+        acute = [symptom.name for symptom in symptoms if self._is_acute(symptom)]
+        if acute:
+            return RouteDecision(DiagnosisRoute.FULL, f"severe symptoms: {', '.join(acute)}")
+        if len(symptoms) > self.max_symptoms:
+            return RouteDecision(DiagnosisRoute.FULL, f"{len(symptoms)} symptoms")
+
+        if not vector_search_answered:
+            return RouteDecision(DiagnosisRoute.FULL, "vector search unavailable")
+        best_score = max(retrieval_scores, default=0.0)
+        if best_score < self.min_retrieval_score:
+            return RouteDecision(DiagnosisRoute.FULL, f"retrieval score {best_score:.2f}")
+
+        return RouteDecision(DiagnosisRoute.FAST, "low acuity")
+
+    def _is_acute(self, symptom: ClassifiedSymptoms) -> bool:
+        if intensity_rank(symptom.intensity) >= INTENSITY_RANKS["severe"]:
+            return True
+        return (
+            symptom.confidence_score >= self.min_severity_confidence
+            and intensity_rank(symptom.severity) >= INTENSITY_RANKS["severe"]
+        )
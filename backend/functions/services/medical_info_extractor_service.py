@@ -1,18 +1,39 @@
+import os
 from typing import List
 from models.medical_extraction import MedicalExtraction
 from models.clinical_record import ClinicalRecord, ClassifiedSymptoms
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate, FewShotChatMessagePromptTemplate
-from langchain.output_parsers import PydanticOutputParser
-from langchain.schema import Document
-from langchain_core.vectorstores import InMemoryVectorStore
+from langchain_community.callbacks import get_openai_callback
+from langchain_core.output_parsers import StrOutputParser
 from models.transcription import Transcription, TranscriptionStatus
 from samples.medical_extraction_examples import get_examples
 from repositories.transcription_repository import set_processing_status
 from repositories.clinical_record_repository import save_clinical_record
+from services.rule_based_extractor import RuleBasedExtractor, merge_extraction_fragments, merge_extractions
+from services.symptom_severity_classifier import get_severity_classifier
+from utils.http_clients import openai_client_options
+from utils.instrumentation import record_llm_usage, traced
+from utils.structured_output import StructuredLLM
+from utils.transcript_windows import TranscriptWindowSplitter
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Extract the patient information and symptoms stated explicitly with rules, the LLM only fills the gaps
+RULE_BASED_PRE_EXTRACTION = os.getenv("RULE_BASED_PRE_EXTRACTION", "true").lower() == "true"
+# Transcriptions longer than this are split in windows extracted in parallel and merged
+LONG_TRANSCRIPT_TOKENS = int(os.getenv("EXTRACTION_LONG_TRANSCRIPT_TOKENS", "6000"))
+# Size of the windows of a long transcription
+EXTRACTION_WINDOW_TOKENS = int(os.getenv("EXTRACTION_WINDOW_TOKENS", "3000"))
+# Windows extracted at the same time
+EXTRACTION_MAX_CONCURRENCY = int(os.getenv("EXTRACTION_MAX_CONCURRENCY", "4"))
 
 
 class MedicalInfoExtractor:
+    def __init__(self, pre_extraction: bool = RULE_BASED_PRE_EXTRACTION) -> None:
+        self.pre_extraction = pre_extraction
+
     def process(self, transcription: Transcription) -> None:
         """
         Firebase function triggered when a transcription document is created in Firestore.
@@ -23,7 +44,7 @@ class MedicalInfoExtractor:
         try:
             assert transcription.session_id, "session_id is required"  
             assert transcription.text, "empty transcription"
-            set_processing_status(transcription.session_id, TranscriptionStatus.INFORMATION_EXTRACTION_STARTED)
+            set_processing_status(transcription.session_id, TranscriptionStatus.INFORMATION_EXTRACTION_STARTED, immediate=True)
             
             medical_extraction: MedicalExtraction = self._extract_medical_information(transcription)
 
@@ -38,33 +59,84 @@ class MedicalInfoExtractor:
             save_clinical_record(clinical_record)
             set_processing_status(transcription.session_id, TranscriptionStatus.INFORMATION_EXTRACTION_FINISHED)
         except Exception as e:
-            print(f"Error in information_extractor: {str(e)}")
-            if transcription.session_id:
-                try:
-                    set_processing_status(transcription.session_id, TranscriptionStatus.INFORMATION_EXTRACTION_ERROR, str(e))
-                except Exception as update_error:
-                    print(f"Failed to update error status: {str(update_error)}")
+            logger.exception("error in information_extractor: %s", e)
+            raise e
 
     def _extract_medical_information(self, transcription: Transcription) -> MedicalExtraction:
         """
         Extract medical information from transcription
         """
-        print("Start processing medical information extraction")
-        json_parser = PydanticOutputParser(pydantic_object=MedicalExtraction)
+        logger.info("start processing medical information extraction")
+        splitter = TranscriptWindowSplitter(EXTRACTION_WINDOW_TOKENS)
+        if splitter.count_tokens(transcription.text) > LONG_TRANSCRIPT_TOKENS:
+            windows = splitter.split(transcription.text)
+        else:
+            windows = [transcription.text]
+
+        pre_extraction = None
+        if self.pre_extraction:
+            pre_extractor = RuleBasedExtractor()
+            pre_extraction = pre_extractor.extract(transcription.text)
+            chain = self._build_gap_filling_chain()
+        else:
+            chain = self._build_chain()
 
-        chain = self._build_chain(json_parser)
+        inputs = []
+        for window in windows:
+            window_inputs = {"transcription": window}
+            if self.pre_extraction:
+                window_pre_extraction = pre_extraction if len(windows) == 1 else pre_extractor.extract(window)
+                missing_fields = [field for field, value in window_pre_extraction.patient_info.model_dump().items() if value is None]
+                window_inputs["pre_extracted"] = window_pre_extraction.model_dump_json(exclude_none=True)
+                window_inputs["missing_patient_fields"] = ", ".join(missing_fields) or "none"
+            inputs.append(window_inputs)
 
-        result: MedicalExtraction = chain.invoke(input={
-            "transcription": transcription.text,
-            "format_instructions": json_parser.get_format_instructions(),
-        })
+        with traced("extract_medical_information", pre_extraction=self.pre_extraction, windows=len(windows)), get_openai_callback() as cb:
+            if len(inputs) == 1:
+                result: MedicalExtraction = chain.invoke(input=inputs[0])
+            else:
+                logger.info("extracting long transcription in %d windows", len(inputs))
+                fragments: List[MedicalExtraction] = chain.batch(inputs, config={"max_concurrency": EXTRACTION_MAX_CONCURRENCY})
+                result = merge_extraction_fragments(fragments)
+                summaries = list(dict.fromkeys(fragment.summary for fragment in fragments if fragment.summary))
+                if len(summaries) > 1:
+                    result.summary = self._condense_summaries(summaries)
+            record_llm_usage(cb.prompt_tokens, cb.completion_tokens, cb.successful_requests, cb.prompt_tokens_cached)
 
-        print("Medical extraction information finished")
+        if pre_extraction:
+            result = merge_extractions(pre_extraction, result)
+
+        logger.info("medical information extraction finished")
 
         return result
 
-    def _build_chain(self, json_parser: PydanticOutputParser[MedicalExtraction]):
-        llm = ChatOpenAI(model="gpt-4.1-mini", temperature=0.1)
+    def _condense_summaries(self, summaries: List[str]) -> str:
+        """
+        Merge the summaries of the windows of a long transcription into one,
+        joining them would repeat the patient presentation in each of them.
+        """
+        logger.info("condensing %d window summaries", len(summaries))
+        prompt_template = ChatPromptTemplate.from_messages(messages=[
+            ("system", """
+            <context>
+                You are a medical documentation assistant. You will be given the partial summaries of consecutive
+                parts of the transcription of a single conversation between a doctor and a patient.
+            </context>
+            <instructions>
+                - Merge them into a single concise summary with the patient's name, age, reason for visit and symptoms,
+                  including information relevant for the diagnosis (behavior, lifestyle, nutrition, hydration, sleep).
+                - State each fact once, keep the latest information when the parts disagree.
+                - Answer only with the summary.
+            </instructions>
+            """),
+            ("human", "{summaries}"),
+        ])
+        llm = ChatOpenAI(model="gpt-4.1-mini", temperature=0.1, **openai_client_options())
+        chain = prompt_template | llm | StrOutputParser()
+        return chain.invoke({"summaries": "\n".join(f"{index}. {summary}" for index, summary in enumerate(summaries, 1))}).strip()
+
+    def _build_chain(self):
+        llm = StructuredLLM(ChatOpenAI(model="gpt-4.1-mini", temperature=0.1, **openai_client_options()), MedicalExtraction)
 
         examples = get_examples()
 
@@ -130,65 +202,85 @@ class MedicalInfoExtractor:
             """),
         ])
 
-        return prompt_template | llm | json_parser
+        # the schema is fixed, so the system prompt (and the examples) are an identical prefix on every call
+        prompt_template = prompt_template.partial(format_instructions=llm.format_instructions)
+
+        return prompt_template | llm
+
+    def _build_gap_filling_chain(self):
+        """
+        Smaller prompt, without few-shot examples, completing the rule based pre-extraction.
+        """
+        llm = StructuredLLM(ChatOpenAI(model="gpt-4.1-mini", temperature=0.1, **openai_client_options()), MedicalExtraction)
+
+        prompt_template = ChatPromptTemplate.from_messages(messages=[
+            ("system", """
+            <context>
+                You are a medical information extractor with expertise in clinical documentation.
+                You will be given the transcription of a conversation between a doctor and a patient,
+                and the fields already extracted from it by rules.
+            </context>
+            <instructions>
+                - Keep the pre-extracted values unless the transcription clearly contradicts them.
+                - Fill the missing patient fields listed in `<missing_patient_fields>`. Ensure age is within reasonable range (0-120).
+                - Symptoms: list every symptom the patient presents. Reuse the pre-extracted names, remove the ones
+                  the patient doesn't have, add the missing ones, and note their intensity and duration when mentioned.
+                - Identify the primary complaint or reason for seeking medical care.
+                - Generate a concise summary with the patient's name, age, reason for visit and symptoms, including
+                  information relevant for the diagnosis (behavior, lifestyle, nutrition, hydration, sleep).
+            </instructions>
+            <output>
+                Use the following JSON schema for output:
+                {format_instructions}
+            </output>"""),
+            ("human", """Complete the medical information extracted from this transcription:
+            <missing_patient_fields>
+                {missing_patient_fields}
+            </missing_patient_fields>
+            <pre_extracted>
+                {pre_extracted}
+            </pre_extracted>
+            <transcription>
+                {transcription}
+            </transcription>
+            """),
+        ])
+
+        # variable content only goes in the last message, see _build_chain
+        prompt_template = prompt_template.partial(format_instructions=llm.format_instructions)
+
+        return prompt_template | llm
 
 
     def _symptoms_severity_classification(self, medical_extraction: MedicalExtraction) -> List[ClassifiedSymptoms]:
-        print('Classify symptoms classification using semantic similarity embeddings')
+        logger.info("classifying symptoms severity using semantic similarity embeddings")
         
         if not medical_extraction.symptoms:
             return []
         
-        # Initialize OpenAI embeddings
-        embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-        
-        # Create severity reference documents for vector store
-        severity_documents = [
-            Document(
-                page_content="Minor discomfort, slight symptoms, minimal impact on daily activities, barely noticeable",
-                metadata={"severity": "mild"}
-            ),
-            Document(
-                page_content="Noticeable discomfort, some impact on daily activities, manageable symptoms, requires attention",
-                metadata={"severity": "moderate"}
-            ),
-            Document(
-                page_content="Significant discomfort, major impact on daily activities, intense symptoms, major limitations",
-                metadata={"severity": "severe"}
-            ),
-            Document(
-                page_content="Life-threatening, emergency symptoms, extreme discomfort, requires urgent medical intervention",
-                metadata={"severity": "critical"}
-            )
-        ]
-        
-        # Initialize vector store with severity references
-        vector_store = InMemoryVectorStore(embeddings)
-        vector_store.add_documents(severity_documents)
-        
-        classified_symptoms = []
-        
+        classifier = get_severity_classifier()
+
+        # Create symptom query texts
+        symptom_texts = []
         for symptom in medical_extraction.symptoms:
-            # Create symptom query text
             symptom_text = f"{symptom.name}"
             if symptom.duration:
                 symptom_text += f" lasting {symptom.duration}"
-            
-            # Search for most similar severity level
-            results = vector_store.similarity_search_with_score(symptom_text, k=4)
+            symptom_texts.append(symptom_text)
 
-            # Get the best match (highest similarity = lowest score)
-            best_match = min(results, key=lambda x: x[1])
-            severity_level = best_match[0].metadata["severity"]
-            confidence_score = 1.0 - best_match[1]  # Convert distance to confidence (lower distance = higher confidence)
+        with traced("classify_symptoms_severity", backend=classifier.backend):
+            severities = classifier.classify(symptom_texts)
 
-            classified_symptoms.append(ClassifiedSymptoms(
+        classified_symptoms = [
+            ClassifiedSymptoms(
                 name=symptom.name,
                 intensity=symptom.intensity,
                 duration=symptom.duration,
                 severity=severity_level,
                 confidence_score=confidence_score,
-            ))
+            )
+            for symptom, (severity_level, confidence_score) in zip(medical_extraction.symptoms, severities)
+        ]
         
-        print(f"Classified {len(classified_symptoms)} symptoms with severity levels")
+        logger.info("classified %d symptoms with severity levels", len(classified_symptoms))
         return classified_symptoms
\ No newline at end of file
@@ -0,0 +1,232 @@
+import re
+from typing import Dict, List, Optional
+from models.medical_extraction import MedicalExtraction, PatientInfo, Symptom
+from repositories.symptom_lexicon import SymptomLexicon, get_symptom_lexicon
+from utils.logger import get_logger
+from utils.transcript_windows import TURN_PATTERN
+
+logger = get_logger(__name__)
+
+SENTENCE_PATTERN = re.compile(r"[^.!?\n]+[.!?]?")
+# "a strong cough and some dizziness": the intensity only applies to the symptom of its clause
+CLAUSE_SEPARATOR_PATTERN = re.compile(r"[,;]|\s+(?:but|and|with)\s+", re.IGNORECASE)
+SPEAKER_PATTERN = re.compile(r"^\s*(?:doctor|dr|patient|physician|nurse)\s*:\s*", re.IGNORECASE)
+
+NAME_PATTERN = re.compile(
+    r"(?:[Mm]y name is|[Nn]ame is|[Nn]ame:|\b[Pp]atient)\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+){0,3})"
+    # "I'm Maria Garcia", a full name is required to tell it from "I'm Tired"
+    r"|\bI(?:'m| am)\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+){1,3})\b"
+)
+# first person only, "my father died at 60 years old" or "he is 8 years old" are about someone else
+AGE_PATTERNS = [
+    re.compile(
+        r"\bI(?:'m| am)\s+(?:an?\s+)?(\d{1,3})\b"
+        r"(?!\s*(?:%|percent|minutes?|hours?|days?|weeks?|months?|times?|kg|kilos?|pounds?|lbs?|cm|feet|ft)\b)",
+        re.IGNORECASE,
+    ),
+    re.compile(r"\bmy age is\s+(\d{1,3})\b", re.IGNORECASE),
+]
+ID_PATTERN = re.compile(
+    r"\b(?:ID|identification|medical record|MRN)(?:\s+number)?\s*(?:is|:|#)?\s*([A-Z]*\d[A-Z0-9-]{3,})\b",
+    re.IGNORECASE,
+)
+DATE_OF_BIRTH_PATTERN = re.compile(r"\b(?:born on|date of birth is|date of birth:?)\s+([A-Za-z0-9 ,/-]{4,30}?\d{2,4})\b", re.IGNORECASE)
+GENDER_PATTERN = re.compile(
+    r"\bI(?:'m| am) an?\s+(?:\d{1,3}[- ]years?[- ]old\s+)?(man|woman|male|female|boy|girl)\b", re.IGNORECASE
+)
+GENDERS = {"man": "male", "male": "male", "boy": "male", "woman": "female", "female": "female", "girl": "female"}
+
+NUMBER_WORDS = r"\d+|a|an|one|two|three|four|five|six|seven|eight|nine|ten|a few|a couple of|several"
+TIME_UNITS = r"minutes?|hours?|days?|weeks?|months?|years?"
+DURATION_PATTERNS = [
+    re.compile(rf"\b(?:for|over)\s+(?:the\s+(?:past|last)\s+)?((?:{NUMBER_WORDS})\s+(?:{TIME_UNITS}))\b", re.IGNORECASE),
+    re.compile(rf"\b((?:{NUMBER_WORDS})\s+(?:{TIME_UNITS})\s+ago)\b", re.IGNORECASE),
+    re.compile(r"\b(since\s+(?:this morning|yesterday|last night|last week|(?:mon|tues|wednes|thurs|fri|satur|sun)day))\b", re.IGNORECASE),
+]
+INTENSITIES = [
+    ("severe", re.compile(r"\b(?:severe|strong|intense|terrible|unbearable|excruciating|really bad)\b", re.IGNORECASE)),
+    ("moderate", re.compile(r"\b(?:moderate|quite|pretty bad)\b", re.IGNORECASE)),
+    ("mild", re.compile(r"\b(?:mild|slight|slightly|a bit|a little|minor)\b", re.IGNORECASE)),
+]
+INTENSITY_RANKS = {"mild": 1, "moderate": 2, "severe": 3, "critical": 4}
+# negation up to three words before the symptom: "no fever", "I don't have any nausea"
+NEGATION_PATTERN = re.compile(
+    r"\b(?:no|not|never|without|den(?:y|ies|ied)|don't|didn't|haven't|hasn't)\b(?:\W+\w+){0,3}\W*$",
+    re.IGNORECASE,
+)
+
+
+class RuleBasedExtractor:
+    """
+    Deterministic extraction of the patient information and candidate symptoms
+    stated explicitly in a transcription, done before the LLM extraction.
+    Questions are skipped, so symptoms asked about by the doctor are not
+    taken as reported by the patient.
+    """
+    def __init__(self, lexicon: Optional[SymptomLexicon] = None) -> None:
+        self.lexicon = lexicon or get_symptom_lexicon()
+
+    def extract(self, text: str) -> MedicalExtraction:
+        patient_info = self._extract_patient_info(text)
+        symptoms = self._extract_symptoms(text)
+        logger.info(
+            "rule based pre-extraction found %d patient fields and %d symptoms",
+            len(patient_info.model_dump(exclude_none=True)), len(symptoms),
+        )
+        return MedicalExtraction(summary=None, patient_info=patient_info, symptoms=symptoms, reason_for_visit=None)
+
+    @staticmethod
+    def _patient_turns(text: str) -> str:
+        """
+        The turns of the patient when the transcription has speaker labels, so
+        "I'm Doctor Helena Costa" isn't taken as the patient name. The whole
+        text when it has no patient label.
+        """
+        turns = list(TURN_PATTERN.finditer(text))
+        patient_turns = [
+            text[turn.end():turns[index + 1].start() if index + 1 < len(turns) else len(text)]
+            for index, turn in enumerate(turns)
+            if turn.group(1).lower() == "patient"
+        ]
+        return "\n".join(patient_turns) if patient_turns else text
+
+    def _extract_patient_info(self, text: str) -> PatientInfo:
+        fields: Dict[str, object] = {}
+        text = self._patient_turns(text)
+        if match := NAME_PATTERN.search(text):
+            fields["name"] = match.group(1) or match.group(2)
+        for pattern in AGE_PATTERNS:
+            match = pattern.search(text)
+            if match and 0 <= int(match.group(1)) <= 120:
+                fields["age"] = int(match.group(1))
+                break
+        if match := ID_PATTERN.search(text):
+            fields["id_number"] = match.group(1).upper()
+        if match := DATE_OF_BIRTH_PATTERN.search(text):
+            fields["date_of_birth"] = match.group(1).strip()
+        if match := GENDER_PATTERN.search(text):
+            fields["gender"] = GENDERS[match.group(1).lower()]
+        return PatientInfo(**fields)
+
+    def _extract_symptoms(self, text: str) -> List[Symptom]:
+        symptoms: Dict[str, Symptom] = {}
+        for sentence_match in SENTENCE_PATTERN.finditer(text):
+            sentence = SPEAKER_PATTERN.sub("", sentence_match.group(0)).strip()
+            if not sentence or sentence.endswith("?"):
+                continue
+            duration = self._find_duration(sentence)
+            for name, match in self.lexicon.find(sentence):
+                if NEGATION_PATTERN.search(sentence[:match.start()]):
+                    continue
+                intensity = self._find_intensity(self._clause(sentence, match.start()))
+                symptom = symptoms.get(name)
+                if symptom is None:
+                    symptoms[name] = Symptom(name=name, duration=duration, intensity=intensity)
+                else:
+                    symptom.duration = symptom.duration or duration
+                    symptom.intensity = symptom.intensity or intensity
+        return list(symptoms.values())
+
+    @staticmethod
+    def _clause(sentence: str, position: int) -> str:
+        """The part of the sentence, between commas, containing the position."""
+        start, end = 0, len(sentence)
+        for separator in CLAUSE_SEPARATOR_PATTERN.finditer(sentence):
+            if separator.end() <= position:
+                start = separator.end()
+            elif separator.start() >= position:
+                end = separator.start()
+                break
+        return sentence[start:end]
+
+    @staticmethod
+    def _find_duration(sentence: str) -> Optional[str]:
+        for pattern in DURATION_PATTERNS:
+            if match := pattern.search(sentence):
+                return match.group(1).lower()
+        return None
+
+    @staticmethod
+    def _find_intensity(sentence: str) -> Optional[str]:
+        for intensity, pattern in INTENSITIES:
+            if pattern.search(sentence):
+                return intensity
+        return None
+
+
+def merge_extractions(pre_extraction: MedicalExtraction, extraction: MedicalExtraction, lexicon: Optional[SymptomLexicon] = None) -> MedicalExtraction:
+    """
+    Merge the rule based pre-extraction into the LLM extraction.
+    The LLM was given the pre-extracted values and keeps them unless the
+    transcription contradicts them, so its patient fields take precedence and
+    the rules only fill the fields it left empty. The LLM list of symptoms is
+    kept (it drops the candidates the patient doesn't have) and its missing
+    durations and intensities are filled from the matching candidates.
+    """
+    lexicon = lexicon or get_symptom_lexicon()
+    patient_info = {
+        **(pre_extraction.patient_info.model_dump(exclude_none=True) if pre_extraction.patient_info else {}),
+        **(extraction.patient_info.model_dump(exclude_none=True) if extraction.patient_info else {}),
+    }
+    candidates = {symptom.name: symptom for symptom in pre_extraction.symptoms or []}
+    symptoms = []
+    for symptom in extraction.symptoms or []:
+        matches = lexicon.find(symptom.name)
+        candidate = candidates.get(matches[0][0]) if matches else None
+        if candidate:
+            symptom = symptom.model_copy(update={
+                "duration": symptom.duration or candidate.duration,
+                "intensity": symptom.intensity or candidate.intensity,
+            })
+        symptoms.append(symptom)
+
+    return extraction.model_copy(update={"patient_info": PatientInfo(**patient_info), "symptoms": symptoms})
+
+
+def intensity_rank(intensity: Optional[str]) -> int:
+    """Rank a free text intensity (e.g. "strong" ranks as severe), 0 when unknown."""
+    if not intensity:
+        return 0
+    level = intensity.strip().lower()
+    if level not in INTENSITY_RANKS:
+        level = RuleBasedExtractor._find_intensity(level)
+    return INTENSITY_RANKS.get(level, 0)
+
+
+def merge_extraction_fragments(fragments: List[MedicalExtraction], lexicon: Optional[SymptomLexicon] = None) -> MedicalExtraction:
+    """
+    Merge the extractions of the windows of a transcription, in window order.
+
+    Symptoms are deduplicated by normalized name (the lexicon symptom when the
+    name matches one) keeping the highest intensity and the first duration.
+    Patient fields, the reason for visit and the summary keep the first value
+    found, the extractor condenses the summaries of all the windows into one.
+    """
+    lexicon = lexicon or get_symptom_lexicon()
+    patient_info: Dict[str, object] = {}
+    symptoms: Dict[str, Symptom] = {}
+    summary = None
+    reason_for_visit = None
+    for fragment in fragments:
+        if fragment.patient_info:
+            for field, value in fragment.patient_info.model_dump(exclude_none=True).items():
+                patient_info.setdefault(field, value)
+        for symptom in fragment.symptoms or []:
+            matches = lexicon.find(symptom.name)
+            key = matches[0][0] if matches else " ".join(symptom.name.lower().split())
+            current = symptoms.get(key)
+            if current is None:
+                symptoms[key] = symptom.model_copy()
+                continue
+            if intensity_rank(symptom.intensity) > intensity_rank(current.intensity):
+                current.intensity = symptom.intensity
+            current.duration = current.duration or symptom.duration
+        summary = summary or fragment.summary
+        reason_for_visit = reason_for_visit or fragment.reason_for_visit
+
+    return MedicalExtraction(
+        summary=summary,
+        patient_info=PatientInfo(**patient_info),
+        symptoms=list(symptoms.values()),
+        reason_for_visit=reason_for_visit,
+    )
@@ -0,0 +1,93 @@
+import os
+import threading
+from functools import lru_cache
+from typing import List, Optional, Tuple
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+from utils.http_clients import openai_client_options
+from utils.instrumentation import InstrumentedEmbeddings
+from utils.local_embeddings import LocalOnnxEmbeddings
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Embedding backend of the severity classification: "openai" or "local" (ONNX model on CPU)
+SEVERITY_EMBEDDING_BACKEND = os.getenv("SEVERITY_EMBEDDING_BACKEND", "openai")
+
+# Reference descriptions of each severity level, symptoms get the level of the most similar one
+SEVERITY_ANCHORS = {
+    "mild": "Minor discomfort, slight symptoms, minimal impact on daily activities, barely noticeable",
+    "moderate": "Noticeable discomfort, some impact on daily activities, manageable symptoms, requires attention",
+    "severe": "Significant discomfort, major impact on daily activities, intense symptoms, major limitations",
+    "critical": "Life-threatening, emergency symptoms, extreme discomfort, requires urgent medical intervention",
+}
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+
+class SymptomSeverityClassifier:
+    """
+    Classify symptoms by cosine similarity to the severity anchors.
+    The anchors are embedded once per classifier and the symptoms of an
+    extraction are embedded in a single call.
+    """
+    def __init__(self, embeddings: Embeddings, backend: str = "custom") -> None:
+        self.embeddings = embeddings
+        self.backend = backend
+        self.severities = list(SEVERITY_ANCHORS)
+        self._anchors: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    def _anchor_vectors(self) -> np.ndarray:
+        with self._lock:
+            if self._anchors is None:
+                vectors = self.embeddings.embed_documents(list(SEVERITY_ANCHORS.values()))
+                self._anchors = _normalize(np.array(vectors, dtype=np.float32))
+            return self._anchors
+
+    def classify(self, texts: List[str]) -> List[Tuple[str, float]]:
+        """
+        Returns:
+            The severity of each text and the cosine similarity to its anchor, used as confidence
+        """
+        if not texts:
+            return []
+        anchors = self._anchor_vectors()
+        vectors = _normalize(np.array(self.embeddings.embed_documents(texts), dtype=np.float32))
+        similarities = vectors @ anchors.T
+        best = similarities.argmax(axis=1)
+        return [
+            (self.severities[anchor], float(similarities[row, anchor]))
+            for row, anchor in enumerate(best)
+        ]
+
+
+def build_embeddings(backend: str) -> Embeddings:
+    if backend == "local":
+        return LocalOnnxEmbeddings()
+    if backend == "openai":
+        # symptoms are short, no need to split them by tokens, which loads a tiktoken encoding
+        return InstrumentedEmbeddings(OpenAIEmbeddings(
+            model="text-embedding-3-small", check_embedding_ctx_length=False, **openai_client_options()
+        ))
+    raise ValueError(f"unknown embedding backend: {backend}")
+
+
+@lru_cache(maxsize=None)
+def get_severity_classifier(backend: str = SEVERITY_EMBEDDING_BACKEND) -> SymptomSeverityClassifier:
+    """
+    Classifier shared by the invocations of the instance, so the model and the
+    anchor embeddings are loaded once. Falls back to OpenAI embeddings when the
+    local model can't be loaded: missing files, or a tokenizer or ONNX model that
+    tokenizers and onnxruntime fail to read (they raise plain Exception/RuntimeError).
+    """
+    try:
+        return SymptomSeverityClassifier(build_embeddings(backend), backend)
+    except Exception as e:
+        if backend == "openai":
+            raise
+        logger.exception("failed to load %s embeddings, falling back to openai: %s", backend, e)
+        return get_severity_classifier("openai")
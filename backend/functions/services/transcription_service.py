@@ -1,25 +1,37 @@
 
 
 import io
-import os
 from dotenv import load_dotenv
-from openai import OpenAI
-import requests
 
+from repositories.audio_storage_repository import AUDIO_CONTENT_TYPES, download_object, parse_storage_url, upload_session_id
 from repositories.transcription_repository import save_transcription
+from repositories.session_fingerprint_repository import clone_finished_session, find_or_register_session
+from models.queue import Queue
+from models.session_fingerprint import FingerprintKind
 from models.transcription import Transcription, TranscriptionStatus
+from utils.http_clients import get_download_session, get_openai_client, request_timeout
+from utils.logger import get_logger
 
-load_dotenv()
+logger = get_logger(__name__)
 
-api_key = os.getenv("OPENAI_API_KEY")
-openai_client = OpenAI(api_key=api_key)
+load_dotenv()
 
 class TranscriptionService:
 
-    def process(self, audio_url: str, session_id: str) -> Transcription:
-        print('processing audio file')
+    def process(self, queue: Queue) -> Transcription:
+        logger.info("processing audio file")
+        audio_url, session_id = queue.audio_url, queue.session_id
         try:
-            audio_file: io.BytesIO = self._download_audio(audio_url, session_id)
+            audio_file: io.BytesIO = self._download_audio(queue)
+
+            # the same audio may have been submitted from another URL, uploads are checked when they are stored
+            if not queue.content_hash:
+                source_session_id = find_or_register_session(FingerprintKind.AUDIO, audio_file.getvalue(), session_id)
+                if source_session_id:
+                    transcription = clone_finished_session(source_session_id, session_id, audio_url)
+                    if transcription:
+                        return transcription
+
             transcription_result = self._transcribe_audio(audio_file)
             transcription = Transcription(
                     session_id=session_id,
@@ -33,22 +45,31 @@ class TranscriptionService:
             save_transcription(transcription)
             return transcription
         except Exception as e:
-            print(e)
+            logger.exception("failed to process audio file: %s", e)
             raise e
 
-    def _download_audio(self, audio_url: str, session_id: str) -> io.BytesIO:
-        print(f"Downloading audio from: {audio_url}")
-        response = requests.get(audio_url, stream=True)
-        response.raise_for_status()
-        content: bytes = response.content
+    def _download_audio(self, queue: Queue) -> io.BytesIO:
+        logger.debug("downloading audio from: %s", queue.audio_url)
+        storage_object = parse_storage_url(queue.audio_url)
+        if storage_object:
+            # only the upload of the session, queued by audio_upload_handler, is read with the function's credentials
+            if upload_session_id(*storage_object) != queue.session_id or None in (queue.content_hash, queue.size_bytes, queue.generation):
+                raise ValueError(f"{queue.audio_url} is not the audio upload of session {queue.session_id}")
+            # uploaded audio, read from the bucket with range requests
+            content: bytes = download_object(*storage_object, size=queue.size_bytes, generation=queue.generation)
+        else:
+            response = get_download_session().get(queue.audio_url, timeout=request_timeout())
+            response.raise_for_status()
+            content = response.content
         audio_file = io.BytesIO(content)
-        audio_file.name = f"audio_{session_id}.mp3"
-        print(f"audio downloaded for session {session_id}")
+        # the transcription API detects the format from the file extension
+        audio_file.name = f"audio_{queue.session_id}{AUDIO_CONTENT_TYPES.get(queue.content_type, '.mp3')}"
+        logger.info("audio downloaded for session %s", queue.session_id, extra={"audio_bytes": len(content)})
         return audio_file
 
 
     def _transcribe_audio(self, audio_file: io.BytesIO):
-        print("transcribing audio...")
+        logger.info("transcribing audio")
         medical_context = "Medical consultation recording. It may contain technical medical terminology, patient symptoms, diagnosis, treatment plan, medications, or clinical observations."
 
         # mocked for testing
@@ -60,8 +81,8 @@ class TranscriptionService:
             "temperature": 0.0,
         }
 
-        response = openai_client.audio.transcriptions.create(**transcription_params)
-        print("transcription generation finished")
+        response = get_openai_client().audio.transcriptions.create(**transcription_params)
+        logger.info("transcription generation finished")
 
         return {
             "text": response.text,
@@ -0,0 +1,118 @@
+import json
+import random
+from typing import Any
+
+import pytest
+from langchain_core.exceptions import OutputParserException
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from pydantic import BaseModel
+
+from utils.instrumentation import StageMetrics, current_stage
+from utils.structured_output import IncrementalJsonParser, StructuredLLM, parse_json
+
+CHARACTERS = ["a", "Z", " ", "é", "ñ", "\n", "\t", '"', "\\", "/", "\x01", "😀", "𝄞", "\ud83d", "\ude00", "中"]
+
+
+def random_string(rng: random.Random) -> str:
+    return "".join(rng.choice(CHARACTERS) for _ in range(rng.randint(0, 8)))
+
+
+def random_value(rng: random.Random, depth: int = 0) -> Any:
+    kind = rng.choice(["object", "array"] if depth == 0 else ["object", "array", "string", "number", "literal"])
+    if kind == "object" and depth < 4:
+        return {random_string(rng): random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))}
+    if kind == "array" and depth < 4:
+        return [random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))]
+    if kind == "number":
+        return rng.choice([rng.randint(-10**6, 10**6), rng.uniform(-1e3, 1e3), 0, -0.5e-7])
+    if kind == "literal":
+        return rng.choice([True, False, None])
+    return random_string(rng)
+
+
+def feed_in_chunks(document: str, rng: random.Random) -> Any:
+    parser = IncrementalJsonParser()
+    index = 0
+    while index < len(document):
+        size = rng.randint(1, 6)
+        parser.feed(document[index:index + size])
+        index += size
+    return parser.close()
+
+
+def test_chunked_parse_matches_json_loads():
+    rng = random.Random(20261019)
+    for _ in range(3000):
+        value = random_value(rng)
+        document = json.dumps(value, ensure_ascii=rng.random() < 0.5, indent=rng.choice([None, 2]))
+        assert feed_in_chunks(document, rng) == json.loads(document), document
+
+
+@pytest.mark.parametrize("document", [
+    '{"text": "\\ud83d\\ude00"}',
+    '{"text": "a\\ud83d\\ude00b\\ud834\\udd1e"}',
+    '{"text": "\\ud83d"}',
+    '{"text": "\\ud83d\\n"}',
+    '{"text": "\\ud83dx\\ude00"}',
+    '{"text": "\\ud83d\\u0041"}',
+    '{"text": "\\ud83d\\ud83d\\ude00"}',
+    '{"text": "\\ude00\\ud83d"}',
+])
+def test_surrogate_escapes_split_at_every_position(document):
+    expected = json.loads(document)
+    for split in range(1, len(document)):
+        parser = IncrementalJsonParser()
+        parser.feed(document[:split])
+        parser.feed(document[split:])
+        assert parser.close() == expected
+
+
+def test_escaped_surrogate_pair_is_valid_utf8():
+    text = parse_json('{"text": "\\ud83d\\ude00"}')["text"]
+    assert text == "😀"
+    assert text.encode("utf-8") == "😀".encode("utf-8")
+
+
+class Patient(BaseModel):
+    name: str
+    age: int
+
+
+def structured_llm(responses, max_repairs: int = 2):
+    # the fake model starts over after its last response, the extra one keeps `i` counting the calls
+    llm = FakeListChatModel(responses=responses + ["unused"])
+    return llm, StructuredLLM(llm, Patient, native=False, max_repairs=max_repairs)
+
+
+@pytest.fixture
+def stage():
+    metrics = StageMetrics(stage="test")
+    token = current_stage.set(metrics)
+    yield metrics
+    current_stage.reset(token)
+
+
+def test_repairs_until_valid_when_a_repair_is_still_invalid(stage):
+    llm, structured = structured_llm(['{"name": "Ana", "age": "unknown"}', '{"age": "still unknown"}', '{"age": 41}'])
+
+    assert structured.invoke("extract") == Patient(name="Ana", age=41)
+    # the first answer and two repairs
+    assert llm.i == 3
+    assert stage.output_repairs == 2
+
+
+def test_raises_once_the_repairs_are_used_up(stage):
+    llm, structured = structured_llm(['{"name": "Ana", "age": "unknown"}', '{"age": "no"}', '{"age": "nope"}'])
+
+    with pytest.raises(OutputParserException):
+        structured.invoke("extract")
+    assert llm.i == 3
+    assert stage.output_repairs == 2
+
+
+def test_valid_output_is_not_repaired(stage):
+    llm, structured = structured_llm(['{"name": "Ana", "age": 41}'])
+
+    assert structured.invoke("extract") == Patient(name="Ana", age=41)
+    assert llm.i == 1
+    assert stage.output_repairs == 0
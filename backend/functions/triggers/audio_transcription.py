@@ -2,7 +2,15 @@ from google.cloud.firestore import DocumentSnapshot
 from firebase_functions import firestore_fn
 from services.transcription_service import TranscriptionService
 from repositories.queue_repository import set_queue_processing_status
+from repositories.trigger_claim_repository import claim_stage, complete_stage_claim, release_stage_claim
 from models.queue import Queue, QueueStatus
+from utils.function_options import PIPELINE_STAGE_OPTIONS
+from utils.instrumentation import stage_metrics
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+STAGE = "transcription"
 
 def get_request_data(request_data: dict) -> tuple[str, str]:
     if not request_data:
@@ -16,16 +24,14 @@ def get_request_data(request_data: dict) -> tuple[str, str]:
 
     return audio_url, transcription_text
 
-@firestore_fn.on_document_created(
-    document="queue/{session_id}",
-    timeout_sec=300  # 5 minutes
-)
+@firestore_fn.on_document_created(document="queue/{session_id}", **PIPELINE_STAGE_OPTIONS)
 def transcription_handler(event: firestore_fn.Event[DocumentSnapshot]) -> None:
     """
     Firebase function to transcribe audio.
     """
+    claimed = False
     try:
-        print("starting transcription handler")
+        logger.info("starting transcription handler")
 
         session_id = event.params.get("session_id")
         assert session_id, "Session ID is required"
@@ -33,16 +39,26 @@ def transcription_handler(event: firestore_fn.Event[DocumentSnapshot]) -> None:
             data_dict = event.data.to_dict()
             queue = Queue(**data_dict)
         else:
-            print("Empty object provided on function invoke")
+            logger.warning("empty object provided on function invoke", extra={"session_id": session_id})
             return
 
-        transcription_service = TranscriptionService()
-
-        transcription_service.process(queue.audio_url, session_id)
+        claimed = claim_stage(session_id, STAGE, event.id)
+        if not claimed:
+            return
 
-        set_queue_processing_status(session_id, QueueStatus.FINISHED)
+        with stage_metrics(session_id, STAGE, event.time):
+            transcription_service = TranscriptionService()
+            transcription_service.process(queue)
+            # committed in the same batch as the transcription
+            set_queue_processing_status(session_id, QueueStatus.FINISHED)
+            complete_stage_claim(session_id, STAGE)
     except Exception as e:
-        print('An error occurred while executing transcription function')
+        logger.exception("an error occurred while executing transcription function", extra={"session_id": session_id})
         if session_id:
-            set_queue_processing_status(session_id, QueueStatus.ERROR)
+            try:
+                set_queue_processing_status(session_id, QueueStatus.ERROR)
+            finally:
+                # released even when the status can't be written, so a retry isn't dropped until the lease expires
+                if claimed:
+                    release_stage_claim(session_id, STAGE)
         raise
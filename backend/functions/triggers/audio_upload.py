@@ -0,0 +1,148 @@
+import json
+from firebase_admin import storage
+from firebase_functions import https_fn, storage_fn
+from middlewares.request_middleware import with_cors, with_methods, CORS_HEADERS
+from models.queue import Queue
+from models.session_fingerprint import FingerprintKind
+from models.transcription import Transcription, TranscriptionStatus
+from repositories.audio_storage_repository import (
+    AUDIO_CONTENT_TYPES,
+    AUDIO_MAX_UPLOAD_BYTES,
+    AUDIO_UPLOAD_BUCKET,
+    create_upload_url,
+    read_object,
+    session_id_of,
+    storage_url,
+)
+from repositories.queue_repository import add_to_queue
+from repositories.session_fingerprint_repository import clone_finished_session, find_or_register_hash, hash_chunks
+from repositories.transcription_repository import save_transcription
+from repositories.trigger_claim_repository import claim_stage, complete_stage_claim, release_stage_claim
+from triggers.start_process import generate_session_id
+from utils.function_options import PIPELINE_STAGE_OPTIONS, USER_FACING_OPTIONS
+from utils.instrumentation import stage_metrics
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+STAGE = "upload"
+
+
+def get_upload_request(request_data: dict) -> str:
+    if not request_data:
+        raise ValueError("No JSON data provided")
+
+    content_type = request_data.get("content_type")
+    size_bytes = request_data.get("size_bytes")
+
+    if content_type not in AUDIO_CONTENT_TYPES:
+        raise ValueError(f"content_type must be one of: {', '.join(AUDIO_CONTENT_TYPES)}")
+    if size_bytes is not None and (not isinstance(size_bytes, int) or not 0 < size_bytes <= AUDIO_MAX_UPLOAD_BYTES):
+        raise ValueError(f"size_bytes must be between 1 and {AUDIO_MAX_UPLOAD_BYTES}")
+
+    return content_type
+
+
+@https_fn.on_request(**USER_FACING_OPTIONS)
+@with_cors
+@with_methods(["POST"])
+def create_audio_upload(req: https_fn.Request) -> https_fn.Response:
+    """
+    Firebase function to start a session from an audio file uploaded to Cloud Storage.
+
+    Returns the session ID and the URL to upload the audio to, with the method
+    and headers of the upload request. The session starts when the upload completes.
+
+    request body:
+    {
+        "content_type": "audio/mpeg",
+        "size_bytes": 1048576
+    }
+    """
+    try:
+        content_type = get_upload_request(req.get_json())
+        session_id = generate_session_id()
+        upload = create_upload_url(session_id, content_type)
+        logger.info("created audio upload for session %s", session_id)
+        return https_fn.Response(
+            status=200,
+            response=json.dumps({"session_id": session_id, "status": TranscriptionStatus.TRANSCRIPTION_WAITING.value, "upload": upload}),
+            headers=CORS_HEADERS,
+        )
+    except ValueError as e:
+        logger.warning("validation error: %s", e)
+        return https_fn.Response(
+            status=400,
+            response=json.dumps({"error": str(e)}),
+            headers={"Content-Type": "application/json"},
+        )
+    except Exception as e:
+        logger.exception("error in create_audio_upload: %s", e)
+        return https_fn.Response(
+            status=500,
+            response=json.dumps({"error": f"Internal server error: {str(e)}"}),
+            headers={"Content-Type": "application/json"},
+        )
+
+
+@storage_fn.on_object_finalized(bucket=AUDIO_UPLOAD_BUCKET, **PIPELINE_STAGE_OPTIONS)
+def audio_upload_handler(event: storage_fn.CloudEvent[storage_fn.StorageObjectData]) -> None:
+    """
+    Firebase function triggered when an audio upload is stored in the bucket.
+
+    Computes the fingerprint of the audio once, reading it from the bucket with
+    range requests, then clones the session that already processed the same
+    audio or queues its transcription with a `gs://` reference to the upload.
+    """
+    upload = event.data
+    session_id = session_id_of(upload.name)
+    if not session_id:
+        return
+
+    # sent as strings in the event
+    size, generation = int(upload.size), int(upload.generation)
+    claimed = False
+    try:
+        if upload.content_type not in AUDIO_CONTENT_TYPES or size > AUDIO_MAX_UPLOAD_BYTES:
+            logger.warning(
+                "rejected upload %s (%s, %d bytes)", upload.name, upload.content_type, size,
+                extra={"session_id": session_id},
+            )
+            # the client polls the session it got from create_audio_upload
+            save_transcription(Transcription(
+                session_id=session_id,
+                text=None,
+                status=TranscriptionStatus.TRANSCRIPTION_ERROR.value,
+                error_message=(
+                    f"audio upload rejected: content type must be one of {', '.join(AUDIO_CONTENT_TYPES)} "
+                    f"and size at most {AUDIO_MAX_UPLOAD_BYTES} bytes (got {upload.content_type}, {size} bytes)"
+                ),
+            ))
+            storage.bucket(upload.bucket).blob(upload.name).delete()
+            return
+
+        claimed = claim_stage(session_id, STAGE, event.id)
+        if not claimed:
+            return
+
+        with stage_metrics(session_id, STAGE, event.time):
+            audio_url = storage_url(upload.bucket, upload.name)
+            content_hash = hash_chunks(
+                FingerprintKind.AUDIO, read_object(upload.bucket, upload.name, size, generation)
+            )
+            source_session_id = find_or_register_hash(FingerprintKind.AUDIO, content_hash, session_id)
+            if not source_session_id or not clone_finished_session(source_session_id, session_id, audio_url):
+                add_to_queue(Queue(
+                    session_id=session_id,
+                    audio_url=audio_url,
+                    content_hash=content_hash,
+                    content_type=upload.content_type,
+                    size_bytes=size,
+                    generation=generation,
+                ))
+            complete_stage_claim(session_id, STAGE)
+    except Exception:
+        logger.exception("an error occurred while ingesting audio upload %s", upload.name, extra={"session_id": session_id})
+        if claimed:
+            release_stage_claim(session_id, STAGE)
+        raise
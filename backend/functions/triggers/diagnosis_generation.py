@@ -3,40 +3,61 @@ from firebase_functions import firestore_fn
 from google.cloud.firestore import DocumentSnapshot
 from services.diagnosis_generation_service import DiagnosisGenerationService
 from repositories.transcription_repository import set_processing_status
-from models.clinical_record import ClinicalRecord
+from repositories.trigger_claim_repository import claim_stage, complete_stage_claim, release_stage_claim
+from models.clinical_record import ClinicalRecord, ReportStatus
 from models.transcription import TranscriptionStatus
+from utils.function_options import PIPELINE_STAGE_OPTIONS
+from utils.instrumentation import stage_metrics
+from utils.logger import get_logger
 
-@firestore_fn.on_document_created(
-    document="clinical_record/{session_id}",
-    timeout_sec=300  # 5 minutes
-)
+logger = get_logger(__name__)
+
+STAGE = "diagnosis"
+
+@firestore_fn.on_document_created(document="clinical_record/{session_id}", **PIPELINE_STAGE_OPTIONS)
 def diagnosis_generation_handler(event: firestore_fn.Event[DocumentSnapshot]) -> None:
     """
     Firebase function triggered when a clinical record document is created in Firestore.
     
     This function receives the clinical record data and should generate a diagnosis.
     """
+    claimed = False
     try:
         # Get the document data
         session_id = event.params.get("session_id")
         assert session_id, "Session ID is required"
-        print(f"Diagnosis generation triggered for session: {session_id}")
+        logger.info("diagnosis generation triggered for session: %s", session_id)
         if event.data:
             data_dict = event.data.to_dict()
             clinical_record = ClinicalRecord(**data_dict)
         else:
-            print("Empty object provided on function invoke")
+            logger.warning("empty object provided on function invoke", extra={"session_id": session_id})
             raise ValueError("Empty object provided on function invoke")
-        diagnosis_generation_service = DiagnosisGenerationService()
-        diagnosis_generation_service.process(clinical_record)
-        print('Diagnosis generation complete')
+
+        if clinical_record.report_status == ReportStatus.COMPLETED:
+            logger.info("diagnosis report already completed, skipping generation")
+            return
+
+        claimed = claim_stage(session_id, STAGE, event.id)
+        if not claimed:
+            return
+
+        with stage_metrics(session_id, STAGE, event.time):
+            diagnosis_generation_service = DiagnosisGenerationService()
+            diagnosis_generation_service.process(clinical_record)
+            complete_stage_claim(session_id, STAGE)
+        logger.info("diagnosis generation complete", extra={"session_id": session_id})
     except Exception as e:
-        print(f"Error in diagnosis_generation: {str(e)}")
+        logger.exception("error in diagnosis_generation: %s", e, extra={"session_id": session_id})
         if session_id:
             try:
                 set_processing_status(session_id, TranscriptionStatus.DIAGNOSIS_ERROR, str(e))
             except Exception as update_error:
-                print(f"Failed to update error status: {str(update_error)}")
+                logger.error("failed to update error status: %s", update_error, extra={"session_id": session_id})
+            finally:
+                # released even when the status can't be written, so a retry isn't dropped until the lease expires
+                if claimed:
+                    release_stage_claim(session_id, STAGE)
         raise
 
 
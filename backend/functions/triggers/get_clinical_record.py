@@ -1,10 +1,13 @@
-import json
 from firebase_functions import https_fn
 from repositories.clinical_record_repository import get_clinical_record_by_session
 from utils.request_utils import get_query_params
-from middlewares.request_middleware import with_cors, with_methods, CORS_HEADERS
+from middlewares.request_middleware import with_cors, with_methods, json_response
+from utils.function_options import USER_FACING_OPTIONS
+from utils.logger import get_logger
 
-@https_fn.on_request()
+logger = get_logger(__name__)
+
+@https_fn.on_request(**USER_FACING_OPTIONS)
 @with_cors
 @with_methods(["GET"])
 def get_clinical_record(req: https_fn.Request) -> https_fn.Response:
@@ -18,7 +21,7 @@ def get_clinical_record(req: https_fn.Request) -> https_fn.Response:
     - Clinical record data including symptoms, diagnosis, and treatment plan
     """
     try:
-        print('Retrieving clinical record')
+        logger.debug("retrieving clinical record")
         
         # Extract session_id from query parameters
         try:
@@ -27,38 +30,22 @@ def get_clinical_record(req: https_fn.Request) -> https_fn.Response:
             if not session_id:
                 raise ValueError("session_id not provided")
         except ValueError as e:
-            return https_fn.Response(
-                status=400,
-                response=json.dumps({"error": str(e)}),
-                headers=CORS_HEADERS
-            )
+            return json_response(req, {"error": str(e)}, status=400)
         
         # Retrieve clinical record data from Firestore
         try:
             clinical_record_data = get_clinical_record_by_session(session_id)
         except ValueError as e:
-            return https_fn.Response(
-                status=404,
-                response=json.dumps({"error": str(e)}),
-                headers=CORS_HEADERS
-            )
+            return json_response(req, {"error": str(e)}, status=404)
         
-        return https_fn.Response(
-            status=200,
-            response=json.dumps({
-                "success": True,
-                "data": clinical_record_data
-            }),
-            headers=CORS_HEADERS
-        )
+        return json_response(req, {
+            "success": True,
+            "data": clinical_record_data
+        })
         
     except Exception as e:
-        print(f"Error in clinical_record_handler: {str(e)}")
-        return https_fn.Response(
-            status=500,
-            response=json.dumps({
-                "error": "Internal server error",
-                "message": str(e)
-            }),
-            headers=CORS_HEADERS
-        )
+        logger.exception("error in clinical_record_handler: %s", e)
+        return json_response(req, {
+            "error": "Internal server error",
+            "message": str(e)
+        }, status=500)
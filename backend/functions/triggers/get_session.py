@@ -0,0 +1,122 @@
+from typing import List, Optional
+from firebase_functions import https_fn
+from repositories.clinical_record_repository import get_clinical_record_by_session
+from repositories.transcription_repository import get_transcription_by_session_id
+from utils.request_utils import get_query_params, get_fields_param, build_etag, etag_matches
+from middlewares.request_middleware import with_cors, with_methods, json_response, CORS_HEADERS
+from utils.function_options import USER_FACING_OPTIONS
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+TRANSCRIPTION_PREFIX = "transcription."
+CLINICAL_RECORD_PREFIX = "clinical_record."
+
+# Fields always read from Firestore since the ETag is keyed on them
+VERSION_FIELDS = ["session_id", "created_at", "updated_at"]
+
+
+def split_projection(fields: Optional[List[str]]) -> tuple[Optional[List[str]], Optional[List[str]]]:
+    """
+    Split a `fields=` projection into the fields of each document.
+
+    Fields prefixed with `transcription.` or `clinical_record.` are applied to
+    that document only. Fields without a prefix are applied to both documents.
+    """
+    if not fields:
+        return None, None
+
+    transcription_fields, clinical_record_fields = [], []
+    for field in fields:
+        if field.startswith(TRANSCRIPTION_PREFIX):
+            transcription_fields.append(field[len(TRANSCRIPTION_PREFIX):])
+        elif field.startswith(CLINICAL_RECORD_PREFIX):
+            clinical_record_fields.append(field[len(CLINICAL_RECORD_PREFIX):])
+        else:
+            transcription_fields.append(field)
+            clinical_record_fields.append(field)
+
+    return (
+        sorted(set(transcription_fields + VERSION_FIELDS)),
+        sorted(set(clinical_record_fields + VERSION_FIELDS)),
+    )
+
+
+def get_version(data: Optional[dict]) -> str:
+    """Return the value used to version a document in the ETag."""
+    if data is None:
+        return "missing"
+    return str(data.get("updated_at") or data.get("created_at") or "")
+
+
+@https_fn.on_request(**USER_FACING_OPTIONS)
+@with_cors
+@with_methods(["GET"])
+def get_session(req: https_fn.Request) -> https_fn.Response:
+    """
+    Firebase function to retrieve the transcription and clinical record of a session in one call.
+
+    Query parameters:
+    - session_id: The unique session identifier
+    - fields: Optional comma separated projection. Use `transcription.<field>` or
+      `clinical_record.<field>` to target a single document, e.g.
+      `fields=transcription.status,clinical_record.diagnosis`
+
+    Headers:
+    - If-None-Match: ETag returned by a previous call. A 304 is returned when the session didn't change.
+
+    Returns:
+    - Transcription and clinical record data (clinical_record is null until it is created)
+    """
+    try:
+        logger.debug("retrieving session")
+
+        # Extract session_id from query parameters
+        try:
+            params = get_query_params(req, ["session_id"])
+            session_id = params["session_id"]
+            if not session_id:
+                raise ValueError("session_id not provided")
+        except ValueError as e:
+            return json_response(req, {"error": str(e)}, status=400)
+
+        fields = get_fields_param(req)
+        transcription_fields, clinical_record_fields = split_projection(fields)
+
+        try:
+            transcription_data = get_transcription_by_session_id(session_id, transcription_fields)
+        except ValueError as e:
+            return json_response(req, {"error": str(e)}, status=404)
+
+        # The clinical record only exists once information extraction has finished
+        try:
+            clinical_record_data = get_clinical_record_by_session(session_id, clinical_record_fields)
+        except ValueError:
+            clinical_record_data = None
+
+        etag = build_etag(
+            session_id,
+            get_version(transcription_data),
+            get_version(clinical_record_data),
+            ",".join(fields or []),
+        )
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+        if etag_matches(req, etag):
+            return https_fn.Response(status=304, headers={**CORS_HEADERS, **headers})
+
+        return json_response(req, {
+            "success": True,
+            "data": {
+                "session_id": session_id,
+                "transcription": transcription_data,
+                "clinical_record": clinical_record_data,
+            }
+        }, headers=headers)
+
+    except Exception as e:
+        logger.exception("error in get_session: %s", e)
+        return json_response(req, {
+            "error": "Internal server error",
+            "message": str(e)
+        }, status=500)
@@ -1,10 +1,13 @@
-import json
 from firebase_functions import https_fn
 from utils.request_utils import get_query_params
-from middlewares.request_middleware import with_cors, with_methods, CORS_HEADERS
+from middlewares.request_middleware import with_cors, with_methods, json_response
 from repositories.transcription_repository import get_transcription_by_session_id
+from utils.function_options import USER_FACING_OPTIONS
+from utils.logger import get_logger
 
-@https_fn.on_request()
+logger = get_logger(__name__)
+
+@https_fn.on_request(**USER_FACING_OPTIONS)
 @with_cors
 @with_methods(["GET"])
 def get_transcription(req: https_fn.Request) -> https_fn.Response:
@@ -18,7 +21,7 @@ def get_transcription(req: https_fn.Request) -> https_fn.Response:
     - Transcription data including status, text, and metadata
     """
     try:
-        print('Retrieving transcription status')
+        logger.debug("retrieving transcription status")
       
         # Extract session_id from query parameters
         try:
@@ -27,32 +30,19 @@ def get_transcription(req: https_fn.Request) -> https_fn.Response:
             if not session_id:
                 raise ValueError("session_id not provided")
         except ValueError as e:
-            return https_fn.Response(
-                status=400,
-                response=json.dumps({"error": str(e)}),
-                headers=CORS_HEADERS
-            )
+            return json_response(req, {"error": str(e)}, status=400)
         
         # Retrieve transcription data from Firestore
         transcription_data = get_transcription_by_session_id(session_id)
 
-        return https_fn.Response(
-            status=200,
-            response=json.dumps({
-                "success": True,
-                "data": transcription_data
-            }),
-            headers=CORS_HEADERS
-        )
+        return json_response(req, {
+            "success": True,
+            "data": transcription_data
+        })
         
     except Exception as e:
-        print(f"Error in transcription_status_handler: {str(e)}")
-        return https_fn.Response(
-            status=500,
-            response=json.dumps({
-                "error": "Internal server error",
-                "message": str(e)
-            }),
-            headers=CORS_HEADERS
-        )
-
+        logger.exception("error in transcription_status_handler: %s", e)
+        return json_response(req, {
+            "error": "Internal server error",
+            "message": str(e)
+        }, status=500)
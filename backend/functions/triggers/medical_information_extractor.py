@@ -1,10 +1,18 @@
 from firebase_functions import firestore_fn
 from google.cloud.firestore import DocumentSnapshot
 from repositories.transcription_repository import set_processing_status
+from repositories.trigger_claim_repository import claim_stage, complete_stage_claim, release_stage_claim
 from models.transcription import Transcription, TranscriptionStatus
 from services.medical_info_extractor_service import MedicalInfoExtractor
+from utils.function_options import PIPELINE_STAGE_OPTIONS
+from utils.instrumentation import stage_metrics
+from utils.logger import get_logger
 
-@firestore_fn.on_document_created(document="transcriptions/{session_id}")
+logger = get_logger(__name__)
+
+STAGE = "information_extraction"
+
+@firestore_fn.on_document_created(document="transcriptions/{session_id}", **PIPELINE_STAGE_OPTIONS)
 def information_extractor_handler(event: firestore_fn.Event[DocumentSnapshot]) -> None:
     """
     Firebase function triggered when a transcription document is created in Firestore.
@@ -12,26 +20,42 @@ def information_extractor_handler(event: firestore_fn.Event[DocumentSnapshot]) -
     This function receives the transcription data and should extract medical information.
     For now, it only prints the received value as requested.
     """
+    claimed = False
     try:
         # Get the document data
         session_id = event.params.get("session_id")
         assert session_id, "Session ID is required"
-        print(f"Information extractor triggered for session: {session_id}")
+        logger.info("information extractor triggered for session: %s", session_id)
         if event.data:
             data_dict = event.data.to_dict()
             transcription = Transcription(**data_dict)
         else:
-            print("Empty object provided on function invoke")
+            logger.warning("empty object provided on function invoke", extra={"session_id": session_id})
             return
+
+        if transcription.source_session_id:
+            logger.info("session cloned from %s, skipping extraction", transcription.source_session_id)
+            return
+
+        claimed = claim_stage(session_id, STAGE, event.id)
+        if not claimed:
+            return
+
+        with stage_metrics(session_id, STAGE, event.time):
+            medical_info_extractor = MedicalInfoExtractor()
+            medical_info_extractor.process(transcription)
+            complete_stage_claim(session_id, STAGE)
         
-        medical_info_extractor = MedicalInfoExtractor()
-        medical_info_extractor.process(transcription)
-        
-        print('information extraction complete')
+        logger.info("information extraction complete", extra={"session_id": session_id})
     except Exception as e:
-        print(f"Error in information_extractor: {str(e)}")
+        logger.exception("error in information_extractor: %s", e, extra={"session_id": session_id})
         if session_id:
             try:
-                set_processing_status(session_id, TranscriptionStatus.TRANSCRIPTION_ERROR, str(e))
+                set_processing_status(session_id, TranscriptionStatus.INFORMATION_EXTRACTION_ERROR, str(e))
             except Exception as update_error:
-                print(f"Failed to update error status: {str(update_error)}")
+                logger.error("failed to update error status: %s", update_error, extra={"session_id": session_id})
+            finally:
+                # released even when the status can't be written, so a retry isn't dropped until the lease expires
+                if claimed:
+                    release_stage_claim(session_id, STAGE)
+        raise
@@ -1,13 +1,20 @@
 import requests
 import json
 import uuid
+from urllib.parse import urlparse
 from firebase_functions import https_fn
 from dotenv import load_dotenv
 from models.transcription import Transcription, TranscriptionStatus
 from middlewares.request_middleware import with_cors, with_methods, CORS_HEADERS
 from repositories.transcription_repository import save_transcription
 from repositories.queue_repository import add_to_queue
+from repositories.session_fingerprint_repository import find_or_register_session
 from models.queue import Queue
+from models.session_fingerprint import FingerprintKind
+from utils.function_options import USER_FACING_OPTIONS
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
 
 load_dotenv()
 
@@ -20,6 +27,11 @@ def get_request_data(request_data: dict) -> tuple[str, str]:
 
     if not audio_url and not transcription_text:
         raise ValueError("either audio_url or transcription_text must be provided")
+    if audio_url:
+        # uploaded audio is only referenced by the upload trigger, see create_audio_upload
+        url = urlparse(audio_url) if isinstance(audio_url, str) else None
+        if not url or url.scheme not in ("http", "https") or not url.netloc:
+            raise ValueError("audio_url must be an http or https URL")
 
     return audio_url, transcription_text
 
@@ -29,7 +41,7 @@ def generate_session_id() -> str:
     return str(uuid.uuid4())
 
 
-@https_fn.on_request()
+@https_fn.on_request(**USER_FACING_OPTIONS)
 @with_cors
 @with_methods(["POST"])
 def start_process(req: https_fn.Request) -> https_fn.Response:
@@ -44,13 +56,21 @@ def start_process(req: https_fn.Request) -> https_fn.Response:
 
     """
     try:
-        print("starting transcription")
+        logger.info("starting process")
 
         request_data = req.get_json()
         audio_url, transcription_text = get_request_data(request_data)
         session_id: str = generate_session_id()
 
         if audio_url:
+            existing_session_id = find_or_register_session(FingerprintKind.AUDIO_URL, audio_url, session_id)
+            if existing_session_id:
+                return https_fn.Response(
+                    status=200,
+                    response=json.dumps({"session_id": existing_session_id, "status": TranscriptionStatus.TRANSCRIPTION_WAITING.value, "deduplicated": True }),
+                    headers=CORS_HEADERS,
+                )
+
             # add to transcription queue
             add_to_queue(Queue(session_id=session_id, audio_url=audio_url))
             return https_fn.Response(
@@ -59,6 +79,14 @@ def start_process(req: https_fn.Request) -> https_fn.Response:
                 headers=CORS_HEADERS,
             )
 
+        existing_session_id = find_or_register_session(FingerprintKind.TEXT, transcription_text, session_id)
+        if existing_session_id:
+            return https_fn.Response(
+                status=200,
+                response=json.dumps({"session_id": existing_session_id, "status": TranscriptionStatus.TRANSCRIPTION_FINISHED, "deduplicated": True }),
+                headers=CORS_HEADERS,
+            )
+
         # transcription already provided
         transcription = Transcription(
             session_id=session_id,
@@ -73,7 +101,7 @@ def start_process(req: https_fn.Request) -> https_fn.Response:
             headers=CORS_HEADERS,
         )
     except ValueError as e:
-        print(f"Validation error: {str(e)}")
+        logger.warning("validation error: %s", e)
         return https_fn.Response(
             status=400,
             response=json.dumps({"error": str(e)}),
@@ -81,7 +109,7 @@ def start_process(req: https_fn.Request) -> https_fn.Response:
         )
 
     except requests.RequestException as e:
-        print(f"Error downloading audio: {str(e)}")
+        logger.warning("error downloading audio: %s", e)
         return https_fn.Response(
             status=400,
             response=json.dumps({"error": f"Failed to download audio file: {str(e)}"}),
@@ -89,7 +117,7 @@ def start_process(req: https_fn.Request) -> https_fn.Response:
         )
 
     except Exception as e:
-        print(f"Error in transcription function: {str(e)}")
+        logger.exception("error in start_process: %s", e)
         return https_fn.Response(
             status=500,
             response=json.dumps({"error": f"Internal server error: {str(e)}"}),
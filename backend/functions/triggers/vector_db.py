@@ -1,60 +1,45 @@
-import json
 from firebase_functions import https_fn
-from middlewares.request_middleware import CORS_HEADERS, with_cors, with_methods
+from middlewares.request_middleware import with_cors, with_methods, json_response
 from repositories.medical_knowledge_base_repository import MedicalKnowledgeRepository
+from utils.function_options import KNOWLEDGE_BASE_OPTIONS
+from utils.logger import get_logger
 
-@https_fn.on_request()
+logger = get_logger(__name__)
+
+@https_fn.on_request(**KNOWLEDGE_BASE_OPTIONS)
 @with_cors
 @with_methods(["POST"])
 def load_documents(req: https_fn.Request) -> https_fn.Response:
     try:
         repository = MedicalKnowledgeRepository()
         repository.load_documents()
-        return https_fn.Response(
-            status=200,
-            response=json.dumps({
-                "success": True
-            }),
-            headers=CORS_HEADERS
-        )
+        return json_response(req, {"success": True})
     except Exception as e:
-        print(f"an error occurred while creating vector db: {e}")
-        return https_fn.Response(
-            status=500,
-            response=json.dumps({
-                "error": "Internal server error",
-                "message": str(e)
-            }),
-            headers=CORS_HEADERS
-        )
+        logger.exception("an error occurred while accessing the vector db: %s", e)
+        return json_response(req, {
+            "error": "Internal server error",
+            "message": str(e)
+        }, status=500)
 
-@https_fn.on_request()
+@https_fn.on_request(**KNOWLEDGE_BASE_OPTIONS)
 @with_cors
 @with_methods(["GET"])
 def get_index_stats(req: https_fn.Request) -> https_fn.Response:
     try:
         repository = MedicalKnowledgeRepository()
         index_stats = repository.get_index_stats()
-        return https_fn.Response(
-            status=200,
-            response=json.dumps({
-                "success": True,
-                "index_stats": index_stats
-            }),
-            headers=CORS_HEADERS
-        )
+        return json_response(req, {
+            "success": True,
+            "index_stats": index_stats
+        })
     except Exception as e:
-        print(f"an error occurred while creating vector db: {e}")
-        return https_fn.Response(
-            status=500,
-            response=json.dumps({
-                "error": "Internal server error",
-                "message": str(e)
-            }),
-            headers=CORS_HEADERS
-        )
+        logger.exception("an error occurred while accessing the vector db: %s", e)
+        return json_response(req, {
+            "error": "Internal server error",
+            "message": str(e)
+        }, status=500)
 
-@https_fn.on_request()
+@https_fn.on_request(**KNOWLEDGE_BASE_OPTIONS)
 @with_cors
 @with_methods(["POST"])
 def query_documents(req: https_fn.Request) -> https_fn.Response:
@@ -65,35 +50,23 @@ def query_documents(req: https_fn.Request) -> https_fn.Response:
             raise ValueError("missing query")
 
         repository = MedicalKnowledgeRepository()
-        documents = repository.retrieve_full_docs(query)
-
-        documents_list = []
-        for doc in documents:
-            documents_list.append({
-                "page_content": doc.page_content,
-                "metadata": doc.metadata
-            })
+        documents = repository.retrieve_full_docs(query, filter=request_data.get("filter"), namespace=request_data.get("namespace"))
 
-        return https_fn.Response(
-            status=200,
-            response=json.dumps({
-                "success": True,
-                "documents": documents_list
-            }),
-            headers=CORS_HEADERS
-        )
+        return json_response(req, {
+            "success": True,
+            "documents": [
+                {"page_content": doc.page_content, "metadata": doc.metadata}
+                for doc in documents
+            ]
+        })
     except Exception as e:
-        print(f"an error occurred while creating vector db: {e}")
-        return https_fn.Response(
-            status=500,
-            response=json.dumps({
-                "error": "Internal server error",
-                "message": str(e)
-            }),
-            headers=CORS_HEADERS
-        )
+        logger.exception("an error occurred while accessing the vector db: %s", e)
+        return json_response(req, {
+            "error": "Internal server error",
+            "message": str(e)
+        }, status=500)
 
-@https_fn.on_request()
+@https_fn.on_request(**KNOWLEDGE_BASE_OPTIONS)
 @with_cors
 @with_methods(["POST"])
 def similarity_search(req: https_fn.Request) -> https_fn.Response:
@@ -104,30 +77,18 @@ def similarity_search(req: https_fn.Request) -> https_fn.Response:
             raise ValueError("missing query")
 
         repository = MedicalKnowledgeRepository()
-        documents = repository.similarity_search(query)
-
-        documents_list = []
-        for doc in documents:
-            documents_list.append({
-                "page_content": doc.page_content,
-                "metadata": doc.metadata
-            })
+        documents = repository.similarity_search(query, filter=request_data.get("filter"), namespace=request_data.get("namespace"))
 
-        return https_fn.Response(
-            status=200,
-            response=json.dumps({
-                "success": True,
-                "documents": documents_list
-            }),
-            headers=CORS_HEADERS
-        )
+        return json_response(req, {
+            "success": True,
+            "documents": [
+                {"page_content": doc.page_content, "metadata": doc.metadata}
+                for doc in documents
+            ]
+        })
     except Exception as e:
-        print(f"an error occurred while creating vector db: {e}")
-        return https_fn.Response(
-            status=500,
-            response=json.dumps({
-                "error": "Internal server error",
-                "message": str(e)
-            }),
-            headers=CORS_HEADERS
-        )
\ No newline at end of file
+        logger.exception("an error occurred while accessing the vector db: %s", e)
+        return json_response(req, {
+            "error": "Internal server error",
+            "message": str(e)
+        }, status=500)
\ No newline at end of file
@@ -0,0 +1,136 @@
+from functools import lru_cache
+from typing import List, Optional, Tuple
+import tiktoken
+from langchain.schema import Document
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Upper bound of the overlap between consecutive chunks of the same document (the knowledge base sections don't overlap)
+MAX_CHUNK_OVERLAP = 300
+# Shorter matches are treated as coincidences rather than splitter overlap
+MIN_CHUNK_OVERLAP = 20
+# Encoding used by gpt-4o / gpt-4.1 model families
+DEFAULT_ENCODING = "o200k_base"
+# Characters per token of the estimate used when the encoding can't be loaded, about 4 for English text
+ESTIMATE_CHARS_PER_TOKEN = 4
+
+
+class CharacterEstimateEncoding:
+    """
+    Stand-in for a tiktoken encoding splitting the text in fixed size character
+    chunks, so token budgets are still roughly respected without the BPE file.
+    """
+    name = "character_estimate"
+
+    def encode(self, text: str, **kwargs) -> List[str]:
+        return [text[start:start + ESTIMATE_CHARS_PER_TOKEN] for start in range(0, len(text), ESTIMATE_CHARS_PER_TOKEN)]
+
+    def decode(self, tokens: List[str]) -> str:
+        return "".join(tokens)
+
+
+@lru_cache(maxsize=None)
+def get_encoding(encoding_name: str = DEFAULT_ENCODING):
+    """
+    The tiktoken encoding, loaded once per instance. tiktoken downloads its BPE
+    file the first time (unless it is in TIKTOKEN_CACHE_DIR), when the download
+    fails the token counts are estimated from the text length instead.
+    """
+    try:
+        return tiktoken.get_encoding(encoding_name)
+    except Exception as e:
+        logger.error("failed to load the %s encoding, estimating token counts: %s", encoding_name, e)
+        return CharacterEstimateEncoding()
+
+
+class ContextAssembler:
+    """
+    Pack retrieved chunks into a prompt context without exceeding a token budget.
+
+    Chunks are ranked by score, the overlap produced by the text splitter is
+    removed and chunks are added until the budget is reached.
+    """
+    def __init__(self, token_budget: int, encoding_name: str = DEFAULT_ENCODING) -> None:
+        self.token_budget = token_budget
+        self.encoding = get_encoding(encoding_name)
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, token_budget: Optional[int] = None) -> str:
+        """Truncate a text to the given token budget (defaults to the assembler budget)."""
+        budget = self.token_budget if token_budget is None else token_budget
+        tokens = self.encoding.encode(text, disallowed_special=())
+        if len(tokens) <= budget:
+            return text
+        return self.encoding.decode(tokens[:budget])
+
+    def assemble(self, scored_docs: List[Tuple[Document, float]]) -> str:
+        """
+        Build the context from (document, score) pairs, higher scores first.
+
+        Returns:
+            str: The context as a bullet list, or an empty string if there are no documents.
+        """
+        ranked = sorted(scored_docs, key=lambda pair: pair[1], reverse=True)
+
+        selected: List[Document] = []
+        context_parts: List[str] = []
+        used_tokens = 0
+        for doc, _ in ranked:
+            content = self._remove_overlap(doc, selected)
+            if not content:
+                continue
+
+            part = f"- {content}"
+            # account for the newline joining the parts
+            part_tokens = self.count_tokens(part) + 1
+            if used_tokens + part_tokens > self.token_budget:
+                # a smaller chunk further down the ranking might still fit
+                continue
+
+            selected.append(Document(page_content=content, metadata=doc.metadata))
+            context_parts.append(part)
+            used_tokens += part_tokens
+
+        logger.info(
+            "assembled context with %d/%d chunks (%d/%d tokens)",
+            len(context_parts), len(ranked), used_tokens, self.token_budget
+        )
+        return "\n".join(context_parts)
+
+    def _remove_overlap(self, doc: Document, selected: List[Document]) -> str:
+        """
+        Remove the text already present in selected chunks of the same document.
+        Returns an empty string when the chunk is fully covered.
+        """
+        content = doc.page_content.strip()
+        source = doc.metadata.get("disease_name")
+
+        for other in selected:
+            if other.metadata.get("disease_name") != source:
+                continue
+            if content in other.page_content:
+                return ""
+            # chunk starts with the tail of a selected chunk
+            overlap = self._overlap_length(other.page_content, content)
+            if overlap:
+                content = content[overlap:].strip()
+            # chunk ends with the head of a selected chunk
+            overlap = self._overlap_length(content, other.page_content)
+            if overlap:
+                content = content[:-overlap].strip()
+            if not content:
+                return ""
+
+        return content
+
+    @staticmethod
+    def _overlap_length(first: str, second: str) -> int:
+        """Length of the longest suffix of `first` that is also a prefix of `second`."""
+        max_length = min(len(first), len(second), MAX_CHUNK_OVERLAP)
+        for length in range(max_length, MIN_CHUNK_OVERLAP - 1, -1):
+            if first.endswith(second[:length]):
+                return length
+        return 0
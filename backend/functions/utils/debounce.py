@@ -0,0 +1,34 @@
+import time
+from typing import Callable, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+class Debouncer(Generic[T]):
+    """
+    Forward the latest pushed value to a callback at most once every `interval` seconds.
+
+    Values pushed in between are coalesced, only the most recent one is written.
+    Call `flush` at the end to make sure the last value is forwarded.
+    """
+    def __init__(self, callback: Callable[[T], None], interval: float) -> None:
+        self.callback = callback
+        self.interval = interval
+        self._last_call: Optional[float] = None
+        self._pending: Optional[T] = None
+        self._has_pending = False
+
+    def push(self, value: T) -> None:
+        self._pending = value
+        self._has_pending = True
+        now = time.monotonic()
+        if self._last_call is None or now - self._last_call >= self.interval:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._has_pending:
+            return
+        value = self._pending
+        self._pending = None
+        self._has_pending = False
+        self._last_call = time.monotonic()
+        self.callback(value)
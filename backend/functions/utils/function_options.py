@@ -0,0 +1,42 @@
+import os
+
+
+def runtime_options(
+    prefix: str,
+    min_instances: int,
+    max_instances: int,
+    concurrency: int,
+    memory_mb: int,
+    cpu: int,
+    timeout_sec: int,
+) -> dict:
+    """
+    Runtime options of a group of functions, passed to their decorator. Each one
+    can be overridden at deploy time with a `<prefix>_<OPTION>` variable, e.g.
+    `USER_FACING_MIN_INSTANCES=2`.
+    """
+    def option(name: str, default: int) -> int:
+        return int(os.getenv(f"{prefix}_{name}", str(default)))
+
+    return {
+        "min_instances": option("MIN_INSTANCES", min_instances),
+        "max_instances": option("MAX_INSTANCES", max_instances),
+        "concurrency": option("CONCURRENCY", concurrency),
+        "memory": option("MEMORY_MB", memory_mb),
+        "cpu": option("CPU", cpu),
+        "timeout_sec": option("TIMEOUT_SEC", timeout_sec),
+    }
+
+
+# Submissions and the status polled by the frontend: one instance kept warm, serving many short requests
+USER_FACING_OPTIONS = runtime_options(
+    "USER_FACING", min_instances=1, max_instances=10, concurrency=80, memory_mb=512, cpu=1, timeout_sec=60
+)
+# Firestore triggered stages: mostly waiting on the OpenAI API, so several sessions per instance and more instances
+PIPELINE_STAGE_OPTIONS = runtime_options(
+    "PIPELINE_STAGE", min_instances=0, max_instances=20, concurrency=8, memory_mb=1024, cpu=1, timeout_sec=300
+)
+# Knowledge base administration and queries: rare calls, loading the documents embeds all of them
+KNOWLEDGE_BASE_OPTIONS = runtime_options(
+    "KNOWLEDGE_BASE_FUNCTIONS", min_instances=0, max_instances=2, concurrency=4, memory_mb=1024, cpu=1, timeout_sec=540
+)
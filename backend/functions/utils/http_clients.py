@@ -0,0 +1,92 @@
+import os
+from functools import lru_cache
+from typing import Tuple
+import httpx
+import requests
+from openai import DefaultHttpxClient, OpenAI
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import h2  # noqa: F401
+except ImportError:  # HTTP/2 is optional, the OpenAI API is then called over HTTP/1.1
+    h2 = None
+
+# Seconds to open a connection (TCP and TLS handshakes)
+HTTP_CONNECT_TIMEOUT_SEC = float(os.getenv("HTTP_CONNECT_TIMEOUT_SEC", "5"))
+# Seconds without receiving data before a request fails, with the retries it stays below the 300s of the pipeline stages
+HTTP_READ_TIMEOUT_SEC = float(os.getenv("HTTP_READ_TIMEOUT_SEC", "60"))
+# Connections per host kept open for reuse: the concurrent sessions of an instance times their parallel calls
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "32"))
+# Seconds an idle connection is kept open
+HTTP_KEEPALIVE_EXPIRY_SEC = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SEC", "60"))
+# Retries of a failed request (connection errors, timeouts, 429 and 5xx responses) with exponential backoff
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+# Base seconds of the backoff between the retries of the audio downloads
+HTTP_RETRY_BACKOFF_SEC = float(os.getenv("HTTP_RETRY_BACKOFF_SEC", "0.5"))
+# Multiplex the parallel OpenAI calls over one connection when the h2 package is installed
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def request_timeout() -> Tuple[float, float]:
+    """(connect, read) timeout of the urllib3 requests: audio downloads and Pinecone upserts."""
+    return HTTP_CONNECT_TIMEOUT_SEC, HTTP_READ_TIMEOUT_SEC
+
+
+def retry_policy() -> Retry:
+    """urllib3 retry policy of the audio downloads (idempotent methods only)."""
+    return Retry(
+        total=HTTP_MAX_RETRIES,
+        backoff_factor=HTTP_RETRY_BACKOFF_SEC,
+        status_forcelist=RETRY_STATUSES,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_http_client() -> httpx.Client:
+    """
+    httpx client shared by the OpenAI clients of the instance (transcription,
+    LangChain chat models and embeddings), so they reuse its keep-alive
+    connections instead of opening one per call.
+    """
+    return DefaultHttpxClient(
+        http2=HTTP2_ENABLED and h2 is not None,
+        timeout=httpx.Timeout(HTTP_READ_TIMEOUT_SEC, connect=HTTP_CONNECT_TIMEOUT_SEC),
+        limits=httpx.Limits(
+            max_connections=HTTP_POOL_SIZE,
+            max_keepalive_connections=HTTP_POOL_SIZE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SEC,
+        ),
+    )
+
+
+def openai_client_options() -> dict:
+    """
+    Arguments of the OpenAI and LangChain OpenAI clients: the shared connections,
+    timeouts and the retries of the OpenAI SDK, which back off on 429 and 5xx
+    responses and honor their Retry-After header.
+    """
+    return {
+        "http_client": get_http_client(),
+        "timeout": httpx.Timeout(HTTP_READ_TIMEOUT_SEC, connect=HTTP_CONNECT_TIMEOUT_SEC),
+        "max_retries": HTTP_MAX_RETRIES,
+    }
+
+
+@lru_cache(maxsize=1)
+def get_openai_client() -> OpenAI:
+    return OpenAI(**openai_client_options())
+
+
+@lru_cache(maxsize=1)
+def get_download_session() -> requests.Session:
+    """Session of the audio downloads, with a pool of keep-alive connections per host and retries."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry_policy())
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
@@ -0,0 +1,174 @@
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass, field, fields
+from datetime import datetime, timezone
+from typing import Any, Iterator, List, Optional
+from langchain_core.embeddings import Embeddings
+from utils.logger import get_logger, bind_log_context
+
+logger = get_logger(__name__)
+
+try:
+    from opentelemetry import trace
+    tracer = trace.get_tracer("telepatia.pipeline")
+except ImportError:  # tracing is optional, metrics are still persisted without it
+    trace = None
+    tracer = None
+
+
+@dataclass
+class StageMetrics:
+    """
+    Metrics collected while a pipeline stage runs.
+    """
+    stage: str
+    queue_wait_ms: Optional[float] = None
+    wall_time_ms: float = 0.0
+    llm_calls: int = 0
+    output_repairs: int = 0
+    prompt_tokens: int = 0
+    cached_prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+    embedding_calls: int = 0
+    embedded_texts: int = 0
+    firestore_reads: int = 0
+    firestore_writes: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    route: Optional[str] = None
+    status: str = "ok"
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def add(self, **counters: int) -> None:
+        with self._lock:
+            for name, value in counters.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def to_dict(self) -> dict:
+        return {f.name: getattr(self, f.name) for f in fields(self) if f.name != "_lock"}
+
+
+current_stage: ContextVar[Optional[StageMetrics]] = ContextVar("current_stage", default=None)
+
+
+def _record(**counters: int) -> None:
+    metrics = current_stage.get()
+    if metrics:
+        metrics.add(**counters)
+
+
+def record_llm_usage(prompt_tokens: int, completion_tokens: int, calls: int = 1, cached_prompt_tokens: int = 0) -> None:
+    """
+    Record the token usage of LLM calls (e.g. from get_openai_callback).
+    `cached_prompt_tokens` are the prompt tokens served from the provider prompt cache.
+    """
+    _record(
+        llm_calls=calls,
+        prompt_tokens=prompt_tokens,
+        cached_prompt_tokens=cached_prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens,
+    )
+
+
+def record_output_repair() -> None:
+    """Record an LLM call repairing a malformed structured output."""
+    _record(output_repairs=1)
+
+
+def record_route(route: str) -> None:
+    """Record the path taken by the current stage, e.g. the diagnosis route."""
+    metrics = current_stage.get()
+    if metrics:
+        metrics.route = route
+
+
+def record_embedding_call(texts: int = 1) -> None:
+    _record(embedding_calls=1, embedded_texts=texts)
+
+
+def record_firestore_read(count: int = 1) -> None:
+    _record(firestore_reads=count)
+
+
+def record_firestore_write(count: int = 1) -> None:
+    _record(firestore_writes=count)
+
+
+def record_cache(hit: bool) -> None:
+    if hit:
+        _record(cache_hits=1)
+    else:
+        _record(cache_misses=1)
+
+
+@contextmanager
+def traced(name: str, **attributes: Any) -> Iterator[None]:
+    """Wrap a block in an OpenTelemetry span when tracing is available."""
+    if not tracer:
+        yield
+        return
+    with tracer.start_as_current_span(name, attributes=attributes):
+        yield
+
+
+@contextmanager
+def stage_metrics(session_id: str, stage: str, event_time: Optional[datetime] = None) -> Iterator[StageMetrics]:
+    """
+    Collect the metrics of a pipeline stage and persist them on the session once it ends.
+    The Firestore writes of the stage are buffered and committed in a single batch
+    when the stage ends, see `repositories.session_state`.
+
+    Args:
+        session_id: The session processed by the stage
+        stage: The stage name, used as key of the `metrics` map
+        event_time: Time of the event that triggered the stage, used to compute the queue wait
+    """
+    # imported here to avoid a circular import, the repositories record their own reads and writes
+    from repositories.session_state import buffered_writes
+    from repositories.transcription_repository import save_stage_metrics
+
+    metrics = StageMetrics(stage=stage)
+    if event_time:
+        metrics.queue_wait_ms = round((datetime.now(timezone.utc) - event_time).total_seconds() * 1000, 1)
+
+    token = current_stage.set(metrics)
+    started_at = time.perf_counter()
+    span_context = tracer.start_as_current_span(stage, attributes={"session_id": session_id}) if tracer else nullcontext()
+    with bind_log_context(session_id=session_id, stage=stage), span_context as span, buffered_writes() as session_state:
+        try:
+            yield metrics
+        except Exception:
+            metrics.status = "error"
+            raise
+        finally:
+            metrics.wall_time_ms = round((time.perf_counter() - started_at) * 1000, 1)
+            metrics.add(firestore_writes=session_state.write_count())
+            current_stage.reset(token)
+            if span is not None:
+                span.set_attributes({
+                    f"pipeline.{key}": value
+                    for key, value in metrics.to_dict().items()
+                    if value is not None
+                })
+            try:
+                save_stage_metrics(session_id, stage, metrics.to_dict())
+            except Exception as e:
+                logger.error("failed to save %s metrics for session %s: %s", stage, session_id, e)
+
+
+class InstrumentedEmbeddings(Embeddings):
+    """Embeddings wrapper counting the embedding calls of the current stage."""
+    def __init__(self, embeddings: Embeddings) -> None:
+        self.embeddings = embeddings
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        record_embedding_call(len(texts))
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        record_embedding_call(1)
+        return self.embeddings.embed_query(text)
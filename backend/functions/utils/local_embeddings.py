@@ -0,0 +1,81 @@
+import os
+from typing import List
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+try:
+    import onnxruntime
+    from tokenizers import Tokenizer
+except ImportError:  # the local backend is optional, the OpenAI embeddings are used without it
+    onnxruntime = None
+    Tokenizer = None
+
+# Directory with the ONNX export of a sentence embedding model and its tokenizer.json,
+# e.g. the int8 quantized export of sentence-transformers/all-MiniLM-L6-v2
+LOCAL_EMBEDDING_MODEL_DIR = os.getenv(
+    "LOCAL_EMBEDDING_MODEL_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "embedding_model"),
+)
+# ONNX file inside the model directory
+LOCAL_EMBEDDING_MODEL_FILE = os.getenv("LOCAL_EMBEDDING_MODEL_FILE", "model_quantized.onnx")
+# Symptoms are short, longer inputs are truncated
+LOCAL_EMBEDDING_MAX_TOKENS = int(os.getenv("LOCAL_EMBEDDING_MAX_TOKENS", "128"))
+
+
+class LocalOnnxEmbeddings(Embeddings):
+    """
+    Sentence embeddings computed on CPU with onnxruntime.
+    Token embeddings are mean pooled over the attention mask and L2 normalized,
+    as done by sentence-transformers.
+    """
+    def __init__(
+        self,
+        model_dir: str = LOCAL_EMBEDDING_MODEL_DIR,
+        model_file: str = LOCAL_EMBEDDING_MODEL_FILE,
+        max_tokens: int = LOCAL_EMBEDDING_MAX_TOKENS,
+    ) -> None:
+        if onnxruntime is None or Tokenizer is None:
+            raise ImportError("onnxruntime and tokenizers are required for local embeddings")
+        # the model directory isn't in the repository, it is added at build time
+        tokenizer_path, model_path = os.path.join(model_dir, "tokenizer.json"), os.path.join(model_dir, model_file)
+        for path in (tokenizer_path, model_path):
+            if not os.path.isfile(path):
+                raise FileNotFoundError(f"local embedding model file not found: {path}")
+
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=max_tokens)
+        self.tokenizer.enable_padding()
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(
+            model_path,
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        logger.info("loaded local embedding model %s", model_path)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        encodings = self.tokenizer.encode_batch(texts)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        inputs = {
+            "input_ids": np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+            "attention_mask": attention_mask,
+        }
+        if "token_type_ids" in self.input_names:
+            inputs["token_type_ids"] = np.array([encoding.type_ids for encoding in encodings], dtype=np.int64)
+
+        token_embeddings = self.session.run(None, inputs)[0]
+        mask = attention_mask[..., np.newaxis].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        normalized = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return normalized.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
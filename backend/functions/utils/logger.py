@@ -0,0 +1,117 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Iterator
+
+# Minimum level of the emitted records (DEBUG, INFO, WARNING, ERROR)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Share of DEBUG/INFO records kept (0-1). Warnings and errors are never sampled out.
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+
+ROOT_LOGGER_NAME = "telepatia"
+
+# Attributes of a LogRecord that are not user provided extras
+RESERVED_ATTRIBUTES = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime", "context"}
+
+log_context: ContextVar[Dict[str, Any]] = ContextVar("log_context", default={})
+
+
+@contextmanager
+def bind_log_context(**fields: Any) -> Iterator[None]:
+    """
+    Attach correlation fields (e.g. session_id, stage) to every record logged inside the block.
+    """
+    token = log_context.set({**log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        log_context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Capture the correlation fields on the calling thread, before the record is queued."""
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.context = log_context.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a random share of the records below WARNING."""
+    def __init__(self, rate: float) -> None:
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format records as single line JSON, using the field names understood by Cloud Logging.
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "severity": record.levelname,
+            "message": record.getMessage(),
+            "logger": record.name,
+        }
+        entry.update(getattr(record, "context", {}))
+        for key, value in record.__dict__.items():
+            if key not in RESERVED_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Queue records without formatting them, the message is only built by the listener thread.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def _configure() -> logging.Logger:
+    logger = logging.getLogger(ROOT_LOGGER_NAME)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(LOG_SAMPLE_RATE))
+    queue_handler.addFilter(ContextFilter())
+    logger.addHandler(queue_handler)
+
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    # flush the queued records before the instance shuts down
+    atexit.register(listener.stop)
+    return logger
+
+
+root_logger = _configure()
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Return a logger writing structured JSON records through the non-blocking handler.
+
+    Use lazy formatting, e.g. `logger.info("saved session %s", session_id)`, so
+    the message is only formatted when the record is emitted.
+    """
+    return root_logger.getChild(name)
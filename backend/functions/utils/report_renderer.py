@@ -0,0 +1,48 @@
+import os
+from functools import lru_cache
+from typing import Any, Union
+from jinja2 import Environment, FileSystemLoader, Template
+from pydantic import BaseModel
+from models.clinical_record import ClinicalRecord, DiagnosisList
+from models.treatment_plan import TreatmentPlan
+
+TEMPLATES_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
+REPORT_TEMPLATE = "diagnosis_report.md.j2"
+
+
+@lru_cache(maxsize=1)
+def get_report_template() -> Template:
+    """Load and compile the report template once per instance."""
+    environment = Environment(
+        loader=FileSystemLoader(TEMPLATES_FOLDER),
+        trim_blocks=True,
+        lstrip_blocks=True,
+        keep_trailing_newline=True,
+    )
+    return environment.get_template(REPORT_TEMPLATE)
+
+
+def _as_dict(value: Any) -> dict:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    return value or {}
+
+
+def render_diagnosis_report(
+    clinical_record: ClinicalRecord,
+    diagnosis: Union[DiagnosisList, dict],
+    treatment_plan: Union[TreatmentPlan, dict],
+) -> str:
+    """
+    Render the markdown diagnosis report from the structured diagnosis and treatment plan.
+
+    The diagnosis and treatment plan can also be the partial dicts parsed while
+    the LLM output is streamed, the attributes not generated yet are left out.
+    """
+    return get_report_template().render(
+        patient=_as_dict(clinical_record.patient_info),
+        reason_for_visit=clinical_record.reason_for_visit,
+        symptoms=[_as_dict(symptom) for symptom in clinical_record.classified_symptoms or []],
+        diagnosis=_as_dict(diagnosis),
+        treatment_plan=_as_dict(treatment_plan),
+    )
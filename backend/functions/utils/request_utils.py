@@ -1,4 +1,5 @@
-from typing import List
+import hashlib
+from typing import Any, List, Optional
 from firebase_functions import https_fn
 
 def get_query_params(req: https_fn.Request, params: List[str]) -> dict:
@@ -17,4 +18,47 @@ def get_query_params(req: https_fn.Request, params: List[str]) -> dict:
         value = req.args.get(param)
         extracted[param] = value
 
-    return extracted
\ No newline at end of file
+    return extracted
+
+def get_fields_param(req: https_fn.Request, param: str = "fields") -> Optional[List[str]]:
+    """
+    Parse a comma separated projection parameter (e.g. `?fields=status,diagnosis`).
+
+    Args:
+        req (https_fn.Request): The HTTP request object containing query parameters.
+        param (str): The name of the query parameter holding the projection.
+
+    Returns:
+        Optional[List[str]]: The list of requested fields, or None if no projection was requested.
+    """
+    value = req.args.get(param)
+    if not value:
+        return None
+
+    fields = [field.strip() for field in value.split(",") if field.strip()]
+    return fields or None
+
+
+def build_etag(*parts: Any) -> str:
+    """
+    Build a weak ETag from the given parts (e.g. session_id, updated_at, projection).
+
+    Returns:
+        str: A weak ETag value, quoted as required by RFC 9110.
+    """
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return f'W/"{digest}"'
+
+
+def etag_matches(req: https_fn.Request, etag: str) -> bool:
+    """
+    Check whether the `If-None-Match` header of the request matches the given ETag.
+    """
+    if_none_match = req.headers.get("If-None-Match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return etag in candidates
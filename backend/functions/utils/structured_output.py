@@ -0,0 +1,317 @@
+import json
+import os
+import re
+from typing import Any, Dict, Generic, Iterator, List, Optional, Type, TypeVar
+from langchain_core.exceptions import OutputParserException
+from langchain_core.language_models import LanguageModelInput
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.prompt_values import PromptValue
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_openai import ChatOpenAI
+from openai.lib._pydantic import to_strict_json_schema
+from pydantic import BaseModel, ValidationError, create_model
+from utils.instrumentation import record_output_repair
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Use the OpenAI structured outputs (strict JSON schema response format) instead of format instructions in the prompt
+STRUCTURED_OUTPUT_NATIVE = os.getenv("STRUCTURED_OUTPUT_NATIVE", "true").lower() == "true"
+# Calls re-asking for the missing or invalid fields of an output before the stage fails
+STRUCTURED_OUTPUT_MAX_REPAIRS = int(os.getenv("STRUCTURED_OUTPUT_MAX_REPAIRS", "2"))
+
+M = TypeVar("M", bound=BaseModel)
+
+NATIVE_FORMAT_INSTRUCTIONS = "Answer with a JSON object following the response schema."
+ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+STRING_CHUNK = re.compile(r'[^"\\]+')
+
+
+class IncrementalJsonParser:
+    """
+    Parse a JSON document while it is streamed, reading each chunk once.
+
+    `feed` returns the value parsed so far: objects and arrays hold the members
+    read so far and the string being read holds its partial text. The returned
+    containers are updated in place by the next chunks. Text before the first
+    `{` or `[` (e.g. a markdown code fence) and after the document is ignored.
+    """
+    def __init__(self) -> None:
+        self.value: Any = None
+        self.done = False
+        self._started = False
+        self._stack: List[Any] = []
+        self._keys: List[Optional[str]] = []
+        # text of the string, number or literal being read
+        self._token: Optional[List[str]] = None
+        self._token_kind: Optional[str] = None
+        self._escape: Optional[str] = None
+        # high surrogate of a \uXXXX escape, combined with the low surrogate escape following it
+        self._high_surrogate: Optional[int] = None
+        self._string_slot: Optional[tuple] = None
+
+    def feed(self, chunk: str) -> Any:
+        index = 0
+        while index < len(chunk) and not self.done:
+            index = self._read(chunk, index)
+        if self._token_kind == "string" and self._string_slot:
+            self._assign(self._string_slot, "".join(self._token))
+        return self.value
+
+    def _read(self, chunk: str, index: int) -> int:
+        char = chunk[index]
+        if self._token_kind in ("string", "key"):
+            return self._read_string(chunk, index)
+        if self._token_kind == "scalar":
+            if char not in ",]} \t\r\n":
+                self._token.append(char)
+                return index + 1
+            self._end_scalar()
+        if not self._started:
+            if char in "{[":
+                self._started = True
+            else:
+                return index + 1
+
+        if char in " \t\r\n:":
+            pass
+        elif char == "{" or char == "[":
+            container: Any = {} if char == "{" else []
+            self._add_value(container)
+            self._stack.append(container)
+            self._keys.append(None)
+        elif char == "}" or char == "]":
+            if self._stack:
+                self._stack.pop()
+                self._keys.pop()
+            self.done = not self._stack
+        elif char == ",":
+            self._keys[-1] = None
+        elif char == '"':
+            self._token = []
+            if isinstance(self._stack[-1], dict) and self._keys[-1] is None:
+                self._token_kind = "key"
+            else:
+                self._token_kind = "string"
+                self._string_slot = self._add_value("")
+        else:
+            self._token = [char]
+            self._token_kind = "scalar"
+        return index + 1
+
+    def _read_string(self, chunk: str, index: int) -> int:
+        if self._escape is not None:
+            self._escape += chunk[index]
+            if self._escape.startswith("u"):
+                if len(self._escape) == 5:
+                    self._add_code_point(int(self._escape[1:], 16))
+                    self._escape = None
+            else:
+                self._end_surrogate()
+                self._token.append(ESCAPES.get(self._escape, self._escape))
+                self._escape = None
+            return index + 1
+
+        match = STRING_CHUNK.match(chunk, index)
+        if match:
+            self._end_surrogate()
+            self._token.append(match.group())
+            return match.end()
+        if chunk[index] == "\\":
+            self._escape = ""
+            return index + 1
+
+        self._end_surrogate()
+        text = "".join(self._token)
+        if self._token_kind == "key":
+            self._keys[-1] = text
+        else:
+            self._assign(self._string_slot, text)
+            self._string_slot = None
+        self._token = None
+        self._token_kind = None
+        return index + 1
+
+    def _add_code_point(self, code: int) -> None:
+        """Add the character of a \\uXXXX escape, joining surrogate pairs like json.loads."""
+        if self._high_surrogate is not None and 0xDC00 <= code <= 0xDFFF:
+            self._token.append(chr(0x10000 + ((self._high_surrogate - 0xD800) << 10) + (code - 0xDC00)))
+            self._high_surrogate = None
+            return
+        self._end_surrogate()
+        if 0xD800 <= code <= 0xDBFF:
+            self._high_surrogate = code
+        else:
+            self._token.append(chr(code))
+
+    def _end_surrogate(self) -> None:
+        """Add a high surrogate that isn't followed by a low one, kept alone as json.loads does."""
+        if self._high_surrogate is not None:
+            self._token.append(chr(self._high_surrogate))
+            self._high_surrogate = None
+
+    def _end_scalar(self) -> None:
+        text = "".join(self._token)
+        self._token = None
+        self._token_kind = None
+        try:
+            self._add_value(json.loads(text))
+        except json.JSONDecodeError:
+            # left out, the field is reported as missing when the output is validated
+            logger.debug("invalid JSON value: %s", text)
+
+    def _add_value(self, value: Any) -> Optional[tuple]:
+        """Add a value to the open container and return its slot."""
+        if not self._stack:
+            self.value = value
+            return None
+        container = self._stack[-1]
+        if isinstance(container, list):
+            container.append(value)
+            return container, len(container) - 1
+        container[self._keys[-1]] = value
+        return container, self._keys[-1]
+
+    def _assign(self, slot: Optional[tuple], value: Any) -> None:
+        if slot is None:
+            self.value = value
+        else:
+            container, key = slot
+            container[key] = value
+
+    def close(self) -> Any:
+        """Finish the document, returning the value parsed, which may be incomplete."""
+        if self._token_kind == "scalar":
+            self._end_scalar()
+        return self.value
+
+
+def parse_json(text: str) -> Any:
+    parser = IncrementalJsonParser()
+    parser.feed(text)
+    return parser.close()
+
+
+def response_format(schema: Type[BaseModel]) -> dict:
+    """The OpenAI strict JSON schema response format of a model."""
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": schema.__name__, "schema": to_strict_json_schema(schema), "strict": True},
+    }
+
+
+class StructuredLLM(Runnable[LanguageModelInput, M], Generic[M]):
+    """
+    Generate an instance of `schema` with an LLM.
+
+    With native structured outputs the schema is sent as the response format,
+    otherwise `format_instructions` must be added to the prompt. When the output
+    is malformed or misses fields, the LLM is asked again for the broken fields
+    only, up to `max_repairs` times, before raising OutputParserException.
+    """
+    def __init__(
+        self,
+        llm: ChatOpenAI,
+        schema: Type[M],
+        native: bool = STRUCTURED_OUTPUT_NATIVE,
+        max_repairs: int = STRUCTURED_OUTPUT_MAX_REPAIRS,
+    ) -> None:
+        self.llm = llm
+        self.schema = schema
+        self.native = native
+        self.max_repairs = max_repairs
+        self.model = llm.bind(response_format=response_format(schema)) if native else llm
+
+    @property
+    def format_instructions(self) -> str:
+        if self.native:
+            return NATIVE_FORMAT_INSTRUCTIONS
+        return PydanticOutputParser(pydantic_object=self.schema).get_format_instructions()
+
+    def invoke(self, input: LanguageModelInput, config: Optional[RunnableConfig] = None, **kwargs: Any) -> M:
+        response = self.model.invoke(input, config, **kwargs)
+        return self._validate(_to_messages(input), response.content, parse_json(response.content), config)
+
+    def stream(self, input: LanguageModelInput, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the output parsed so far on each chunk. The last value yielded is
+        the complete output, validated and repaired when needed.
+        """
+        parser = IncrementalJsonParser()
+        text = ""
+        for chunk in self.model.stream(input, config, **kwargs):
+            if not chunk.content:
+                continue
+            text += chunk.content
+            value = parser.feed(chunk.content)
+            if isinstance(value, dict):
+                yield value
+        output = self._validate(_to_messages(input), text, parser.close(), config)
+        yield output.model_dump(mode="json")
+
+    def _validate(self, messages: List[BaseMessage], text: str, output: Any, config: Optional[RunnableConfig]) -> M:
+        for attempt in range(self.max_repairs + 1):
+            try:
+                return self.schema.model_validate(output)
+            except ValidationError as e:
+                error = e
+            if attempt == self.max_repairs:
+                break
+            broken_fields = self._broken_fields(output, error)
+            logger.warning("repairing fields %s of the %s output", broken_fields, self.schema.__name__)
+            record_output_repair()
+            try:
+                repaired = self._repair(messages, text, broken_fields, error, config)
+            except OutputParserException as repair_error:
+                # the repair answer is still invalid, ask again while repairs are left
+                logger.warning("invalid repair of the %s output: %s", self.schema.__name__, repair_error)
+                continue
+            output = {**(output if isinstance(output, dict) else {}), **repaired}
+        raise OutputParserException(f"invalid {self.schema.__name__} output: {error}", llm_output=text)
+
+    def _broken_fields(self, output: Any, error: ValidationError) -> List[str]:
+        if not isinstance(output, dict):
+            return list(self.schema.model_fields)
+        fields = []
+        for detail in error.errors():
+            field = detail["loc"][0] if detail["loc"] else None
+            if field not in self.schema.model_fields:
+                return list(self.schema.model_fields)
+            if field not in fields:
+                fields.append(field)
+        return fields
+
+    def _repair(
+        self,
+        messages: List[BaseMessage],
+        text: str,
+        broken_fields: List[str],
+        error: ValidationError,
+        config: Optional[RunnableConfig],
+    ) -> Dict[str, Any]:
+        """Ask only for the broken fields, keeping the conversation so the answer stays consistent."""
+        repair_schema = create_model(
+            f"{self.schema.__name__}Repair",
+            **{name: (self.schema.model_fields[name].annotation, self.schema.model_fields[name]) for name in broken_fields},
+        )
+        repair = StructuredLLM(self.llm, repair_schema, native=self.native, max_repairs=0)
+        errors = "\n".join(
+            f"- {'.'.join(str(part) for part in detail['loc'])}: {detail['msg']}" for detail in error.errors()
+        )
+        repair_messages = messages + [
+            AIMessage(content=text),
+            HumanMessage(content=(
+                f"The fields {', '.join(broken_fields)} of your answer are missing or invalid:\n{errors}\n"
+                f"Answer only with a JSON object with these fields. {repair.format_instructions}"
+            )),
+        ]
+        return repair.invoke(repair_messages, config).model_dump()
+
+
+def _to_messages(input: LanguageModelInput) -> List[BaseMessage]:
+    if isinstance(input, PromptValue):
+        return input.to_messages()
+    if isinstance(input, str):
+        return [HumanMessage(content=input)]
+    return list(input)
@@ -0,0 +1,73 @@
+import re
+from typing import List
+from utils.context_assembler import DEFAULT_ENCODING, get_encoding
+
+# A new turn starts with a speaker label, e.g. "Doctor:" or "Patient 2:"
+SPEAKER_TURN_PATTERN = re.compile(r"^\s*[A-Z][\w .'-]{0,30}:\s", re.MULTILINE)
+# Label of a known speaker, anywhere in the text: Whisper output and pasted transcriptions
+# are often a single paragraph, "... Doctor: How old are you? Patient: 45"
+TURN_PATTERN = re.compile(r"\b(doctor|dr|patient|physician|nurse)\s*:", re.IGNORECASE)
+SENTENCE_END_PATTERN = re.compile(r"(?<=[.!?])\s+")
+
+
+class TranscriptWindowSplitter:
+    """
+    Split a transcription into windows of whole speaker turns.
+
+    Consecutive windows share their boundary turns, so a question and its
+    answer are seen together in at least one window. Transcriptions without
+    speaker labels are split by sentences.
+    """
+    def __init__(self, window_tokens: int, overlap_turns: int = 2, encoding_name: str = DEFAULT_ENCODING) -> None:
+        self.window_tokens = window_tokens
+        self.overlap_turns = overlap_turns
+        self.encoding = get_encoding(encoding_name)
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def split(self, text: str) -> List[str]:
+        turns = self._split_turns(text)
+        windows: List[List[str]] = []
+        current: List[str] = []
+        current_tokens = 0
+        for turn, tokens in turns:
+            if current and current_tokens + tokens > self.window_tokens:
+                windows.append(current)
+                # start the next window with the last turns of the previous one, if they leave room
+                overlap = current[-self.overlap_turns:] if self.overlap_turns else []
+                overlap_tokens = sum(self.count_tokens(part) for part in overlap)
+                if overlap_tokens + tokens > self.window_tokens:
+                    overlap, overlap_tokens = [], 0
+                current, current_tokens = list(overlap), overlap_tokens
+            current.append(turn)
+            current_tokens += tokens
+        if current:
+            windows.append(current)
+        return ["\n".join(window) for window in windows]
+
+    def _split_turns(self, text: str) -> List[tuple]:
+        starts = sorted(
+            {match.start() for match in SPEAKER_TURN_PATTERN.finditer(text)}
+            | {match.start() for match in TURN_PATTERN.finditer(text)}
+        )
+        if starts:
+            # text before the first label is a turn of its own
+            boundaries = ([0] if starts[0] > 0 else []) + starts + [len(text)]
+            segments = [text[start:end].strip() for start, end in zip(boundaries, boundaries[1:])]
+        else:
+            segments = SENTENCE_END_PATTERN.split(text)
+
+        turns = []
+        for segment in filter(None, (segment.strip() for segment in segments)):
+            tokens = self.count_tokens(segment)
+            if tokens <= self.window_tokens:
+                turns.append((segment, tokens))
+                continue
+            # a turn longer than a window is split by sentences, then by tokens
+            for sentence in SENTENCE_END_PATTERN.split(segment):
+                encoded = self.encoding.encode(sentence, disallowed_special=())
+                for start in range(0, len(encoded), self.window_tokens):
+                    piece = self.encoding.decode(encoded[start:start + self.window_tokens])
+                    turns.append((piece, self.count_tokens(piece)))
+        return turns
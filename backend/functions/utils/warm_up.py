@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from firebase_admin import firestore
+from repositories.audio_storage_repository import get_audio_bucket
+from repositories.medical_knowledge_base_repository import (
+    VECTOR_BACKEND,
+    MedicalKnowledgeRepository,
+    get_lexical_index,
+    get_local_vector_index,
+)
+from repositories.symptom_lexicon import get_symptom_lexicon
+from services.symptom_severity_classifier import get_severity_classifier
+from utils.context_assembler import get_encoding
+from utils.http_clients import get_download_session, get_openai_client
+from utils.logger import get_logger
+from utils.report_renderer import get_report_template
+
+logger = get_logger(__name__)
+
+# Initialize the clients and caches used by the function of the instance when it starts, before its first request
+WARM_UP_ON_START = os.getenv("FUNCTIONS_WARM_UP", "true").lower() == "true"
+
+
+def _firestore_client() -> None:
+    firestore.client()
+
+
+def _http_clients() -> None:
+    get_openai_client()
+    get_download_session()
+
+
+def _audio_bucket() -> None:
+    get_audio_bucket()
+
+
+def _tokenizer() -> None:
+    get_encoding()
+
+
+def _symptom_lexicon() -> None:
+    get_symptom_lexicon()
+
+
+def _severity_classifier() -> None:
+    # loads the local model or embeds the severity references with OpenAI
+    get_severity_classifier()._anchor_vectors()
+
+
+def _knowledge_base() -> None:
+    MedicalKnowledgeRepository()
+    get_lexical_index()
+    if VECTOR_BACKEND == "local":
+        get_local_vector_index()
+
+
+def _report_template() -> None:
+    get_report_template()
+
+
+USER_FACING_TASKS = [_firestore_client]
+KNOWLEDGE_BASE_TASKS = [_knowledge_base]
+
+# Warm-up tasks of each function, by entry point name
+WARM_UP_TASKS: Dict[str, List[Callable[[], None]]] = {
+    "start_process": USER_FACING_TASKS,
+    "get_transcription": USER_FACING_TASKS,
+    "get_session": USER_FACING_TASKS,
+    "get_clinical_record": USER_FACING_TASKS,
+    "create_audio_upload": [_firestore_client, _audio_bucket],
+    "audio_upload_handler": [_firestore_client, _audio_bucket],
+    "transcription_handler": [_firestore_client, _http_clients, _audio_bucket],
+    "information_extractor_handler": [_firestore_client, _http_clients, _tokenizer, _symptom_lexicon, _severity_classifier],
+    "diagnosis_generation_handler": [_firestore_client, _http_clients, _tokenizer, _knowledge_base, _report_template],
+    "load_documents": KNOWLEDGE_BASE_TASKS,
+    "get_index_stats": KNOWLEDGE_BASE_TASKS,
+    "query_documents": KNOWLEDGE_BASE_TASKS,
+    "similarity_search": KNOWLEDGE_BASE_TASKS,
+}
+
+
+def current_function() -> Optional[str]:
+    """Entry point served by this instance, None when all the functions are served (emulator)."""
+    target = os.getenv("FUNCTION_TARGET") or os.getenv("K_SERVICE", "").replace("-", "_")
+    return target or None
+
+
+def warm_up(function_name: Optional[str] = None) -> Dict[str, float]:
+    """
+    Run the warm-up tasks of a function (of every function when it is None),
+    returning the seconds spent on each one. Failures are logged, the function
+    then initializes the client or cache on its first request.
+    """
+    if function_name:
+        tasks = WARM_UP_TASKS.get(function_name, [])
+    else:
+        tasks = list(dict.fromkeys(task for function_tasks in WARM_UP_TASKS.values() for task in function_tasks))
+
+    timings: Dict[str, float] = {}
+    for task in tasks:
+        started_at = time.perf_counter()
+        try:
+            task()
+        except Exception as e:
+            logger.warning("warm-up task %s failed: %s", task.__name__, e)
+        timings[task.__name__.lstrip("_")] = time.perf_counter() - started_at
+    logger.info("warmed up %s in %.2fs: %s", function_name or "all functions", sum(timings.values()), timings)
+    return timings
+
+
+def start_warm_up() -> Optional[threading.Thread]:
+    """
+    Warm up the function of this instance in a background thread, so the
+    instance start isn't delayed. Skipped when the functions are only loaded
+    to read their configuration at deploy time.
+    """
+    if not WARM_UP_ON_START or os.getenv("FUNCTIONS_CONTROL_API") == "true":
+        return None
+    thread = threading.Thread(target=warm_up, args=(current_function(),), name="warm-up", daemon=True)
+    thread.start()
+    return thread
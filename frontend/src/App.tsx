@@ -44,26 +44,17 @@ function App() {
     if (!sessionId) {
       return;
     }
-    const response = await medicalApi.getTranscription(sessionId);
+    const response = await medicalApi.getSession(sessionId);
     console.log(response);
-    
-    setStatus(response.status);
-    if (response.status === TranscriptionStatusMap.DIAGNOSIS_FINISHED) {
-      await getClinicalRecord();
+
+    setStatus(response.transcription.status);
+    // the report is streamed, show it as soon as the first chunk is available
+    if (response.clinical_record?.diagnosis_report) {
+      setClinicalRecord(response.clinical_record);
     }
     setIsLoading(false);
   };
 
-  
-  const getClinicalRecord = async () => {
-    if (!sessionId) {
-      return;
-    }
-    const response = await medicalApi.getClinicalRecord(sessionId);
-    console.log(response);
-    setClinicalRecord(response);
-  }
-
   return (
     <div className="min-h-screen bg-gray-50">
       <Toaster
@@ -1,5 +1,5 @@
 import MarkdownPreview from '@uiw/react-markdown-preview';
-import type { ClinicalRecord } from '../services/api';
+import { ReportStatusMap, type ClinicalRecord } from '../services/api';
 
 type DiagnosisProps = {
     sessionId?: string;
@@ -9,6 +9,7 @@ type DiagnosisProps = {
 }
 
 export function Diagnosis({ sessionId, clinicalRecord, isLoading, checkStatus }: DiagnosisProps) {
+  const isStreaming = clinicalRecord?.report_status === ReportStatusMap.STREAMING;
 
   return (
     <div className="text-center">
@@ -17,7 +18,7 @@ export function Diagnosis({ sessionId, clinicalRecord, isLoading, checkStatus }:
       </h2>)}
       <p className="text-sm text-gray-500 mb-4">Session ID: {sessionId}</p>
 
-      {!clinicalRecord && (
+      {(!clinicalRecord || isStreaming) && (
         <button className="bg-blue-500 text-white px-4 py-2 rounded-md cursor-pointer mb-10" onClick={checkStatus}>
           Check status
         </button>
@@ -64,6 +64,13 @@ export type ClassifiedSymptoms = {
   confidence_score: number;
 }
 
+export const ReportStatusMap = {
+  STREAMING: "streaming",
+  COMPLETED: "completed",
+} as const;
+
+export type ReportStatus = typeof ReportStatusMap[keyof typeof ReportStatusMap];
+
 export type ClinicalRecord = {
   summary?: string;
   patient_info?: PatientInfo;
@@ -73,11 +80,18 @@ export type ClinicalRecord = {
   session_id: string;
   classified_symptoms?: ClassifiedSymptoms[];
   diagnosis_report?: string;
+  report_status?: ReportStatus;
   diagnosis?: DiagnosisProbability[];
   created_at?: string;
   updated_at?: string;
 }
 
+export type Session = {
+  session_id: string;
+  transcription: Transcription;
+  clinical_record: ClinicalRecord | null;
+}
+
 export const medicalApi = {
   submitTranscription: async (data: { audioUrl?: string; transcriptionText?: string }): Promise<{ session_id: string }> => {
     const requestBody = data.audioUrl 
@@ -97,6 +111,15 @@ export const medicalApi = {
     const response = await api.get(`/get_clinical_record?session_id=${session_id}`);
     return response.data.data;
   },
+
+  getSession: async (session_id: string, fields?: string[]): Promise<Session> => {
+    const params = new URLSearchParams({ session_id });
+    if (fields?.length) {
+      params.set('fields', fields.join(','));
+    }
+    const response = await api.get(`/get_session?${params.toString()}`);
+    return response.data.data;
+  },
 };
 
 export default api;